@@ -0,0 +1 @@
+"""Performance benchmarks of the app, run with ``python -m benchmarks.pages``."""
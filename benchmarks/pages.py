@@ -0,0 +1,226 @@
+"""Headless benchmark of the pages, with regression thresholds.
+
+Every page script is run with Streamlit's ``AppTest`` against a local copy of
+the dataset, each in a fresh process with an empty cache directory (the
+snapshot and the model are built beforehand, as in a deployment). The pages
+run with ``COVID_DEBUG=1``: the sections of :mod:`core.instrument` record, for
+each section of the page:
+
+- ``seconds``: wall time (tracemalloc slows the run down, the numbers are
+  only comparable with each other);
+- ``peak_bytes``: peak of the memory allocated by Python during the section;
+- ``figure_bytes``: size of the plotly figures the section sent to the
+  browser (those drawn in the container of the section, not in the sidebar).
+
+For the whole page we also record the wall time of the run, the largest peak
+of its sections and the size of all its plotly figures.
+
+Each page runs twice: ``cold`` (empty caches, first visit) and ``warm`` (a
+rerun, as when a widget changes). The results are written as JSON and
+compared to a baseline recorded on the same machine; any metric above its
+tolerance is reported and the exit code is 1. Without a baseline (the first
+run on a machine, none is committed) the results are saved as the baseline
+and the run succeeds.
+
+    python -m benchmarks.pages [--dataset fixture.xlsx] [--pages home.py]
+    python -m benchmarks.pages --update-baseline       # after an expected change
+"""
+import argparse
+import concurrent.futures
+import datetime
+import glob
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List
+
+from core import config
+
+ROOT:str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES:List[str] = ["home.py"] + sorted(os.path.relpath(path, ROOT) for path in glob.glob(os.path.join(ROOT, "pages", "*.py")))
+BASELINE_PATH:str = os.path.join(ROOT, "benchmarks", "baseline.json")
+RUNS = ("cold", "warm")
+
+# a metric regresses when it exceeds the baseline by both margins (relative, absolute)
+TOLERANCES = {
+    "seconds": (.5, .25),
+    "peak_bytes": (.25, 8 << 20),
+    "figure_bytes": (.1, 16 << 10),
+}
+
+# imported before measuring: the interpreter startup isn't part of the pages
+PRELOADED = ("numpy", "pandas", "pyarrow", "scipy.stats", "sklearn.ensemble", "PIL.Image",
+             "plotly.express", "plotly.figure_factory", "plotly.graph_objects")
+
+
+# ------------------------ RECORDING ----------------------------------
+def _figure_bytes(node) -> int:
+    return sum(chart.proto.ByteSize() for chart in node.get("plotly_chart"))
+
+
+def _section_blocks(node, blocks:Dict) -> Dict:
+    """Containers of the sections under ``node``, by key, see :data:`core.instrument.SECTION_KEY_PREFIX`."""
+    from core.instrument import SECTION_KEY_PREFIX
+    for child in getattr(node, "children", {}).values():
+        # "$$ID-<hash>-<key>"
+        key = str(getattr(child.proto, "id", "")).split("-", 2)[-1]
+        if key.startswith(SECTION_KEY_PREFIX):
+            blocks[key] = child
+        _section_blocks(child, blocks)
+    return blocks
+
+
+def _sections(app) -> List[Dict]:
+    """Records of the sections of the last run of ``app``, see :mod:`core.instrument`."""
+    from core.instrument import SECTION_KEY_PREFIX, STATE_KEY
+    blocks = _section_blocks(app.main, {})
+    sections, names = [], []
+    for i, record in enumerate(app.session_state[STATE_KEY]["sections"]):
+        name = record["section"]
+        names.append(name)
+        if names.count(name) > 1:
+            name = f"{name} ({names.count(name)})"
+        block = blocks.get(f"{SECTION_KEY_PREFIX}{i}")
+        sections.append({"section": name, "seconds": record["seconds"], "peak_bytes": record["peak_bytes"],
+                         "figure_bytes": 0 if block is None else _figure_bytes(block)})
+    return sections
+
+
+def _prepare() -> None:
+    """Snapshot and model shared by the runs, built outside of the measures."""
+    sys.path.insert(0, ROOT)
+    from core.model import load_model, save_model, train
+    from core.snapshot import ensure_snapshot
+    ensure_snapshot()
+    if not os.path.exists(config.MODEL_PATH):
+        save_model(train())
+    load_model()
+
+
+def _run_page(page:str, timeout:float) -> Dict:
+    sys.path.insert(0, ROOT)
+    from streamlit.testing.v1 import AppTest
+    for module in PRELOADED:
+        importlib.import_module(module)
+    app = AppTest.from_file(os.path.join(ROOT, page), default_timeout=timeout)
+    results = {}
+    for run in RUNS:
+        start = time.perf_counter()
+        app.run()
+        seconds = time.perf_counter() - start
+        if app.exception:
+            raise RuntimeError(f"{page} ({run}): {app.exception[0].value}")
+        sections = _sections(app)
+        results[run] = {"seconds": seconds,
+                        "peak_bytes": max([section["peak_bytes"] for section in sections], default=0),
+                        "figure_bytes": _figure_bytes(app),
+                        "sections": sections}
+    return results
+
+
+def _in_process(function, *args):
+    """Call ``function`` in a new interpreter, so that no cache survives from a previous page."""
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(function, *args).result()
+
+
+def run_benchmark(dataset:str, pages:List[str], model:str = None, timeout:float = 600.) -> Dict:
+    with tempfile.TemporaryDirectory(prefix="covid-benchmark-") as work:
+        fixture = os.path.join(work, "dataset" + os.path.splitext(dataset.split("?")[0])[1])
+        if dataset.startswith(("http://", "https://")):
+            urllib.request.urlretrieve(dataset, fixture)
+        else:
+            shutil.copy2(dataset, fixture)
+        prepared = os.path.join(work, "prepared")
+        os.environ.update(COVID_DATASET_PATH=fixture, COVID_CACHE_DIR=prepared,
+                          COVID_MODEL_PATH=model or os.path.join(work, "model.joblib"), COVID_DEBUG="1")
+        _in_process(_prepare)
+        results = {}
+        for i, page in enumerate(pages):
+            cache = os.environ["COVID_CACHE_DIR"] = os.path.join(work, f"page-{i}")
+            os.makedirs(cache)
+            for path in glob.glob(os.path.join(prepared, "*.arrow")):
+                shutil.copy2(path, cache)
+            results[page] = _in_process(_run_page, page, timeout)
+        with open(fixture, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    import streamlit
+    return {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0], "streamlit": streamlit.__version__,
+            "dataset_sha256": digest, "pages": results}
+
+
+# ------------------------ BASELINE ----------------------------------
+def _exceeds(metric:str, value:float, baseline:float) -> bool:
+    relative, absolute = TOLERANCES[metric]
+    return value > baseline * (1 + relative) and value - baseline > absolute
+
+
+def compare(results:Dict, baseline:Dict) -> List[str]:
+    """Regressions of ``results`` against ``baseline``, pages and sections missing from the baseline are skipped."""
+    regressions = []
+    for page, runs in results["pages"].items():
+        for run, result in runs.items():
+            reference = baseline["pages"].get(page, {}).get(run)
+            if reference is None:
+                continue
+            sections = {section["section"]: section for section in reference["sections"]}
+            for name, measured, expected in [("(page)", result, reference)] + [
+                    (section["section"], section, sections[section["section"]])
+                    for section in result["sections"] if section["section"] in sections]:
+                for metric in TOLERANCES:
+                    if metric in measured and metric in expected and _exceeds(metric, measured[metric], expected[metric]):
+                        regressions.append(f"{page} [{run}] {name}: {metric} {measured[metric]:,.2f} "
+                                           f"> baseline {expected[metric]:,.2f}")
+    return regressions
+
+
+def _report(results:Dict) -> None:
+    for page, runs in results["pages"].items():
+        for run, result in runs.items():
+            print(f"{page:<40} {run:<5} {result['seconds']:8.2f}s {result['peak_bytes'] / 2 ** 20:9.1f} MB "
+                  f"{result['figure_bytes'] / 2 ** 10:9.1f} KB of figures")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the pages headlessly and compare with the baseline.")
+    parser.add_argument("--dataset", default=config.DATASET_PATH, help="dataset copied as fixture (path or URL)")
+    parser.add_argument("--model", default=None, help="model artifact of the Diagnostic page (trained if missing)")
+    parser.add_argument("--pages", nargs="+", default=PAGES, help="page scripts, relative to the repo")
+    parser.add_argument("--output", default=os.path.join(config.CACHE_DIR, "benchmarks", "results.json"))
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--timeout", type=float, default=600., help="seconds allowed per page run")
+    args = parser.parse_args()
+    results = run_benchmark(args.dataset, args.pages, args.model, args.timeout)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    _report(results)
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+        print(f"baseline saved to {args.baseline}" if args.update_baseline else
+              f"no baseline: the results are recorded as the baseline, saved to {args.baseline}")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("dataset_sha256") != results["dataset_sha256"]:
+        print("warning: the baseline was recorded on another dataset")
+    regressions = compare(results, baseline)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print("no regression")
+
+
+if __name__ == "__main__":
+    main()
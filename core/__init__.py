@@ -0,0 +1,6 @@
+"""Shared building blocks of the Diagnosis of COVID-19 streamlit app.
+
+The pages under ``pages/`` and ``home.py`` only deal with the layout; loading
+the dataset and everything derived from it lives in this package so that it is
+computed once per process and shared by every session.
+"""
@@ -0,0 +1,137 @@
+"""Derived artifacts of the pages, declared as a :class:`~core.pipeline.Pipeline`.
+
+Every page used to rebuild the chain ``df`` -> ``cleaned_df`` ->
+``positive``/``negative`` -> ``categories`` -> ``viral_rate_columns``/
+``blood_tests_columns`` on its own, with thresholds drifting from one page to
+the other. The chain is declared once here, the thresholds are parameters of
+the nodes (defaults from :mod:`core.config`) and each node is recomputed only
+when the dataset or one of the thresholds it depends on changes.
+
+    df, cleaned_df, positive = ARTIFACTS.resolve(["dataset", "cleaned_df", "positive"])
+    ARTIFACTS.get("blood_tests_columns", blood_nan_range=(.86, .9))
+"""
+from typing import Dict, List
+
+import pandas as pd
+
+from core import config
+from core.contingency import load_target_tables
+from core.data import dataset_version, load_dataset, split_by_target
+from core.pipeline import Pipeline
+from core.profile import (GROUP_BLOOD, GROUP_VIRAL, DatasetProfile, categorical_dtypes, cleaned_subset, column_groups,
+                          nan_rate_filter, numeric_dtypes)
+from core.stats_store import StatsStore, load_stats_store
+
+ARTIFACTS = Pipeline({
+    "nan_rate_cutoff": config.NAN_RATE_CUTOFF,
+    "viral_nan_range": config.VIRAL_NAN_RANGE,
+    "blood_nan_range": config.BLOOD_NAN_RANGE,
+})
+
+
+@ARTIFACTS.source(version=dataset_version)
+def dataset() -> pd.DataFrame:
+    return load_dataset()
+
+
+@ARTIFACTS.source(version=dataset_version)
+def version() -> str:
+    """Version of the dataset, for the aggregates that don't need the frame (see core.data.dataset_chunks)."""
+    return dataset_version()
+
+
+@ARTIFACTS.node(deps=("version",))
+def stats_store(version:str) -> StatsStore:
+    return load_stats_store()
+
+
+@ARTIFACTS.node(deps=("stats_store",))
+def profile(stats_store:StatsStore) -> DatasetProfile:
+    return DatasetProfile.from_stats(stats_store)
+
+
+@ARTIFACTS.node(deps=("profile",))
+def nan_rates(profile:DatasetProfile) -> pd.Series:
+    return profile.nan_rates
+
+
+@ARTIFACTS.node(deps=("profile",))
+def dtypes(profile:DatasetProfile) -> pd.Series:
+    return profile.table["dtype"]
+
+
+# ------------------------ CLEANED DATASET ----------------------------------
+@ARTIFACTS.node(deps=("nan_rates",), params=("nan_rate_cutoff",))
+def cleaned_columns(nan_rates:pd.Series, nan_rate_cutoff:float) -> List[str]:
+    """Columns of ``cleaned_df``, ``Patient ID`` included."""
+    return nan_rate_filter(nan_rates, nan_rate_cutoff)
+
+
+@ARTIFACTS.node(deps=("dataset", "cleaned_columns"))
+def cleaned_df(dataset:pd.DataFrame, cleaned_columns:List[str]) -> pd.DataFrame:
+    return dataset[cleaned_columns].drop(config.PATIENT_ID, axis=1)
+
+
+@ARTIFACTS.node(deps=("cleaned_df",))
+def classes(cleaned_df:pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    return split_by_target(cleaned_df)
+
+
+@ARTIFACTS.node(deps=("classes",))
+def positive(classes:Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    return classes["positive"]
+
+
+@ARTIFACTS.node(deps=("classes",))
+def negative(classes:Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    return classes["negative"]
+
+
+# ------------------------ NaN RATE TABLES ----------------------------------
+@ARTIFACTS.node(deps=("nan_rates",))
+def categories(nan_rates:pd.Series) -> pd.DataFrame:
+    """NaN rate of every column, sorted ascending."""
+    return nan_rates.to_frame("NaN_rate").sort_values("NaN_rate")
+
+
+@ARTIFACTS.node(deps=("categories",), params=("viral_nan_range",))
+def viral_rate(categories:pd.DataFrame, viral_nan_range) -> pd.DataFrame:
+    return categories[categories["NaN_rate"].between(*viral_nan_range, inclusive="neither")]
+
+
+@ARTIFACTS.node(deps=("categories",), params=("blood_nan_range",))
+def blood_tests(categories:pd.DataFrame, blood_nan_range) -> pd.DataFrame:
+    return categories[categories["NaN_rate"].between(*blood_nan_range, inclusive="neither")]
+
+
+# ------------------------ COLUMN LISTS ----------------------------------
+@ARTIFACTS.node(deps=("nan_rates",), params=("viral_nan_range", "blood_nan_range"))
+def groups(nan_rates:pd.Series, viral_nan_range, blood_nan_range) -> pd.Series:
+    return column_groups(nan_rates, viral_nan_range, blood_nan_range)
+
+
+@ARTIFACTS.node(deps=("cleaned_columns", "groups"))
+def viral_rate_columns(cleaned_columns:List[str], groups:pd.Series) -> List[str]:
+    return cleaned_subset(cleaned_columns, groups == GROUP_VIRAL)
+
+
+@ARTIFACTS.node(deps=("cleaned_columns", "groups"))
+def blood_tests_columns(cleaned_columns:List[str], groups:pd.Series) -> List[str]:
+    return cleaned_subset(cleaned_columns, groups == GROUP_BLOOD)
+
+
+@ARTIFACTS.node(deps=("cleaned_columns", "dtypes"))
+def numeric_columns(cleaned_columns:List[str], dtypes:pd.Series) -> List[str]:
+    """Float columns of ``cleaned_df`` (the standardized lab values)."""
+    return cleaned_subset(cleaned_columns, numeric_dtypes(dtypes))
+
+
+@ARTIFACTS.node(deps=("cleaned_columns", "dtypes"))
+def categorical_columns(cleaned_columns:List[str], dtypes:pd.Series) -> List[str]:
+    """Non numeric columns of ``cleaned_df``, the target included."""
+    return cleaned_subset(cleaned_columns, categorical_dtypes(dtypes))
+
+
+@ARTIFACTS.node(deps=("version", "viral_rate_columns"))
+def target_tables(version:str, viral_rate_columns:List[str]) -> Dict[str, pd.DataFrame]:
+    return load_target_tables(viral_rate_columns)
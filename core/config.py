@@ -0,0 +1,66 @@
+"""Configuration of the app, overridable through environment variables."""
+import os
+
+import pandas as pd
+
+# ------------------------ DATASET ----------------------------------
+DATASET_URL:str = "https://github.com/frimpong-adotri-01/datasets/blob/main/dataset.xlsx?raw=true"
+# local path (or URL) of the dataset, set COVID_DATASET_PATH to work offline
+DATASET_PATH:str = os.environ.get("COVID_DATASET_PATH", DATASET_URL)
+# a dataset downloaded from a URL is checked for changes at most this often
+SOURCE_TTL_SECONDS:int = int(os.environ.get("COVID_SOURCE_TTL", 3600))
+
+TARGET:str = "SARS-Cov-2 exam result"
+PATIENT_ID:str = "Patient ID"
+ADMISSION_COLUMNS = ("Patient addmited to regular ward (1=yes, 0=no)",
+                     "Patient addmited to semi-intensive unit (1=yes, 0=no)",
+                     "Patient addmited to intensive care unit (1=yes, 0=no)")
+
+# ------------------------ COLUMN SELECTION ----------------------------------
+# columns with more NaN than this rate are dropped from cleaned_df
+NAN_RATE_CUTOFF:float = .9
+# NaN rate ranges (low, high), bounds excluded, of the viral panel and of the
+# blood tests: the single definition of each group, used for the column lists
+# and the tables of the pages alike
+VIRAL_NAN_RANGE = (.75, .88)
+BLOOD_NAN_RANGE = (.87, .9)
+
+# shows the timing of the sections of the pages in the sidebar (server side only, not from the URL)
+DEBUG:bool = os.environ.get("COVID_DEBUG", "") not in ("", "0")
+
+# directory of the derived files (dataset snapshot, caches...)
+CACHE_DIR:str = os.environ.get("COVID_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache"))
+# size above which the least recently used figures of the figure cache are evicted
+FIGURE_CACHE_MAX_BYTES:int = int(os.environ.get("COVID_FIGURE_CACHE_MB", 256)) * 1024 * 1024
+
+# ------------------------ PANDAS ----------------------------------
+# Process-wide requirement: the dataset frame is shared by every session and
+# core.data hands out column selections and class slices of it (cleaned_df,
+# positive, negative...) as views. Copy-on-write is what keeps a modification
+# of one of them from reaching the shared frame, so it is switched on for the
+# whole process as soon as the configuration is imported, before any frame is
+# built. Code running in the same process (tests, notebooks...) gets it too.
+pd.set_option("mode.copy_on_write", True)
+
+# ------------------------ OUT-OF-CORE ----------------------------------
+# build the aggregates (statistics, contingency tables, Pearson correlations,
+# distributions) chunk by chunk from the columnar store instead of from the
+# frame held in memory; Spearman correlations are computed on a sample. Only
+# the aggregates: the row-level views (explorer, missingness map, scatter
+# plots, class slices) still load the whole dataset, and so does appending
+# batches, which concatenates them with the snapshot in memory
+OUT_OF_CORE:bool = os.environ.get("COVID_OUT_OF_CORE", "") not in ("", "0")
+# rows per chunk of the aggregates, in both modes
+CHUNK_ROWS:int = int(os.environ.get("COVID_CHUNK_ROWS", 1 << 16))
+
+# ------------------------ FIGURES ----------------------------------
+# above this number of points, scatter plots are decimated on the server
+SCATTER_MAX_POINTS:int = int(os.environ.get("COVID_SCATTER_MAX_POINTS", 20000))
+
+# ------------------------ STATISTICAL TESTS ----------------------------------
+# processes of the resampled t-tests: bounded, so that the sessions clicking at
+# the same time don't each start a pool as large as the machine
+RESAMPLING_JOBS:int = int(os.environ.get("COVID_RESAMPLING_JOBS", min(4, os.cpu_count() or 1)))
+
+# ------------------------ MODEL ----------------------------------
+MODEL_PATH:str = os.environ.get("COVID_MODEL_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "covid_diagnosis.joblib"))
@@ -0,0 +1,296 @@
+"""Contingency tables of the categorical columns.
+
+``pd.crosstab`` followed by ``chi2_contingency`` used to run once per column
+for the tests and once more per column for the heatmaps. The categorical
+columns are integer-encoded once here, every target x column table is built
+by a single ``bincount`` and the chi-square tests (Fisher's exact test for
+sparse 2x2 tables) run in batch on those same tables. Counts only add up, so
+the tables are built chunk by chunk (see :func:`core.data.dataset_chunks`) and
+the tables of a new batch of patients are merged into the persisted ones.
+"""
+import functools
+import glob
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from core import config
+from core.data import dataset_chunks, dataset_version
+
+# below this expected count, a 2x2 table is tested with Fisher's exact test
+FISHER_MIN_EXPECTED:float = 5.
+
+
+class EncodedCategoricals:
+    """Integer codes of categorical columns, ``-1`` for NaN, levels sorted as ``pd.crosstab``."""
+
+    def __init__(self, codes:np.ndarray, levels:List[pd.Index], columns:List[str]):
+        self.codes = codes
+        self.levels = levels
+        self.columns = list(columns)
+
+    @classmethod
+    def from_frame(cls, df:pd.DataFrame, columns:List[str]) -> "EncodedCategoricals":
+        codes = np.empty((df.shape[0], len(columns)), dtype=np.int32)
+        levels = []
+        for j, column in enumerate(columns):
+            codes[:, j], uniques = pd.factorize(df[column], sort=True)
+            levels.append(pd.Index(np.asarray(uniques), name=column))
+        return cls(codes, levels, columns)
+
+    @property
+    def cardinalities(self) -> np.ndarray:
+        return np.array([len(level) for level in self.levels], dtype=np.int64)
+
+
+def contingency_tables(target:EncodedCategoricals, encoded:EncodedCategoricals) -> Dict[str, pd.DataFrame]:
+    """Tables ``target`` x column for every column of ``encoded``, in one bincount.
+
+    ``target`` holds a single column. Rows where either value is NaN are
+    ignored and levels never seen together are dropped, as with ``pd.crosstab``.
+    """
+    target_codes = target.codes[:, 0]
+    n_target = len(target.levels[0])
+    cardinalities = encoded.cardinalities
+    sizes = n_target * cardinalities
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    cells = offsets + target_codes[:, None] * cardinalities + encoded.codes
+    valid = (target_codes[:, None] >= 0) & (encoded.codes >= 0)
+    counts = np.bincount(cells[valid], minlength=int(sizes.sum()))
+    tables = {}
+    for j, column in enumerate(encoded.columns):
+        table = pd.DataFrame(counts[offsets[j]:offsets[j] + sizes[j]].reshape(n_target, cardinalities[j]),
+                             index=target.levels[0], columns=encoded.levels[j])
+        tables[column] = table.loc[table.sum(axis=1) > 0, table.sum(axis=0) > 0]
+    return tables
+
+
+def _chi2_batch(observed:np.ndarray):
+    """Chi-square tests of tables of the same shape stacked as (tables, rows, columns).
+
+    Same as ``chi2_contingency``, Yates' correction included for 1 degree of freedom.
+    """
+    total = observed.sum(axis=(1, 2), keepdims=True)
+    expected = observed.sum(axis=2, keepdims=True) * observed.sum(axis=1, keepdims=True) / total
+    dof = (observed.shape[1] - 1) * (observed.shape[2] - 1)
+    if dof == 1:
+        difference = expected - observed
+        observed = observed + np.sign(difference) * np.minimum(.5, np.abs(difference))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistic = ((observed - expected) ** 2 / expected).sum(axis=(1, 2))
+    return statistic, np.full(statistic.shape, dof), stats.chi2.sf(statistic, dof), expected.min(axis=(1, 2))
+
+
+def independence_tests(tables:Dict[str, pd.DataFrame], alpha:float = .01) -> pd.DataFrame:
+    """Chi-square independence test of every table, Fisher's exact test for sparse 2x2 tables."""
+    results = pd.DataFrame(index=pd.Index(list(tables), name="variable"),
+                           columns=["test", "statistic", "dof", "p_value", "min_expected"], dtype=object)
+    by_shape = {}
+    for column, table in tables.items():
+        by_shape.setdefault(table.shape, []).append(column)
+    for shape, columns in by_shape.items():
+        if min(shape) < 2:  # a single class: nothing to test
+            results.loc[columns, "test"] = "none"
+            continue
+        observed = np.stack([tables[column].to_numpy(dtype="float64") for column in columns])
+        statistic, dof, p_value, min_expected = _chi2_batch(observed)
+        results.loc[columns, "test"] = "chi2"
+        results.loc[columns, "statistic"] = statistic
+        results.loc[columns, "dof"] = dof
+        results.loc[columns, "p_value"] = p_value
+        results.loc[columns, "min_expected"] = min_expected
+        if shape == (2, 2):
+            for column, expected in zip(columns, min_expected):
+                if expected < FISHER_MIN_EXPECTED:
+                    odds_ratio, p_value = stats.fisher_exact(tables[column].to_numpy())
+                    results.loc[column, ["test", "statistic", "dof", "p_value"]] = ["fisher", odds_ratio, np.nan, p_value]
+    results["p_value"] = results["p_value"].astype("float64")
+    results["decision"] = np.where(results["p_value"] < alpha, "reject H0", "fail to reject H0")
+    return results
+
+
+def merge_tables(tables:Dict[str, pd.DataFrame], other:Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    """Sum of the counts of two sets of tables, levels aligned and sorted as ``pd.crosstab``."""
+    merged = dict(tables)
+    for column, table in other.items():
+        if column in merged:
+            table = merged[column].add(table, fill_value=0).fillna(0).astype(np.int64).sort_index(axis=0).sort_index(axis=1)
+        merged[column] = table
+    return merged
+
+
+def target_tables(df:pd.DataFrame, columns:List[str]) -> Dict[str, pd.DataFrame]:
+    target = EncodedCategoricals.from_frame(df, [config.TARGET])
+    return contingency_tables(target, EncodedCategoricals.from_frame(df, list(columns)))
+
+
+# ------------------------ PERSISTED ARTIFACTS ----------------------------------
+# The tables and cubes are pickled under ``CACHE_DIR/contingency/<version>`` so
+# that core.ingest can carry them to the next version by adding the counts of
+# the new batch instead of rebuilding them from the whole dataset. The folders
+# of the other versions are dropped whenever an artifact is written.
+TARGET_TABLES:str = "target_tables"
+CROSSTAB_CUBE:str = "crosstab_cube"
+
+
+def artifact_dir(version:str) -> str:
+    return os.path.join(config.CACHE_DIR, "contingency", version)
+
+
+def drop_other_versions(version:str) -> None:
+    """Remove the artifacts of every dataset version but ``version``."""
+    root = os.path.join(config.CACHE_DIR, "contingency")
+    for entry in os.listdir(root) if os.path.isdir(root) else []:
+        if entry != version:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+def artifact_path(version:str, kind:str, columns:tuple) -> str:
+    digest = hashlib.sha256("\x1f".join(columns).encode()).hexdigest()[:16]
+    return os.path.join(artifact_dir(version), f"{kind}-{digest}.pkl")
+
+
+def save_artifact(path:str, columns:tuple, artifact) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump((columns, artifact), f)
+    os.replace(tmp, path)
+
+
+def read_artifact(path:str):
+    """``(columns, artifact)`` pickled by :func:`save_artifact`."""
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def artifact_paths(version:str, kind:str) -> List[str]:
+    return sorted(glob.glob(os.path.join(artifact_dir(version), f"{kind}-*.pkl")))
+
+
+def _load_or_build(version:str, kind:str, columns:tuple, build:Callable):
+    path = artifact_path(version, kind, columns)
+    if os.path.exists(path):
+        return read_artifact(path)[1]
+    artifact = build()
+    save_artifact(path, columns, artifact)
+    drop_other_versions(version)
+    return artifact
+
+
+def chunked_target_tables(columns:List[str]) -> Dict[str, pd.DataFrame]:
+    """Same tables as :func:`target_tables` on the whole dataset, folded chunk by chunk."""
+    tables = {}
+    for chunk in dataset_chunks([config.TARGET, *columns]):
+        tables = merge_tables(tables, target_tables(chunk, list(columns)))
+    return tables
+
+
+@functools.lru_cache(maxsize=4)
+def _target_tables(version:str, columns:tuple) -> Dict[str, pd.DataFrame]:
+    return _load_or_build(version, TARGET_TABLES, columns, lambda: chunked_target_tables(list(columns)))
+
+
+def load_target_tables(columns:List[str]) -> Dict[str, pd.DataFrame]:
+    """Target x column tables of the current dataset, computed once per dataset version."""
+    return _target_tables(dataset_version(), tuple(columns))
+
+
+# ------------------------ PAIRWISE CUBE ----------------------------------
+# rows one-hot encoded at once when building the cube
+_CUBE_CHUNK_ROWS:int = 1 << 17
+
+
+class CrosstabCube:
+    """Co-occurrence counts of every pair of categorical columns.
+
+    ``counts[i, j, a, b]`` is the number of patients with level ``a`` of column
+    ``i`` and level ``b`` of column ``j``, levels being padded to the largest
+    cardinality. Any crosstab is then a slice of the cube.
+    """
+
+    def __init__(self, counts:np.ndarray, encoded:EncodedCategoricals):
+        self.counts = counts
+        # only the levels are kept, the codes of the rows aren't needed once counted
+        self.encoded = EncodedCategoricals(np.empty((0, len(encoded.columns)), dtype=np.int32), encoded.levels, encoded.columns)
+        self._position = {column: i for i, column in enumerate(encoded.columns)}
+
+    @classmethod
+    def from_encoded(cls, encoded:EncodedCategoricals) -> "CrosstabCube":
+        n_columns, width = len(encoded.columns), max(int(encoded.cardinalities.max(initial=1)), 1)
+        counts = np.zeros((n_columns * width, n_columns * width), dtype=np.int64)
+        # one-hot matrix of (column, level) indicators: the cube is its Gram matrix
+        for start in range(0, encoded.codes.shape[0], _CUBE_CHUNK_ROWS):
+            codes = encoded.codes[start:start + _CUBE_CHUNK_ROWS]
+            one_hot = np.zeros((codes.shape[0], n_columns, width), dtype=np.float64)
+            rows, columns = np.nonzero(codes >= 0)
+            one_hot[rows, columns, codes[rows, columns]] = 1.
+            one_hot = one_hot.reshape(codes.shape[0], -1)
+            counts += np.rint(one_hot.T @ one_hot).astype(np.int64)
+        counts = counts.reshape(n_columns, width, n_columns, width).transpose(0, 2, 1, 3)
+        return cls(np.ascontiguousarray(counts), encoded)
+
+    def merge(self, other:"CrosstabCube") -> "CrosstabCube":
+        """Cube of the patients of both cubes (same columns), levels united and sorted."""
+        levels = [self_levels.union(other_levels).rename(self_levels.name)
+                  for self_levels, other_levels in zip(self.encoded.levels, other.encoded.levels)]
+        width = max(max((len(level) for level in levels), default=1), 1)
+        n_columns = len(levels)
+        counts = np.zeros((n_columns, n_columns, width, width), dtype=np.int64)
+        for cube in (self, other):
+            # position of each level of the cube among the united levels
+            positions = [union.get_indexer(level) for union, level in zip(levels, cube.encoded.levels)]
+            for i in range(n_columns):
+                for j in range(n_columns):
+                    a, b = positions[i], positions[j]
+                    counts[i, j][np.ix_(a, b)] += cube.counts[i, j, :len(a), :len(b)]
+        return CrosstabCube(counts, EncodedCategoricals(np.empty((0, n_columns), dtype=np.int32), levels, self.encoded.columns))
+
+    def table(self, x:str, y:str) -> pd.DataFrame:
+        """Same table as ``pd.crosstab(df[x], df[y])``, without touching the data."""
+        i, j = self._position[x], self._position[y]
+        levels_x, levels_y = self.encoded.levels[i], self.encoded.levels[j]
+        table = pd.DataFrame(self.counts[i, j, :len(levels_x), :len(levels_y)], index=levels_x, columns=levels_y)
+        return table.loc[table.sum(axis=1) > 0, table.sum(axis=0) > 0]
+
+    def cramers_v(self) -> pd.DataFrame:
+        """Cramér's V of every pair of distinct columns, strongest associations first."""
+        counts = self.counts.astype(np.float64)
+        total = counts.sum(axis=(2, 3))
+        rows, columns = counts.sum(axis=3), counts.sum(axis=2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected = rows[:, :, :, None] * columns[:, :, None, :] / total[:, :, None, None]
+            chi2 = np.where(expected > 0, (counts - expected) ** 2 / expected, 0.).sum(axis=(2, 3))
+            dimension = np.minimum((rows > 0).sum(axis=2), (columns > 0).sum(axis=2)) - 1
+            v = np.sqrt(chi2 / (total * dimension))
+        i, j = np.triu_indices(len(self.encoded.columns), k=1)
+        pairs = pd.DataFrame({"x": np.array(self.encoded.columns, dtype=object)[i],
+                              "y": np.array(self.encoded.columns, dtype=object)[j],
+                              "cramers_v": v[i, j], "n": total[i, j].astype(np.int64)})
+        return pairs.dropna(subset=["cramers_v"]).sort_values("cramers_v", ascending=False, ignore_index=True)
+
+
+def chunked_crosstab_cube(columns:List[str]) -> CrosstabCube:
+    """Pairwise cube of ``columns`` over the whole dataset, folded chunk by chunk."""
+    cube = None
+    for chunk in dataset_chunks(list(columns)):
+        chunk_cube = CrosstabCube.from_encoded(EncodedCategoricals.from_frame(chunk, list(columns)))
+        cube = chunk_cube if cube is None else cube.merge(chunk_cube)
+    return cube
+
+
+@functools.lru_cache(maxsize=2)
+def _crosstab_cube(version:str, columns:tuple) -> CrosstabCube:
+    return _load_or_build(version, CROSSTAB_CUBE, columns, lambda: chunked_crosstab_cube(list(columns)))
+
+
+def load_crosstab_cube(columns:List[str]) -> CrosstabCube:
+    """Pairwise cube of ``columns`` for the current dataset, computed once per dataset version."""
+    return _crosstab_cube(dataset_version(), tuple(columns))
@@ -0,0 +1,244 @@
+"""Pairwise complete correlations of the numeric columns.
+
+``Analyse_de_fond`` called ``cleaned_df[blood_tests_columns].corr()`` on every
+rerun and showed the matrix in the order of the columns. Here the matrices are
+computed once per dataset version, with the number of patients behind each
+pair, and ordered by hierarchical clustering so that correlated tests sit
+together:
+
+- Pearson: the co-moments of every pair of columns (count, means, sums of
+  squared deviations and of cross products over the rows where both are
+  present) are mergeable. They are computed per chunk with masked matrix
+  products and merged with the pairwise update of Chan et al., so the matrix of
+  a dataset larger than memory is folded chunk by chunk (see
+  :func:`core.data.dataset_chunks`).
+- Spearman: ranks aren't mergeable, the columns are read whole. Columns missing
+  on the same rows share their pairwise complete rows: the columns are grouped
+  by missingness pattern and each pair of groups is ranked once, as a block.
+  With the blocks of missing values of the dataset (a panel is done or not)
+  there are only a few groups. In the out-of-core mode the dataset may not fit
+  in memory: the ranks are those of a uniform sample of at most
+  ``SPEARMAN_MAX_ROWS`` patients, drawn chunk by chunk.
+
+Both match ``df.corr(method)`` up to rounding (Spearman out-of-core: on the
+sample) and scale to hundreds of columns.
+
+    correlation = load_correlation(blood_tests_columns, "spearman")
+    correlation.r                  # matrix, in cluster order
+    correlation.top_pairs(5)       # strongest pairs, with their number of patients
+"""
+import functools
+from typing import Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import leaves_list, linkage
+from scipy.spatial.distance import squareform
+from scipy.stats import rankdata
+
+from core import config
+from core.data import dataset_chunks, dataset_version, frame_chunks
+
+PEARSON:str = "pearson"
+SPEARMAN:str = "spearman"
+METHODS = (PEARSON, SPEARMAN)
+# pairs observed together on fewer patients aren't listed among the strongest ones
+TOP_PAIRS_MIN_PERIODS:int = 30
+# out-of-core, Spearman correlations are computed on a sample of at most this many patients
+SPEARMAN_MAX_ROWS:int = 200_000
+
+
+class CoMoments:
+    """Co-moments of every pair of columns, over the rows where both are present.
+
+    ``n[i, j]`` is the number of such rows, ``mean[i, j]`` and ``m2[i, j]`` the
+    mean and the sum of squared deviations of column ``i`` over them, and
+    ``c[i, j]`` the sum of the cross products of the deviations.
+    """
+
+    def __init__(self, columns:List[str], n:np.ndarray, mean:np.ndarray, m2:np.ndarray, c:np.ndarray):
+        self.columns = list(columns)
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.c = c
+
+    @classmethod
+    def empty(cls, columns:List[str]) -> "CoMoments":
+        shape = (len(columns), len(columns))
+        return cls(columns, np.zeros(shape, dtype=np.int64), np.zeros(shape), np.zeros(shape), np.zeros(shape))
+
+    @classmethod
+    def from_chunk(cls, df:pd.DataFrame, columns:List[str]) -> "CoMoments":
+        values = df[columns].to_numpy(dtype=np.float64)
+        present = ~np.isnan(values)
+        # deviations from the mean of the chunk: the sums below stay small
+        shift = np.where(present, values, 0.).sum(axis=0) / np.maximum(present.sum(axis=0), 1)
+        deviations = np.where(present, values - shift, 0.)
+        weights = present.astype(np.float64)
+        n = np.rint(weights.T @ weights).astype(np.int64)
+        # sums[i, j]: sum of the deviations of i over the rows where j is present
+        sums = deviations.T @ weights
+        squares = (deviations ** 2).T @ weights
+        products = deviations.T @ deviations
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_deviation = np.where(n > 0, sums / n, 0.)
+        return cls(columns, n, shift[:, None] + mean_deviation,
+                   np.maximum(squares - sums * mean_deviation, 0.), products - sums * mean_deviation.T)
+
+    @classmethod
+    def from_chunks(cls, chunks:Iterable[pd.DataFrame], columns:List[str]) -> "CoMoments":
+        moments = cls.empty(columns)
+        for chunk in chunks:
+            moments.merge(cls.from_chunk(chunk, columns))
+        return moments
+
+    @classmethod
+    def from_frame(cls, df:pd.DataFrame, columns:List[str] = None) -> "CoMoments":
+        columns = list(df.columns if columns is None else columns)
+        return cls.from_chunks(frame_chunks(df[columns]), columns)
+
+    def merge(self, other:"CoMoments") -> None:
+        """Fold the co-moments of other rows (same columns) into these."""
+        n = self.n + other.n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(n > 0, other.n / n, 0.)
+            delta = other.mean - self.mean
+            cross = np.where(n > 0, self.n * other.n / n, 0.)
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + other.m2 + delta ** 2 * cross
+        self.c = self.c + other.c + delta * delta.T * cross
+        self.n = n
+
+    def pearson(self, min_periods:int = 1) -> pd.DataFrame:
+        """Same matrix as ``df.corr(min_periods=min_periods)``, up to rounding."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = np.clip(self.c / np.sqrt(self.m2 * self.m2.T), -1., 1.)
+        r[(self.n < max(min_periods, 2)) | ~np.isfinite(r)] = np.nan
+        np.fill_diagonal(r, np.where((np.diag(self.n) >= max(min_periods, 2)) & (np.diag(self.m2) > 0), 1., np.nan))
+        return pd.DataFrame(r, index=self.columns, columns=self.columns)
+
+
+def chunked_comoments(columns:List[str]) -> CoMoments:
+    """Co-moments of ``columns`` over the whole dataset, folded chunk by chunk."""
+    return CoMoments.from_chunks(dataset_chunks(list(columns)), list(columns))
+
+
+def sampled_values(columns:List[str], max_rows:int = SPEARMAN_MAX_ROWS, seed:int = 0) -> Tuple[np.ndarray, int]:
+    """Values of ``columns`` for a uniform sample of at most ``max_rows`` patients, and the number of patients.
+
+    In one pass over the chunks: every row gets a random key and the rows with
+    the ``max_rows`` smallest keys are kept, at most twice ``max_rows`` rows are
+    held at once.
+    """
+    rng = np.random.default_rng(seed)
+    keys, values, n_rows = np.empty(0), np.empty((0, len(columns))), 0
+    for chunk in dataset_chunks(columns):
+        n_rows += len(chunk)
+        keys = np.concatenate([keys, rng.random(len(chunk))])
+        values = np.concatenate([values, chunk[columns].to_numpy(dtype=np.float64)])
+        if len(keys) > max_rows:
+            kept = np.argpartition(keys, max_rows)[:max_rows]
+            keys, values = keys[kept], values[kept]
+    return values, n_rows
+
+
+def _complete_pearson(values:np.ndarray) -> np.ndarray:
+    """Correlations of the columns of ``values`` (no NaN), NaN for constant columns."""
+    centered = values - values.mean(axis=0)
+    norms = np.sqrt((centered ** 2).sum(axis=0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.clip(centered.T @ centered / np.outer(norms, norms), -1., 1.)
+
+
+def spearman(values:np.ndarray) -> np.ndarray:
+    """Pairwise complete Spearman correlations of the columns of ``values`` (NaN for missing)."""
+    present = ~np.isnan(values)
+    r = np.full((values.shape[1], values.shape[1]), np.nan)
+    patterns, groups = np.unique(present.T, axis=0, return_inverse=True)
+    groups = groups.ravel()
+    for g in range(len(patterns)):
+        for h in range(g, len(patterns)):
+            rows = patterns[g] & patterns[h]
+            if rows.sum() < 2:
+                continue
+            columns = np.flatnonzero((groups == g) | (groups == h))
+            # average ranks of ties, as pandas
+            block = _complete_pearson(rankdata(values[np.ix_(rows, columns)], axis=0))
+            in_g, in_h = groups[columns] == g, groups[columns] == h
+            r[np.ix_(columns[in_g], columns[in_h])] = block[np.ix_(in_g, in_h)]
+            r[np.ix_(columns[in_h], columns[in_g])] = block[np.ix_(in_h, in_g)]
+    return r
+
+
+def cluster_order(r:pd.DataFrame) -> List[str]:
+    """Columns of ``r`` ordered by average linkage clustering on ``1 - |r|``."""
+    if len(r) < 3:
+        return list(r.index)
+    distance = 1. - np.abs(np.nan_to_num(r.to_numpy(), nan=0.))
+    distance = np.clip((distance + distance.T) / 2, 0., None)
+    np.fill_diagonal(distance, 0.)
+    tree = linkage(squareform(distance, checks=False), method="average", optimal_ordering=True)
+    return [r.index[i] for i in leaves_list(tree)]
+
+
+class Correlation:
+    """Correlation matrix ``r`` and number of patients ``n`` of each pair, both in cluster order.
+
+    ``sampled`` is true when they were computed on a sample of the patients.
+    """
+
+    def __init__(self, r:pd.DataFrame, n:pd.DataFrame, method:str, sampled:bool = False):
+        order = cluster_order(r)
+        self.r = r.loc[order, order]
+        self.n = n.loc[order, order]
+        self.method = method
+        self.sampled = sampled
+
+    def top_pairs(self, k:int = 10, min_periods:int = TOP_PAIRS_MIN_PERIODS) -> pd.DataFrame:
+        """The ``k`` pairs of distinct columns with the strongest correlation (in absolute value)."""
+        i, j = np.triu_indices(len(self.r), k=1)
+        columns = np.array(self.r.columns, dtype=object)
+        pairs = pd.DataFrame({"x": columns[i], "y": columns[j], "r": self.r.to_numpy()[i, j],
+                              "n": self.n.to_numpy()[i, j]})
+        pairs = pairs[(pairs["n"] >= min_periods) & pairs["r"].notna()]
+        return pairs.iloc[np.argsort(-pairs["r"].abs().to_numpy(), kind="stable")[:k]].reset_index(drop=True)
+
+    def top_columns(self, count:int = 3, min_periods:int = TOP_PAIRS_MIN_PERIODS) -> List[str]:
+        """The first ``count`` distinct columns of the strongest pairs."""
+        columns = []
+        for pair in self.top_pairs(len(self.r) ** 2, min_periods).itertuples():
+            columns += [column for column in (pair.x, pair.y) if column not in columns]
+            if len(columns) >= count:
+                break
+        return columns[:count]
+
+
+def correlation(columns:List[str], method:str = PEARSON) -> Correlation:
+    """Correlations of ``columns`` over the whole dataset (Spearman out-of-core: over a sample)."""
+    columns = list(columns)
+    sampled = False
+    if method == PEARSON:
+        moments = chunked_comoments(columns)
+        r, n = moments.pearson(), moments.n
+    elif method == SPEARMAN:
+        if config.OUT_OF_CORE:
+            values, n_rows = sampled_values(columns)
+            sampled = len(values) < n_rows
+        else:
+            values = pd.concat(dataset_chunks(columns), ignore_index=True).to_numpy(dtype=np.float64)
+        present = (~np.isnan(values)).astype(np.float64)
+        r, n = pd.DataFrame(spearman(values), index=columns, columns=columns), np.rint(present.T @ present)
+    else:
+        raise ValueError(f"unknown method {method!r}, expected one of {METHODS}")
+    return Correlation(r, pd.DataFrame(n.astype(np.int64), index=columns, columns=columns), method, sampled)
+
+
+@functools.lru_cache(maxsize=4)
+def _correlation(version:str, columns:tuple, method:str) -> Correlation:
+    return correlation(list(columns), method)
+
+
+def load_correlation(columns:List[str], method:str = PEARSON) -> Correlation:
+    """Correlations of ``columns`` for the current dataset, computed once per dataset version."""
+    return _correlation(dataset_version(), tuple(columns), method)
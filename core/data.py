@@ -0,0 +1,166 @@
+"""Process-wide dataset loader.
+
+Streamlit reruns every page script on each widget interaction and for each
+session. Reading the xlsx there means a full download and an openpyxl parse per
+click, so the dataset is read once per process here and every page receives
+the same frame.
+
+The xlsx itself is only parsed to build the columnar snapshot of
+:mod:`core.snapshot`, which is then memory mapped, along with the batches of
+patients appended since by :mod:`core.ingest`. The aggregates are computed
+over :func:`dataset_chunks`, which reads the store chunk by chunk in the
+out-of-core mode (``COVID_OUT_OF_CORE=1``); the row-level views still use the
+frame of :func:`load_dataset`.
+
+Column selections such as ``cleaned_df`` and the class slices of
+:func:`split_by_target` are views on that single frame instead of per-session
+copies; this relies on pandas copy-on-write, switched on for the whole process
+by :mod:`core.config`.
+"""
+import functools
+import threading
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core import config
+from core.snapshot import (ARROW_EXTENSION, batch_paths, check_manifest, ensure_snapshot, fetch, iter_chunks,
+                           manifest_mtime_ns, open_dataset, open_snapshot, read_manifest, to_frame)
+
+_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _read_dataset(snapshot:str, batches:Tuple[str, ...], version:str) -> pd.DataFrame:
+    return open_dataset(snapshot, list(batches))
+
+
+@functools.lru_cache(maxsize=1)
+def _manifest(mtime_ns:int) -> Dict:
+    return read_manifest()
+
+
+def _snapshot(path:str = None) -> Tuple[str, Tuple[str, ...], str]:
+    """Snapshot path, appended batches and version of the dataset.
+
+    ``ValueError`` when the batches were appended to a previous source.
+    """
+    with _lock:
+        snapshot, version = ensure_snapshot(path or config.DATASET_PATH)
+        manifest = _manifest(manifest_mtime_ns())
+    check_manifest(manifest, version)
+    if manifest["batches"]:
+        version = f"{version}+{len(manifest['batches'])}-{manifest['batches'][-1]['chain'][:8]}"
+    return snapshot, tuple(batch_paths(manifest)), version
+
+
+def dataset_version(path:str = None) -> str:
+    """Version of the dataset, it changes with the content of the source file and with each appended batch."""
+    return _snapshot(path)[2]
+
+
+def load_dataset(path:str = None) -> pd.DataFrame:
+    """Return the dataset, reading it only when its version changes.
+
+    The frame is shared by all sessions and must be treated as read-only: use
+    non in-place operations (``df.drop(...)`` rather than
+    ``df.drop(..., inplace=True)``). Callers get a shallow copy so that, with
+    pandas copy-on-write, an accidental modification never reaches the cache.
+    """
+    snapshot, batches, version = _snapshot(path)
+    with _lock:
+        df = _read_dataset(snapshot, batches, version)
+    return df.copy(deep=False)
+
+
+# ------------------------ CHUNKS ----------------------------------
+# The aggregates of the pages (statistics, contingency tables, correlations)
+# are folded chunk by chunk, from the frame in memory or, with
+# config.OUT_OF_CORE, straight from the columnar store with bounded memory.
+# Both modes see the same chunks, hence the same results, as long as no batch
+# was appended (the frame is then grouped by target again).
+
+def frame_chunks(df:pd.DataFrame, chunk_rows:int = None) -> Iterator[pd.DataFrame]:
+    """Slices (views) of ``chunk_rows`` rows of ``df``, at least one."""
+    chunk_rows = chunk_rows or config.CHUNK_ROWS
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def store_chunks(columns:List[str] = None, chunk_rows:int = None) -> Iterator[pd.DataFrame]:
+    """Chunks of the current dataset read from the columnar store, a single one in memory at once."""
+    snapshot, batches, _ = _snapshot()
+    for table in iter_chunks(snapshot, list(batches), columns, chunk_rows):
+        yield to_frame(table)
+
+
+def dataset_chunks(columns:List[str] = None, chunk_rows:int = None) -> Iterator[pd.DataFrame]:
+    """Chunks of ``columns`` of the current dataset, from the store in out-of-core mode."""
+    if config.OUT_OF_CORE:
+        return store_chunks(columns, chunk_rows)
+    df = load_dataset()
+    return frame_chunks(df if columns is None else df[list(columns)], chunk_rows)
+
+
+@functools.lru_cache(maxsize=1)
+def _source_order(version:str) -> np.ndarray:
+    return np.argsort(load_dataset().index.to_numpy(), kind="stable")
+
+
+def source_order() -> np.ndarray:
+    """Positions of the rows of the dataset in the order of the source (then of the appended batches).
+
+    The frame is grouped by target, its index holds the position of each row in
+    the source: ``df.iloc[source_order()]`` is the dataset as it was read.
+    """
+    return _source_order(dataset_version())
+
+
+@functools.lru_cache(maxsize=1)
+def _class_bounds(version:str) -> Tuple[int, Dict[str, Tuple[int, int]]]:
+    """Number of rows and ``{class: (start, stop)}`` of the dataset, empty if a class isn't contiguous."""
+    codes, classes = pd.factorize(load_dataset()[config.TARGET])
+    starts = np.flatnonzero(np.concatenate([[True], codes[1:] != codes[:-1]]))
+    stops = np.append(starts[1:], len(codes))
+    bounds = {}
+    for start, stop in zip(starts, stops):
+        if codes[start] < 0:
+            continue
+        label = str(classes[codes[start]])
+        if label in bounds:
+            return len(codes), {}
+        bounds[label] = (int(start), int(stop))
+    return len(codes), bounds
+
+
+def split_by_target(frame:pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Patients of each class of the target, e.g. ``split_by_target(cleaned_df)["positive"]``.
+
+    ``frame`` holds the rows of the dataset in their order (any subset of the
+    columns). The rows being grouped by target, each class is a slice of
+    ``frame``, i.e. a view; otherwise the rows are selected with a mask.
+    """
+    n_rows, bounds = _class_bounds(dataset_version())
+    if bounds and len(frame) == n_rows:
+        return {label: frame.iloc[start:stop] for label, (start, stop) in bounds.items()}
+    target = frame[config.TARGET]
+    return {str(label): frame[target == label] for label in target.dropna().unique()}
+
+
+@functools.lru_cache(maxsize=1)
+def _dataset_csv(version:str) -> bytes:
+    _, batches, _ = _snapshot()
+    path = fetch(config.DATASET_PATH)
+    # values of the source, not their compact types, in the order of the source
+    source = open_snapshot(path).sort_index() if path.endswith(ARROW_EXTENSION) else pd.read_excel(path)
+    appended = [open_snapshot(batch) for batch in batches]
+    return pd.concat([source] + appended).to_csv().encode('utf-8')
+
+
+def load_dataset_csv() -> bytes:
+    """CSV export of the dataset offered by the download button, built once, on the first download.
+
+    The source file is read again, then the appended batches follow.
+    """
+    return _dataset_csv(dataset_version())
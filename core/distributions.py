@@ -0,0 +1,160 @@
+"""Precomputed histograms and kernel density estimates of the numeric columns.
+
+``ff.create_distplot`` ran a scipy Gaussian KDE and shipped every value of the
+column to the browser for each distribution plot: the blood test selected on
+the home page, every float column and every positive/negative pair of blood
+tests in ``Analyse_de_fond``. Here the distributions of all the float columns,
+for all the patients and for each class of the target, are computed together,
+once per dataset version:
+
+- fixed-width histograms (``HIST_BIN_SIZE``, the ``bin_size`` of the distplots,
+  starting at the minimum of the column), counted for every column and every
+  class by a single ``bincount`` per chunk (see :func:`core.data.dataset_chunks`);
+- binned Gaussian KDE: the values are counted on a regular grid of
+  ``KDE_GRID_POINTS`` points and the counts of every column and class are
+  convolved at once with their Gaussian kernel by FFT. The bandwidth follows
+  Scott's rule, as ``scipy.stats.gaussian_kde``.
+
+The charts are drawn from these small arrays with :func:`distplot`.
+"""
+import functools
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import plotly.colors
+import plotly.graph_objects as go
+
+from core import config
+from core.data import dataset_chunks, dataset_version
+from core.stats_store import ALL, StatsStore, load_stats_store
+
+HIST_BIN_SIZE:float = .2
+KDE_GRID_POINTS:int = 512
+
+
+class Distributions:
+    """Histograms and densities of ``columns`` for each of ``groups`` (``ALL`` then each class).
+
+    ``counts[column]`` holds the histogram of the column for each group, a row
+    per group, the bins starting at ``lows[column]``; ``grid[j]`` the points
+    where the density of the column ``j`` is estimated and ``density[g, j]`` its
+    values for the group ``g``.
+    """
+
+    def __init__(self, columns:List[str], groups:List[str], lows:np.ndarray, counts:Dict[str, np.ndarray],
+                 grid:np.ndarray, density:np.ndarray):
+        self.columns = list(columns)
+        self.groups = list(groups)
+        self.lows = dict(zip(self.columns, lows))
+        self.counts = counts
+        self.grid = grid
+        self.density = density
+        self._column = {column: j for j, column in enumerate(self.columns)}
+        self._group = {group: g for g, group in enumerate(self.groups)}
+
+    def histogram(self, column:str, group:str = ALL) -> Tuple[np.ndarray, np.ndarray]:
+        """Centers of the bins and probability density of each bin."""
+        counts = self.counts[column][self._group[group]]
+        centers = self.lows[column] + (np.arange(len(counts)) + .5) * HIST_BIN_SIZE
+        total = counts.sum()
+        return centers, counts / (total * HIST_BIN_SIZE) if total else counts.astype(np.float64)
+
+    def kde(self, column:str, group:str = ALL) -> Tuple[np.ndarray, np.ndarray]:
+        j = self._column[column]
+        return self.grid[j], self.density[self._group[group], j]
+
+    def count(self, column:str, group:str = ALL) -> int:
+        return int(self.counts[column][self._group[group]].sum())
+
+
+def _kernel_fft(widths:np.ndarray, bandwidths:np.ndarray, n_fft:int) -> np.ndarray:
+    """FFT of the Gaussian kernels sampled on the grid steps, a row per (group, column)."""
+    offsets = np.arange(n_fft)
+    # kernel centered on 0, negative offsets wrapped at the end (circular convolution)
+    steps = np.where(offsets < n_fft // 2, offsets, offsets - n_fft)[None, :] * widths[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kernels = np.exp(-.5 * (steps / bandwidths[:, None]) ** 2) / (np.sqrt(2 * np.pi) * bandwidths[:, None])
+    return np.fft.rfft(np.nan_to_num(kernels), axis=1)
+
+
+def compute_distributions(columns:List[str], store:StatsStore) -> Distributions:
+    """Distributions of the float ``columns`` over the whole dataset, in one pass over the chunks.
+
+    The bounds of the bins and the bandwidths come from the statistics store.
+    """
+    classes = sorted(store.class_counts())
+    groups = [ALL] + classes
+    lows = np.array([store.groups[ALL][column].min for column in columns], dtype=np.float64)
+    highs = np.array([store.groups[ALL][column].max for column in columns], dtype=np.float64)
+    lows, highs = np.nan_to_num(lows), np.nan_to_num(highs)
+    highs = np.maximum(highs, lows)
+    n_bins = np.maximum(np.ceil((highs - lows) / HIST_BIN_SIZE - 1e-9).astype(np.int64), 1)
+    offsets = np.concatenate([[0], np.cumsum(n_bins)[:-1]])
+    widths = np.where(highs > lows, (highs - lows) / (KDE_GRID_POINTS - 1), HIST_BIN_SIZE / KDE_GRID_POINTS)
+    # one bucket per class, plus one for the patients without a class: ALL is their sum
+    n_buckets = len(classes) + 1
+    histogram = np.zeros(n_buckets * int(n_bins.sum()), dtype=np.int64)
+    on_grid = np.zeros(n_buckets * len(columns) * KDE_GRID_POINTS, dtype=np.int64)
+    for chunk in dataset_chunks([config.TARGET, *columns]):
+        values = chunk[columns].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        buckets = pd.Categorical(chunk[config.TARGET].astype(object), categories=classes).codes.astype(np.int64)
+        buckets = np.where(buckets < 0, len(classes), buckets)[:, None]
+        with np.errstate(invalid="ignore"):
+            bins = np.clip(np.floor((values - lows) / HIST_BIN_SIZE), 0, n_bins - 1)
+            points = np.clip(np.rint((values - lows) / widths), 0, KDE_GRID_POINTS - 1)
+        cells = buckets * int(n_bins.sum()) + offsets + np.nan_to_num(bins).astype(np.int64)
+        histogram += np.bincount(cells[valid], minlength=histogram.size)
+        cells = (buckets * len(columns) + np.arange(len(columns))) * KDE_GRID_POINTS + np.nan_to_num(points).astype(np.int64)
+        on_grid += np.bincount(cells[valid], minlength=on_grid.size)
+    histogram = histogram.reshape(n_buckets, -1)
+    histogram = np.vstack([histogram.sum(axis=0), histogram[:len(classes)]])
+    counts = {column: histogram[:, offsets[j]:offsets[j] + n_bins[j]] for j, column in enumerate(columns)}
+    on_grid = on_grid.reshape(n_buckets, len(columns), KDE_GRID_POINTS)
+    on_grid = np.concatenate([on_grid.sum(axis=0, keepdims=True), on_grid[:len(classes)]])
+    # Scott's rule: std * n ** (-1 / 5)
+    n = on_grid.sum(axis=2).astype(np.float64)
+    std = np.array([[store.groups[group][column].std if column in store.groups[group] else np.nan for column in columns]
+                    for group in groups])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bandwidths = np.where((n > 1) & (std > 0), std * n ** -.2, np.nan)
+    n_fft = 1 << int(np.ceil(np.log2(3 * KDE_GRID_POINTS)))
+    signal = np.fft.rfft(on_grid.reshape(-1, KDE_GRID_POINTS).astype(np.float64), n=n_fft, axis=1)
+    kernels = _kernel_fft(np.tile(widths, len(groups)), bandwidths.ravel(), n_fft)
+    density = np.fft.irfft(signal * kernels, n=n_fft, axis=1)[:, :KDE_GRID_POINTS]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        density = np.clip(density, 0, None) / n.reshape(-1, 1)
+    density[~np.isfinite(bandwidths.ravel())] = np.nan
+    grid = lows[:, None] + np.arange(KDE_GRID_POINTS) * widths[:, None]
+    return Distributions(columns, groups, lows, counts, grid, density.reshape(len(groups), len(columns), KDE_GRID_POINTS))
+
+
+@functools.lru_cache(maxsize=1)
+def _load_distributions(version:str) -> Distributions:
+    store = load_stats_store()
+    columns = [column for column in store.numeric_columns if store.dtypes[column].startswith("float")]
+    return compute_distributions(columns, store)
+
+
+def load_distributions() -> Distributions:
+    """Distributions of every float column of the current dataset, computed once per dataset version."""
+    return _load_distributions(dataset_version())
+
+
+def distplot(distributions:Distributions, column:str, groups:Sequence[str] = (ALL,), names:Sequence[str] = None,
+             colors:Sequence[str] = None) -> go.Figure:
+    """Same chart as ``ff.create_distplot(..., bin_size=HIST_BIN_SIZE, show_rug=False)`` from the precomputed arrays."""
+    names = list(names or groups)
+    colors = list(colors or plotly.colors.DEFAULT_PLOTLY_COLORS)
+    fig = go.Figure()
+    for group, name, color in zip(groups, names, colors):
+        centers, density = distributions.histogram(column, group)
+        fig.add_trace(go.Bar(x=centers, y=density, width=HIST_BIN_SIZE, name=name, legendgroup=name,
+                             marker=dict(color=color, line=dict(width=0)), opacity=.7))
+    for group, name, color in zip(groups, names, colors):
+        x, y = distributions.kde(column, group)
+        fig.add_trace(go.Scatter(x=x, y=y, mode="lines", name=name, legendgroup=name, showlegend=False,
+                                 marker=dict(color=color)))
+    return fig.update_layout(barmode="overlay", bargap=0, hovermode="closest", legend=dict(traceorder="reversed"),
+                             xaxis=dict(zeroline=False))
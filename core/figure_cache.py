@@ -0,0 +1,174 @@
+"""Persistent figure cache.
+
+The plotly figures of the pages only depend on the dataset and on a few widget
+values, yet they were rebuilt on every rerun of every session. Figures are
+stored here as JSON files under ``<CACHE_DIR>/figures/<dataset version>/``,
+shared by every session and server worker. Entries of a previous dataset
+version are dropped as soon as a figure of the new version is written, and
+the least recently used figures are evicted above ``FIGURE_CACHE_MAX_BYTES``.
+
+The key also holds a fingerprint of the builder (its bytecode, names and
+constants: traces, colors, titles...) and the version given to
+:func:`figure_cache`, so a changed builder misses the cache. The fingerprint
+doesn't see the helpers a builder calls: bump the version when they change.
+
+Writes don't walk the cache directory: each process keeps a running total of
+the size of the cache, measured once and increased by every figure it writes.
+The directory is only walked when that total goes above the limit (the cache
+is then brought down to ``EVICT_TO`` of it), and every ``RESCAN_EVERY`` writes
+to account for the figures of the other workers.
+"""
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import types
+from typing import Any, Callable, Dict, Sequence
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from core import config
+from core.data import dataset_version
+
+# writes of this process after which the size of the cache is measured again
+RESCAN_EVERY:int = 64
+# above the limit, figures are evicted down to this share of it, leaving room for the next writes
+EVICT_TO:float = .8
+
+# version whose older entries were dropped and running size of the cache, for this process
+_state:Dict[str, Any] = {"version": None, "bytes": None, "writes": 0}
+_lock = threading.Lock()
+
+
+def _cache_dir() -> str:
+    return os.path.join(config.CACHE_DIR, "figures")
+
+
+@functools.lru_cache(maxsize=256)
+def _code_fingerprint(code:types.CodeType) -> str:
+    """Hash of what a function does, not where it is: line numbers and file names are left out."""
+    digest = hashlib.sha256(code.co_code)
+    digest.update(repr((code.co_names, code.co_varnames, code.co_freevars)).encode())
+    for const in code.co_consts:
+        digest.update(_const_repr(const).encode())
+    return digest.hexdigest()
+
+
+def _const_repr(const:Any) -> str:
+    """Representation of a constant of a code object, the same in every process."""
+    if isinstance(const, types.CodeType):
+        return _code_fingerprint(const)
+    if isinstance(const, frozenset):  # iteration order depends on the hash seed of the process
+        return repr(sorted(_const_repr(item) for item in const))
+    if isinstance(const, tuple):
+        return repr(tuple(_const_repr(item) for item in const))
+    return repr(const)
+
+
+def builder_fingerprint(build:Callable, version:int = 1) -> str:
+    """Fingerprint of a figure builder: its code and its ``version``."""
+    code = getattr(build, "__code__", None)
+    return f"{version}-{_code_fingerprint(code) if code is not None else getattr(build, '__qualname__', '')}"
+
+
+def _key(kind:str, columns:Sequence[str], params:Dict[str, Any], version:str, builder:str) -> str:
+    payload = json.dumps([kind, list(columns), params, version, builder], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _drop_other_versions(version:str) -> None:
+    root = _cache_dir()
+    for entry in os.listdir(root):
+        if entry != version:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+def _evict(max_bytes:int) -> int:
+    """Above ``max_bytes``, remove the least recently used figures down to ``EVICT_TO`` of it; return the size left."""
+    entries = []
+    for folder, _, files in os.walk(_cache_dir()):
+        for name in files:
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # evicted by another worker
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return total
+    for _, size, path in sorted(entries):
+        if total <= max_bytes * EVICT_TO:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    return total
+
+
+def _written(version:str, size:int) -> None:
+    """Account for a figure of ``size`` bytes written for ``version``, drop and evict when needed."""
+    with _lock:
+        if _state["version"] != version:
+            _drop_other_versions(version)
+            _state.update(version=version, bytes=None)
+        _state["writes"] += 1
+        if _state["bytes"] is not None and _state["writes"] % RESCAN_EVERY:
+            _state["bytes"] += size
+            if _state["bytes"] <= config.FIGURE_CACHE_MAX_BYTES:
+                return
+        _state["bytes"] = _evict(config.FIGURE_CACHE_MAX_BYTES)
+
+
+def cached_figure(kind:str, columns:Sequence[str], params:Dict[str, Any], build:Callable[[], go.Figure],
+                  builder:str = "") -> go.Figure:
+    """Return the figure ``build()`` from the cache, building and storing it on a miss.
+
+    ``kind``, ``columns`` and ``params`` must identify the figure for a given
+    dataset version, which is part of the key, and ``builder`` the way it is
+    built (see :func:`builder_fingerprint`).
+    """
+    version = dataset_version()
+    folder = os.path.join(_cache_dir(), version)
+    path = os.path.join(folder, _key(kind, columns, params, version, builder) + ".json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            fig = pio.from_json(f.read(), skip_invalid=True)
+        os.utime(path)  # mtime is the LRU clock
+        return fig
+    except (FileNotFoundError, ValueError):
+        pass
+    fig = build()
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(pio.to_json(fig, validate=False))
+    os.replace(tmp, path)
+    _written(version, os.path.getsize(path))
+    return fig
+
+
+def figure_cache(kind:str, version:int = 1) -> Callable:
+    """Decorator caching a figure builder with :func:`cached_figure`.
+
+    The positional arguments of the builder are the columns of the key and its
+    keyword arguments the parameters. The code of the builder is part of the
+    key; bump ``version`` when the figure changes through the helpers it calls::
+
+        @figure_cache("blood_distplot")
+        def blood_figure(column:str): ...
+    """
+    def decorator(build:Callable[..., go.Figure]) -> Callable[..., go.Figure]:
+        builder = builder_fingerprint(build, version)
+
+        @functools.wraps(build)
+        def wrapper(*columns, **params) -> go.Figure:
+            return cached_figure(kind, columns, params, lambda: build(*columns, **params), builder)
+        return wrapper
+    return decorator
@@ -0,0 +1,31 @@
+"""Lazy figure galleries.
+
+The content of ``st.expander`` runs on every rerun, even while collapsed, so a
+loop building one figure per column costs as much as the number of columns.
+A gallery only builds the figures of the page of columns the user is looking
+at, and nothing at all until it is opened.
+"""
+import math
+from typing import Callable, List
+
+import plotly.graph_objects as go
+import streamlit as st
+
+
+def lazy_gallery(label:str, columns:List[str], build_figure:Callable[[str], go.Figure], key:str, page_size:int = 4) -> None:
+    """Show ``build_figure(column)`` for a page of ``columns`` once the gallery is opened.
+
+    A column picker narrows the gallery down to the chosen columns, otherwise
+    the columns are shown ``page_size`` at a time.
+    """
+    if not st.toggle(label, key=f"{key}_open"):
+        return
+    with st.container(border=True):
+        picked = st.multiselect("Variables", columns, key=f"{key}_columns", placeholder="Toutes les variables")
+        shown = picked or list(columns)
+        n_pages = max(1, math.ceil(len(shown) / page_size))
+        page = 1
+        if n_pages > 1:
+            page = st.number_input(f"Page (sur {n_pages})", min_value=1, max_value=n_pages, value=1, key=f"{key}_page")
+        for column in shown[(page - 1) * page_size:page * page_size]:
+            st.write(build_figure(column))
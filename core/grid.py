@@ -0,0 +1,90 @@
+"""Paginated explorer of the dataset.
+
+``st.dataframe(df)`` serializes the whole dataset to the browser on every
+rerun. The explorer only sends one page of the selected columns: sorting
+uses an argsort index built once per column and dataset version, filters are
+evaluated as vectorized masks on the shared frame, and both the page size
+and the number of cells sent are capped. Rows are shown in the order of the
+source file, with their row number in it as index.
+"""
+import functools
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from pandas.api.types import is_numeric_dtype
+
+from core.data import dataset_version, load_dataset, source_order
+
+PAGE_SIZES = (25, 50, 100, 250)
+# largest number of cells (rows x columns) sent to the browser at once
+MAX_CELLS:int = 25000
+NO_SORT:str = "(aucun)"
+
+
+@functools.lru_cache(maxsize=64)
+def _sort_index(version:str, column:str, descending:bool) -> np.ndarray:
+    """Row positions of the dataset sorted by ``column``, NaN last, ties in the order of the source."""
+    order = source_order()
+    ranks = load_dataset()[column].iloc[order].rank(method="first", ascending=not descending, na_option="bottom")
+    return order[np.argsort(ranks.to_numpy(), kind="stable")]
+
+
+def _filter_mask(df:pd.DataFrame, key:str) -> Tuple[np.ndarray, bool]:
+    """Mask of the rows matching the filter widgets, and whether a filter is active."""
+    column = st.selectbox("Filtrer sur", [NO_SORT] + list(df.columns), key=f"{key}_filter_column")
+    if column == NO_SORT:
+        return None, False
+    values = df[column]
+    if is_numeric_dtype(values) and values.notna().any():
+        low, high = float(values.min()), float(values.max())
+        if low == high:
+            return values.notna().to_numpy(), True
+        bounds = st.slider("Intervalle", low, high, (low, high), key=f"{key}_filter_range")
+        return values.between(*bounds).to_numpy(), True
+    levels = sorted(values.dropna().unique().tolist(), key=str)
+    picked = st.multiselect("Valeurs", levels, key=f"{key}_filter_values")
+    if not picked:
+        return None, False
+    return values.isin(picked).to_numpy(), True
+
+
+def _for_display(page:pd.DataFrame) -> pd.DataFrame:
+    """``page`` with the float32 lab values written as their shortest decimal, e.g. 0.8946096 rather than
+    0.8946095705032349: the value of the source to 7 significant digits (the CSV export holds the exact ones)."""
+    floats = [column for column in page.columns if page[column].dtype == np.float32]
+    if not floats:
+        return page
+    return page.assign(**{column: page[column].astype(str).astype(np.float64) for column in floats})
+
+
+def dataset_explorer(key:str, default_columns:List[str] = None) -> None:
+    """Show the dataset one page at a time, with column projection, sort and filter."""
+    df = load_dataset()
+    version = dataset_version()
+    default_columns = default_columns or list(df.columns[:10])
+    columns = st.multiselect("Colonnes affichées", list(df.columns), default=default_columns, key=f"{key}_columns") or default_columns
+    sort_column, filter_column, order_column, size_column = st.columns(4)
+    with sort_column:
+        sort_by = st.selectbox("Trier par", [NO_SORT] + list(df.columns), key=f"{key}_sort")
+    with order_column:
+        descending = st.toggle("Ordre décroissant", key=f"{key}_descending")
+    with size_column:
+        page_size = st.selectbox("Lignes par page", PAGE_SIZES, key=f"{key}_page_size")
+    with filter_column:
+        mask, filtered = _filter_mask(df, key)
+
+    # positions of the matching rows, in display order
+    if sort_by != NO_SORT:
+        positions = _sort_index(version, sort_by, descending)
+    else:
+        positions = source_order()[::-1] if descending else source_order()
+    if filtered:
+        positions = positions[mask[positions]]
+    page_size = max(1, min(page_size, MAX_CELLS // max(len(columns), 1)))
+    n_pages = max(1, -(-len(positions) // page_size))
+    page = st.number_input(f"Page (sur {n_pages})", min_value=1, max_value=n_pages, value=1, key=f"{key}_page") if n_pages > 1 else 1
+    shown = positions[(page - 1) * page_size:page * page_size]
+    st.dataframe(_for_display(df.iloc[shown][columns]))
+    st.caption(f"{len(positions)} lignes sur {df.shape[0]} · {len(columns)} colonnes sur {df.shape[1]}")
@@ -0,0 +1,218 @@
+"""Hypothesis tests run on every column at once.
+
+``test_statistique`` used to draw a balanced sample of negative patients and
+run ``ttest_ind`` column by column, twice per column. Here the groups are
+drawn once and the Student t-tests of all the columns are computed in one
+NaN-aware NumPy pass, along with effect sizes and confidence intervals.
+"""
+import collections
+import concurrent.futures
+import threading
+import time
+from typing import List
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from core import config
+
+REJECT:str = "reject H0"
+FAIL_TO_REJECT:str = "fail to reject H0"
+
+
+def _moments(values:np.ndarray):
+    """Count, mean and unbiased variance of each column, NaN ignored (mean NaN for an empty column, as scipy)."""
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    filled = np.where(valid, values, 0.)
+    mean = np.where(count > 0, filled.sum(axis=0) / np.maximum(count, 1), np.nan)
+    variance = (np.where(valid, values - mean, 0.) ** 2).sum(axis=0) / np.maximum(count - 1, 1)
+    return count, mean, variance
+
+
+def ttest_table(group_a:pd.DataFrame, group_b:pd.DataFrame, columns:List[str], alpha:float = .01,
+                confidence:float = .95) -> pd.DataFrame:
+    """Student t-tests (equal variances, as ``ttest_ind``) of ``group_a`` against ``group_b``.
+
+    NaN are dropped per column. One row per column with the sizes and means of
+    both groups, the t statistic, the two-sided p-value, Cohen's d, the
+    confidence interval of the difference of means and the decision at ``alpha``.
+    """
+    n_a, mean_a, var_a = _moments(group_a[columns].to_numpy(dtype="float64"))
+    n_b, mean_b, var_b = _moments(group_b[columns].to_numpy(dtype="float64"))
+    dof = n_a + n_b - 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pooled = ((n_a - 1) * var_a + (n_b - 1) * var_b) / dof
+        difference = mean_a - mean_b
+        standard_error = np.sqrt(pooled * (1 / n_a + 1 / n_b))
+        statistic = difference / standard_error
+        p_value = 2 * stats.t.sf(np.abs(statistic), dof)
+        margin = stats.t.ppf(.5 + confidence / 2, dof) * standard_error
+        results = pd.DataFrame({
+            "n_a": n_a, "n_b": n_b, "mean_a": mean_a, "mean_b": mean_b,
+            "statistic": statistic, "p_value": p_value,
+            "cohen_d": difference / np.sqrt(pooled),
+            "ci_low": difference - margin, "ci_high": difference + margin,
+        }, index=pd.Index(columns, name="variable"))
+    results["decision"] = np.where(results["p_value"] < alpha, REJECT, FAIL_TO_REJECT)
+    return results
+
+
+def balanced_ttest(positive:pd.DataFrame, negative:pd.DataFrame, columns:List[str], alpha:float = .01,
+                   random_state:int = 0) -> pd.DataFrame:
+    """t-tests of a random sample of negative patients, as large as the positive group, against the positive ones.
+
+    This is the procedure of the Analyse de fond page: the sample is drawn with
+    ``negative.sample(positive.shape[0], random_state=random_state)``.
+    """
+    sample = negative.sample(positive.shape[0], random_state=random_state)
+    results = ttest_table(sample, positive, columns, alpha)
+    return results.rename(columns={"n_a": "n_negative", "n_b": "n_positive", "mean_a": "mean_negative", "mean_b": "mean_positive"})
+
+
+# ------------------------ RESAMPLING ----------------------------------
+# The balanced test above rests on a single random draw of negative patients.
+# The resampling mode repeats it thousands of times, in batches of matrix
+# operations spread over a process pool.
+BALANCED:str = "balanced"
+PERMUTATION:str = "permutation"
+_BATCH_SIZE:int = 200
+
+_worker_data = {}
+
+
+def _init_worker(positive_values:np.ndarray, negative_values:np.ndarray) -> None:
+    _worker_data["positive"] = positive_values
+    _worker_data["negative"] = negative_values
+
+
+def _batched_statistics(group_a:np.ndarray, group_b:np.ndarray):
+    """t statistics and p-values of batches of groups shaped (batch, patients, columns)."""
+    valid_a, valid_b = ~np.isnan(group_a), ~np.isnan(group_b)
+    n_a, n_b = valid_a.sum(axis=1), valid_b.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_a = np.where(valid_a, group_a, 0.).sum(axis=1) / n_a
+        mean_b = np.where(valid_b, group_b, 0.).sum(axis=1) / n_b
+        ss_a = (np.where(valid_a, group_a - mean_a[:, None], 0.) ** 2).sum(axis=1)
+        ss_b = (np.where(valid_b, group_b - mean_b[:, None], 0.) ** 2).sum(axis=1)
+        dof = n_a + n_b - 2
+        statistic = (mean_a - mean_b) / np.sqrt((ss_a + ss_b) / dof * (1 / n_a + 1 / n_b))
+    return statistic, 2 * stats.t.sf(np.abs(statistic), dof)
+
+
+def _resample_batch(mode:str, size:int, seed:np.random.SeedSequence) -> np.ndarray:
+    """One batch of resamples: p-values (balanced) or t statistics under H0 (permutation)."""
+    positive, negative = _worker_data["positive"], _worker_data["negative"]
+    rng = np.random.default_rng(seed)
+    n_positive = positive.shape[0]
+    draws = rng.permuted(np.tile(np.arange(negative.shape[0]), (size, 1)), axis=1)[:, :n_positive]
+    sample = negative[draws]
+    if mode == BALANCED:
+        return _batched_statistics(sample, np.broadcast_to(positive, sample.shape))[1]
+    pooled = np.concatenate([sample, np.broadcast_to(positive, sample.shape)], axis=1)
+    labels = rng.permuted(np.tile(np.arange(2 * n_positive), (size, 1)), axis=1)
+    shuffled = np.take_along_axis(pooled, labels[:, :, None], axis=1)
+    return _batched_statistics(shuffled[:, :n_positive], shuffled[:, n_positive:])[0]
+
+
+def resampled_ttest(positive:pd.DataFrame, negative:pd.DataFrame, columns:List[str], alpha:float = .01,
+                    mode:str = BALANCED, n_resamples:int = 2000, random_state:int = 0, n_jobs:int = None,
+                    max_seconds:float = None, progress=None):
+    """Repeat the balanced t-tests over ``n_resamples`` random draws.
+
+    ``mode`` is either:
+
+    * ``BALANCED``: each resample is a new balanced sample of negative
+      patients; the summary gives the quantiles of the p-values, the share of
+      draws rejecting H0 and the stability of the majority decision;
+    * ``PERMUTATION``: each resample permutes the labels of a balanced sample;
+      the observed statistics of :func:`balanced_ttest` get a permutation
+      p-value with its 95% Monte Carlo interval, the decision is stable when
+      that interval doesn't contain ``alpha``.
+
+    Draws giving NaN for a column are not counted for it (``n_resamples`` is
+    per column), and a column without a valid observed statistic gets a NaN
+    p-value and fails to reject H0.
+
+    Batches run on ``n_jobs`` processes (``config.RESAMPLING_JOBS`` by default). When
+    ``max_seconds`` is exceeded the remaining batches are cancelled and the
+    summary covers the resamples done so far. ``progress(done, total)`` is
+    called after each batch. Returns the summary table and the raw per
+    resample values (p-values, or permuted statistics).
+    """
+    if mode not in (BALANCED, PERMUTATION):
+        raise ValueError(f"unknown resampling mode {mode!r}")
+    positive_values = positive[columns].to_numpy(dtype="float64")
+    negative_values = negative[columns].to_numpy(dtype="float64")
+    sizes = [min(_BATCH_SIZE, n_resamples - start) for start in range(0, n_resamples, _BATCH_SIZE)]
+    seeds = np.random.SeedSequence(random_state).spawn(len(sizes))
+    start, batches = time.perf_counter(), []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs or config.RESAMPLING_JOBS, initializer=_init_worker,
+                                                initargs=(positive_values, negative_values)) as pool:
+        futures = [pool.submit(_resample_batch, mode, size, seed) for size, seed in zip(sizes, seeds)]
+        for future in concurrent.futures.as_completed(futures):
+            batches.append(future.result())
+            if progress is not None:
+                progress(sum(batch.shape[0] for batch in batches), n_resamples)
+            if max_seconds is not None and time.perf_counter() - start > max_seconds:
+                for pending in futures:
+                    pending.cancel()
+                break
+    values = pd.DataFrame(np.concatenate(batches), columns=columns)
+    # draws where the test isn't defined for a column (too few values, constant
+    # values...) give NaN: they are left out of the draws of that column
+    done = values.notna().sum()
+
+    if mode == BALANCED:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            reject_rate = (values < alpha).sum() / done.where(done > 0)
+        summary = pd.DataFrame({
+            "p_value_q05": values.quantile(.05), "p_value_median": values.median(), "p_value_q95": values.quantile(.95),
+            "reject_rate": reject_rate,
+            "decision": np.where(reject_rate >= .5, REJECT, FAIL_TO_REJECT),
+            "stability": np.maximum(reject_rate, 1 - reject_rate),
+        })
+    else:
+        observed = balanced_ttest(positive, negative, columns, alpha, random_state)["statistic"]
+        exceed = (values.abs() >= observed.abs()).sum()
+        # no p-value without an observed statistic: the decision is then to fail to reject
+        p_value = ((exceed + 1) / (done + 1)).where(observed.notna() & (done > 0))
+        margin = 1.96 * np.sqrt(p_value * (1 - p_value) / (done + 1))
+        summary = pd.DataFrame({
+            "statistic": observed, "p_value": p_value,
+            "p_value_low": (p_value - margin).clip(lower=0), "p_value_high": (p_value + margin).clip(upper=1),
+            "decision": np.where(p_value < alpha, REJECT, FAIL_TO_REJECT),
+            "stable": ((p_value + margin) < alpha) | ((p_value - margin) > alpha),
+        })
+    summary.insert(0, "n_resamples", done)
+    summary.index.name = "variable"
+    return summary, values
+
+
+# results of the pages kept per dataset version and parameters, least recently used first out
+RESAMPLED_CACHE_SIZE:int = 8
+_resampled:collections.OrderedDict = collections.OrderedDict()
+_resampled_lock = threading.Lock()
+
+
+def cached_resampled_ttest(version:str, positive:pd.DataFrame, negative:pd.DataFrame, columns:List[str],
+                           alpha:float = .01, mode:str = BALANCED, n_resamples:int = 2000, random_state:int = 0,
+                           **kwargs):
+    """:func:`resampled_ttest` of the classes of the dataset ``version``, memoized for the reruns of the pages.
+
+    A click on a rerun gets the results of the previous one instead of a new
+    process pool. Results cut short by ``max_seconds`` aren't kept.
+    """
+    key = (version, tuple(columns), alpha, mode, n_resamples, random_state)
+    with _resampled_lock:
+        if key in _resampled:
+            _resampled.move_to_end(key)
+            return _resampled[key]
+    summary, values = resampled_ttest(positive, negative, columns, alpha, mode, n_resamples, random_state, **kwargs)
+    if len(values) == n_resamples:
+        with _resampled_lock:
+            _resampled[key] = summary, values
+            while len(_resampled) > RESAMPLED_CACHE_SIZE:
+                _resampled.popitem(last=False)
+    return summary, values
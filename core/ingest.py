@@ -0,0 +1,150 @@
+"""Incremental ingestion of new batches of patients.
+
+A new batch used to mean replacing the xlsx and rebuilding everything: the
+snapshot, the profile, the statistics, the contingency tables. Here the batch
+is validated against the schema of the dataset, appended to the columnar store
+(see :func:`core.snapshot.append_batch`), which bumps the dataset version, and
+the derived artifacts are carried to the new version by folding in the batch
+alone:
+
+- the statistics store (NaN rates, column groups, KPIs, ``describe``), and with
+  it the profile of the pages;
+- the persisted target tables and pairwise cubes of :mod:`core.contingency`.
+
+The artifacts cached per version (figures, missingness map, sort indexes) are
+rebuilt on first use.
+
+    python -m core.ingest new_patients.csv
+"""
+import argparse
+import os
+import time
+from typing import Dict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import is_numeric_dtype
+
+from core import config
+from core.contingency import (CROSSTAB_CUBE, TARGET_TABLES, CrosstabCube, EncodedCategoricals, artifact_path,
+                              artifact_paths, drop_other_versions, merge_tables, read_artifact, save_artifact,
+                              target_tables)
+from core.data import dataset_version, load_dataset
+from core.snapshot import append_batch, ensure_snapshot, read_schema, to_frame, to_schema
+from core.stats_store import StatsStore, drop_other_stores, load_stats_store, store_path
+
+
+def read_batch(path:str) -> pd.DataFrame:
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".parquet":
+        return pq.read_table(path).to_pandas()
+    if extension in (".xlsx", ".xls"):
+        return pd.read_excel(path)
+    return pd.read_csv(path)
+
+
+def validate_batch(batch:pd.DataFrame, schema:pa.Schema, store:StatsStore, known_ids:pd.Series) -> pd.DataFrame:
+    """Batch with the columns of the dataset, in order, ``ValueError`` if it can't be appended.
+
+    Unknown columns are rejected, missing ones are filled with NaN, the lab
+    values must be numeric, the target must be one of the known classes and the
+    patient IDs must be new and unique.
+    """
+    unknown = [column for column in batch.columns if column not in schema.names]
+    if unknown:
+        raise ValueError(f"unknown columns: {unknown}")
+    for column in (config.PATIENT_ID, config.TARGET):
+        if column not in batch.columns or batch[column].isna().any():
+            raise ValueError(f"{column!r} is required for every patient")
+    batch = batch.reindex(columns=schema.names)
+    for column in schema.names:
+        kind = schema.field(column).type
+        if not (pa.types.is_floating(kind) or pa.types.is_integer(kind)):
+            # missing values become nulls, as in the snapshot, rather than "nan" strings
+            batch[column] = batch[column].astype(object).where(batch[column].notna(), None)
+        elif not is_numeric_dtype(batch[column]):
+            try:
+                batch[column] = pd.to_numeric(batch[column])
+            except (TypeError, ValueError) as error:
+                raise ValueError(f"{column!r} must be numeric: {error}") from error
+    classes = set(store.class_counts())
+    unexpected = set(batch[config.TARGET].unique()) - classes
+    if unexpected:
+        raise ValueError(f"unknown classes of {config.TARGET!r}: {sorted(unexpected)}, expected {sorted(classes)}")
+    ids = batch[config.PATIENT_ID]
+    if ids.duplicated().any():
+        raise ValueError(f"duplicated {config.PATIENT_ID!r} in the batch: {ids[ids.duplicated()].unique()[:5].tolist()}")
+    existing = ids[ids.isin(known_ids)]
+    if len(existing):
+        raise ValueError(f"{len(existing)} patients are already in the dataset: {existing.unique()[:5].tolist()}")
+    return batch
+
+
+def _carry_contingency(previous:str, version:str, batch:pd.DataFrame) -> int:
+    """Persist the contingency artifacts of ``previous`` for ``version``, batch included."""
+    carried = 0
+    for path in artifact_paths(previous, TARGET_TABLES):
+        try:
+            columns, tables = read_artifact(path)
+        except FileNotFoundError:  # dropped by the app, rebuilt on its next use
+            continue
+        save_artifact(artifact_path(version, TARGET_TABLES, columns), columns,
+                      merge_tables(tables, target_tables(batch, list(columns))))
+        carried += 1
+    for path in artifact_paths(previous, CROSSTAB_CUBE):
+        try:
+            columns, cube = read_artifact(path)
+        except FileNotFoundError:
+            continue
+        batch_cube = CrosstabCube.from_encoded(EncodedCategoricals.from_frame(batch, list(columns)))
+        save_artifact(artifact_path(version, CROSSTAB_CUBE, columns), columns, cube.merge(batch_cube))
+        carried += 1
+    drop_other_versions(version)
+    return carried
+
+
+def ingest_batch(batch:pd.DataFrame) -> Dict:
+    """Append a batch of patients to the dataset and update the derived artifacts.
+
+    There must be a single ingestion at a time. Returns the previous and new
+    dataset versions, the number of patients appended and of contingency
+    artifacts carried over.
+    """
+    snapshot, base = ensure_snapshot(config.DATASET_PATH)
+    schema = read_schema(snapshot)
+    previous = dataset_version()
+    # built if needed, then reloaded from disk so that the cached store isn't modified
+    load_stats_store()
+    store = StatsStore.load(store_path(previous))
+    dataset = load_dataset()
+    batch = validate_batch(batch, schema, store, dataset[config.PATIENT_ID])
+    # numbered after the rows already in the dataset
+    first_row = int(dataset.index.max()) + 1 if len(dataset) else 0
+    batch.index = pd.RangeIndex(first_row, first_row + len(batch))
+    table = to_schema(batch, schema)
+    append_batch(table, base)
+    version = dataset_version()
+    # same dtypes as the frames read back from the store
+    batch = to_frame(table)
+    store.update(batch)
+    store.save(store_path(version))
+    drop_other_stores(version)
+    carried = _carry_contingency(previous, version, batch)
+    return {"previous_version": previous, "version": version, "patients": len(batch),
+            "contingency_artifacts": carried}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Append a batch of patients to the dataset.")
+    parser.add_argument("input", help="CSV, xlsx or Parquet file of patients with the columns of the dataset")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    result = ingest_batch(read_batch(args.input))
+    print(f"{result['patients']} patients appended in {time.perf_counter() - start:.1f}s: "
+          f"{result['previous_version']} -> {result['version']} "
+          f"({result['contingency_artifacts']} contingency artifacts carried over)")
+
+
+if __name__ == "__main__":
+    main()
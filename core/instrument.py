@@ -0,0 +1,175 @@
+"""Per-section timing and profiling of the pages.
+
+When a page is slow, the sections of the script (data loading, KPI, figures,
+statistical tests...) are wrapped with :func:`section`, which records their
+wall time and, with tracemalloc, the memory they allocate. The records of the
+current session are shown by :func:`debug_panel` in the sidebar and exported
+as JSON or Prometheus text, with an optional cProfile of the whole run.
+
+Everything is opt-in and server side: without ``COVID_DEBUG=1``
+:func:`section` records nothing and the sidebar stays empty, whatever the URL.
+tracemalloc only traces while an instrumented run is going on, and is stopped
+as soon as no session is running one. When instrumented, the elements of each
+section are drawn in a container keyed by its position in the run
+(:data:`SECTION_KEY_PREFIX`), so that the headless benchmark can tell which
+figures each section sent.
+
+    start_page("home")
+    with section("kpi"):
+        ...
+    debug_panel()
+"""
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Dict, Iterator
+
+import pandas as pd
+import streamlit as st
+
+from core import config
+
+STATE_KEY:str = "_instrument"
+# key of the container of the i-th section of the run
+SECTION_KEY_PREFIX:str = "_instrument_section_"
+# functions listed by the cProfile report
+PROFILE_TOP:int = 30
+
+# sessions in the middle of an instrumented run: tracemalloc is on while there is one
+_active:set = set()
+_active_lock = threading.Lock()
+
+
+def _state() -> Dict:
+    if STATE_KEY not in st.session_state:
+        st.session_state[STATE_KEY] = {"enabled": False, "page": "", "sections": [], "totals": {},
+                                    "profiler": None, "profile": ""}
+    return st.session_state[STATE_KEY]
+
+
+def enabled() -> bool:
+    return config.DEBUG
+
+
+def _start_tracing(state:Dict) -> None:
+    with _active_lock:
+        _active.add(id(state))
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def _stop_tracing(state:Dict) -> None:
+    with _active_lock:
+        _active.discard(id(state))
+        if not _active and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def start_page(page:str) -> None:
+    """Start recording a run of ``page``, to be called at the top of the script."""
+    state = _state()
+    if state["profiler"] is not None:
+        # left running by a run interrupted by an exception or a rerun
+        state["profiler"].disable()
+        state["profiler"] = None
+    state.update(enabled=enabled(), page=page, sections=[], profile="")
+    if not state["enabled"]:
+        # a run interrupted before debug_panel left the session among the active ones
+        _stop_tracing(state)
+        return
+    _start_tracing(state)
+    if st.session_state.get("_instrument_cprofile"):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # a single profiler at a time per process: another session is being profiled
+            state["profile"] = "Profilage impossible : une autre session est déjà profilée."
+            return
+        state["profiler"] = profiler
+
+
+@contextlib.contextmanager
+def section(name:str) -> Iterator[None]:
+    """Record the wall time and the memory allocated by the block, sections aren't nested."""
+    state = _state()
+    if not state["enabled"] or not tracemalloc.is_tracing():
+        yield
+        return
+    tracemalloc.reset_peak()
+    memory = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        with st.container(key=f"{SECTION_KEY_PREFIX}{len(state['sections'])}"):
+            yield
+    finally:
+        seconds = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        state["sections"].append({"page": state["page"], "section": name, "seconds": seconds,
+                                  "allocated_bytes": current - memory, "peak_bytes": peak - memory})
+        totals = state["totals"].setdefault(f"{state['page']}\x1f{name}", {"runs": 0, "seconds": 0.})
+        totals["runs"] += 1
+        totals["seconds"] += seconds
+
+
+# ------------------------ EXPORTS ----------------------------------
+def to_json() -> str:
+    state = _state()
+    return json.dumps({"page": state["page"], "sections": state["sections"]}, indent=1)
+
+
+def _label(value:str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus() -> str:
+    """Prometheus text exposition of the last run (gauges) and of the session (counters)."""
+    state = _state()
+    lines = []
+    gauges = [("covid_section_seconds", "seconds", "Wall time of the section during the last run."),
+              ("covid_section_allocated_bytes", "allocated_bytes", "Memory still allocated at the end of the section."),
+              ("covid_section_peak_bytes", "peak_bytes", "Peak of memory allocated during the section.")]
+    for metric, key, help_text in gauges:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        lines += [f'{metric}{{page="{_label(record["page"])}",section="{_label(record["section"])}"}} {record[key]}'
+                  for record in state["sections"]]
+    counters = [("covid_section_runs_total", "runs", "Runs of the section in this session."),
+                ("covid_section_seconds_total", "seconds", "Wall time of the section summed over this session.")]
+    for metric, key, help_text in counters:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for labels, totals in state["totals"].items():
+            page, name = labels.split("\x1f")
+            lines.append(f'{metric}{{page="{_label(page)}",section="{_label(name)}"}} {totals[key]}')
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------ SIDEBAR ----------------------------------
+def debug_panel() -> None:
+    """Sidebar with the sections of the run, to be called at the end of the script."""
+    state = _state()
+    if not state["enabled"]:
+        return
+    _stop_tracing(state)
+    if state["profiler"] is not None:
+        state["profiler"].disable()
+        output = io.StringIO()
+        pstats.Stats(state["profiler"], stream=output).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        state.update(profiler=None, profile=output.getvalue())
+    with st.sidebar:
+        st.markdown("### Debug")
+        st.toggle("cProfile à chaque exécution", key="_instrument_cprofile")
+        table = pd.DataFrame(state["sections"], columns=["section", "seconds", "allocated_bytes", "peak_bytes"])
+        table[["allocated_bytes", "peak_bytes"]] = table[["allocated_bytes", "peak_bytes"]] / 2 ** 20
+        st.dataframe(table.rename(columns={"allocated_bytes": "allocated (MB)", "peak_bytes": "peak (MB)"}),
+                     hide_index=True)
+        st.caption(f"Total : {table['seconds'].sum():.3f} s")
+        st.download_button("Exporter (JSON)", data=to_json(), file_name=f"{state['page']}_sections.json")
+        st.download_button("Exporter (Prometheus)", data=to_prometheus(), file_name=f"{state['page']}_sections.prom")
+        if state["profile"]:
+            with st.expander("cProfile de la dernière exécution"):
+                st.code(state["profile"])
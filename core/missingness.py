@@ -0,0 +1,104 @@
+"""Missingness map of the dataset.
+
+``px.imshow(df)`` ships the whole patients x columns matrix to the browser. The
+NaN mask is kept here as packed bits (8 patients per byte), rows are
+aggregated into as many bins as the figure has pixels of height and the
+result is rendered server-side as a PNG embedded in a plotly figure: the
+payload depends on the figure size, not on the number of patients. The
+patients are in the order of the source file.
+"""
+import base64
+import functools
+import io
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from PIL import Image, ImageColor
+
+from core.data import dataset_version, load_dataset, source_order
+
+# rows unpacked at once when binning, a multiple of 8
+_CHUNK_ROWS:int = 1 << 16
+
+
+class MissingnessMap:
+    """NaN mask of a frame stored as bits packed along the rows."""
+
+    def __init__(self, bits:np.ndarray, n_rows:int, columns:Sequence[str]):
+        self.bits = bits
+        self.n_rows = n_rows
+        self.columns = list(columns)
+
+    @classmethod
+    def from_frame(cls, df:pd.DataFrame, order:np.ndarray = None) -> "MissingnessMap":
+        """Map of the rows of ``df``, taken in the order of the positions ``order`` if given."""
+        missing = df.isna().to_numpy()
+        return cls(np.packbits(missing if order is None else missing[order], axis=0), df.shape[0], df.columns)
+
+    def select(self, columns:Sequence[str]) -> "MissingnessMap":
+        index = pd.Index(self.columns).get_indexer(columns)
+        return MissingnessMap(self.bits[:, index], self.n_rows, columns)
+
+    def binned(self, n_bins:int) -> np.ndarray:
+        """Share of NaN per column in ``n_bins`` consecutive bins of rows."""
+        n_bins = max(1, min(n_bins, self.n_rows))
+        edges = np.linspace(0, self.n_rows, n_bins + 1).round().astype(np.int64)
+        # number of NaN before each edge, from cumulative sums over unpacked chunks
+        counts = np.zeros((n_bins + 1, len(self.columns)), dtype=np.int64)
+        total = np.zeros(len(self.columns), dtype=np.int64)
+        for start in range(0, self.n_rows, _CHUNK_ROWS):
+            stop = min(start + _CHUNK_ROWS, self.n_rows)
+            chunk = np.unpackbits(self.bits[start // 8:(stop + 7) // 8], axis=0, count=stop - start)
+            cumulative = np.cumsum(chunk, axis=0, dtype=np.int64)
+            inside = (edges > start) & (edges <= stop)
+            counts[inside] = total + cumulative[edges[inside] - start - 1]
+            total += cumulative[-1]
+        sizes = np.diff(edges)[:, None]
+        return np.diff(counts, axis=0) / np.maximum(sizes, 1)
+
+    def render_png(self, n_bins:int, column_width:int, colors:Tuple[str, str]) -> bytes:
+        """PNG of the binned map, ``colors`` are the (existing, missing) colors."""
+        present, missing = (np.array(ImageColor.getrgb(color), dtype=np.float64) for color in colors)
+        share = self.binned(n_bins)[:, :, None]
+        pixels = (present + share * (missing - present)).round().astype(np.uint8)
+        pixels = np.repeat(pixels, column_width, axis=1)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels, "RGB").save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue()
+
+
+@functools.lru_cache(maxsize=1)
+def _load_missingness_map(version:str) -> MissingnessMap:
+    return MissingnessMap.from_frame(load_dataset(), source_order())
+
+
+def load_missingness_map(columns:List[str] = None) -> MissingnessMap:
+    """Missingness map of the current dataset, computed once per dataset version."""
+    na_map = _load_missingness_map(dataset_version())
+    return na_map if columns is None else na_map.select(columns)
+
+
+@functools.lru_cache(maxsize=16)
+def _png(version:str, columns:Tuple[str, ...], n_bins:int, column_width:int, colors:Tuple[str, str]) -> bytes:
+    return load_missingness_map(list(columns) if columns else None).render_png(n_bins, column_width, colors)
+
+
+def missingness_figure(columns:List[str] = None, width:int = 900, height:int = 900,
+                       colors:Tuple[str, str] = ("blue", "white")) -> go.Figure:
+    """Figure of the missingness map of ``columns`` (all by default).
+
+    The map is pre-rendered at the figure size, one bin of patients per pixel of
+    height, and cached per dataset version.
+    """
+    na_map = load_missingness_map(columns)
+    column_width = max(1, width // max(len(na_map.columns), 1))
+    n_bins = max(1, min(height, na_map.n_rows))
+    source = "data:image/png;base64," + base64.b64encode(_png(dataset_version(), tuple(columns or ()), n_bins, column_width, tuple(colors))).decode()
+    fig = go.Figure(go.Image(source=source, x0=-.5 + .5 / column_width, dx=1 / column_width,
+                             y0=0, dy=na_map.n_rows / n_bins, hoverinfo="skip"))
+    fig.update_layout(width=width, height=height, xaxis=dict(tickmode="array", tickvals=list(range(len(na_map.columns))),
+                                                            ticktext=na_map.columns, tickangle=-90),
+                      yaxis=dict(title="patients"))
+    return fig
@@ -0,0 +1,168 @@
+"""COVID-19 diagnosis model.
+
+A scikit-learn pipeline trained on the columns of ``cleaned_df`` to predict
+``SARS-Cov-2 exam result``. It is saved with its metadata as a versioned
+joblib artifact, loaded once per process and applied to whole frames at once
+by :func:`predict_batch`.
+
+Train it with::
+
+    python -m core.model [--output models/covid_diagnosis.joblib]
+
+Training takes a while and is never done by the app itself: without an
+artifact, :func:`load_model` fails with a message asking for the command above.
+"""
+import argparse
+import datetime
+import functools
+import os
+import threading
+from typing import Dict, List, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.metrics import f1_score, recall_score, roc_auc_score
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+from core import config
+from core.data import dataset_version, load_dataset
+from core.profile import DatasetProfile, load_profile
+
+# bump when the content of the artifact changes
+ARTIFACT_FORMAT:int = 2
+POSITIVE:str = "positive"
+
+_lock = threading.Lock()
+
+
+def feature_columns(profile:DatasetProfile) -> Tuple[List[str], List[str]]:
+    """Numeric and categorical features: the columns of ``cleaned_df`` known when the test is prescribed.
+
+    The target, the patient id and the admission flags (an outcome of the
+    hospital stay) are left out.
+    """
+    excluded = {config.TARGET, config.PATIENT_ID, *config.ADMISSION_COLUMNS}
+    categorical = [column for column in profile.categorical_columns if column not in excluded]
+    numeric = [column for column in profile.cleaned_columns if column not in excluded and column not in categorical]
+    return numeric, categorical
+
+
+def build_pipeline(numeric:List[str], categorical:List[str]) -> Pipeline:
+    """Preprocessing and classifier. Gradient boosting handles the NaN of the lab values natively."""
+    preprocessing = ColumnTransformer([
+        ("numeric", "passthrough", numeric),
+        ("categorical", OneHotEncoder(handle_unknown="ignore", sparse_output=False), categorical),
+    ])
+    classifier = HistGradientBoostingClassifier(class_weight="balanced", random_state=0)
+    return Pipeline([("preprocessing", preprocessing), ("classifier", classifier)])
+
+
+def as_features(frame:pd.DataFrame, numeric:List[str], categorical:List[str]) -> pd.DataFrame:
+    """Columns of the model in their training order, the missing ones filled with NaN."""
+    features = frame.reindex(columns=numeric + categorical)
+    features[numeric] = features[numeric].apply(pd.to_numeric, errors="coerce").astype("float64")
+    features[categorical] = features[categorical].astype(object).where(features[categorical].notna(), np.nan)
+    return features
+
+
+def train(df:pd.DataFrame = None, profile:DatasetProfile = None) -> Dict:
+    """Train the model and return the artifact: ``{"pipeline": ..., "metadata": ...}``.
+
+    The pipeline is fitted on 80% of the patients; the metrics of the metadata
+    are measured on the stratified 20% hold-out, whose rows (index labels of
+    the dataset, i.e. positions in the source) are kept in ``holdout_rows`` so
+    that examples can be drawn from patients the model never saw.
+    """
+    df = load_dataset() if df is None else df
+    profile = load_profile() if profile is None else profile
+    numeric, categorical = feature_columns(profile)
+    features, target = as_features(df, numeric, categorical), (df[config.TARGET] == POSITIVE).astype(int)
+    x_train, x_test, y_train, y_test = train_test_split(features, target, test_size=.2, stratify=target, random_state=0)
+    pipeline = build_pipeline(numeric, categorical).fit(x_train, y_train)
+    probability = pipeline.predict_proba(x_test)[:, 1]
+    metrics = {
+        "recall": float(recall_score(y_test, probability >= .5)),
+        "f1": float(f1_score(y_test, probability >= .5)),
+        "roc_auc": float(roc_auc_score(y_test, probability)),
+    }
+    trained_at = datetime.datetime.now(datetime.timezone.utc)
+    metadata = {
+        "version": f"{ARTIFACT_FORMAT}.{trained_at:%Y%m%d%H%M%S}",
+        "artifact_format": ARTIFACT_FORMAT,
+        "dataset_version": dataset_version(),
+        "trained_at": trained_at.isoformat(timespec="seconds"),
+        "sklearn_version": sklearn.__version__,
+        "numeric_features": numeric,
+        "categorical_features": categorical,
+        "threshold": .5,
+        "n_patients": int(df.shape[0]),
+        "n_train": int(x_train.shape[0]),
+        "holdout_rows": [int(row) for row in x_test.index],
+        "metrics": metrics,
+    }
+    return {"pipeline": pipeline, "metadata": metadata}
+
+
+def save_model(artifact:Dict, path:str = None) -> str:
+    path = path or config.MODEL_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(artifact, tmp)
+    os.replace(tmp, path)
+    return path
+
+
+@functools.lru_cache(maxsize=1)
+def _load_model(path:str, mtime_ns:int) -> Dict:
+    artifact = joblib.load(path)
+    if artifact["metadata"]["artifact_format"] != ARTIFACT_FORMAT:
+        raise ValueError(f"{path} has artifact format {artifact['metadata']['artifact_format']}, expected {ARTIFACT_FORMAT}: retrain the model")
+    return artifact
+
+
+def load_model(path:str = None) -> Dict:
+    """Artifact of the model, loaded once per process (and again when the file changes).
+
+    ``FileNotFoundError`` when it hasn't been trained yet.
+    """
+    path = path or config.MODEL_PATH
+    with _lock:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"no model at {path}: train it first with `python -m core.model --output {path}`")
+        return _load_model(path, os.stat(path).st_mtime_ns)
+
+
+def predict_batch(frame:pd.DataFrame, path:str = None) -> pd.DataFrame:
+    """Probability of a positive test and predicted result for every patient of ``frame``.
+
+    ``frame`` only needs the feature columns, the missing ones count as NaN.
+    The result has the index of ``frame``.
+    """
+    artifact = load_model(path)
+    metadata = artifact["metadata"]
+    features = as_features(frame, metadata["numeric_features"], metadata["categorical_features"])
+    probability = artifact["pipeline"].predict_proba(features)[:, 1]
+    return pd.DataFrame({
+        "probability": probability,
+        "prediction": np.where(probability >= metadata["threshold"], POSITIVE, "negative"),
+    }, index=frame.index)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the COVID-19 diagnosis model.")
+    parser.add_argument("--output", default=config.MODEL_PATH)
+    args = parser.parse_args()
+    artifact = train()
+    path = save_model(artifact, args.output)
+    metadata = artifact["metadata"]
+    print(f"{path} (version {metadata['version']}): " + ", ".join(f"{name}={value:.3f}" for name, value in metadata["metrics"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Model selection for the diagnosis model.
+
+Stratified cross-validation with a grid or random search over several
+scikit-learn estimators. Every (estimator, parameters, fold) fit runs as its
+own task on all the cores and is cached on disk under
+``<CACHE_DIR>/model_selection/``, keyed by the hash of the data, of the
+pipeline, of the parameters and the scikit-learn version: an interrupted
+search, or one extended with new candidates, only fits what is missing.
+
+    python -m core.model_selection [--search random --n-iter 10] [--folds 5] [--jobs -1]
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.base import BaseEstimator, clone
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import f1_score, recall_score, roc_auc_score
+from sklearn.model_selection import ParameterGrid, ParameterSampler, StratifiedKFold
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from core import config
+from core.data import load_dataset
+from core.model import POSITIVE, as_features, build_pipeline, feature_columns
+from core.profile import load_profile
+
+
+def _imputed_pipeline(classifier, numeric:List[str], categorical:List[str]) -> Pipeline:
+    """Pipeline for the estimators which don't accept NaN."""
+    preprocessing = ColumnTransformer([
+        ("numeric", make_pipeline(SimpleImputer(strategy="median", add_indicator=True), StandardScaler()), numeric),
+        ("categorical", OneHotEncoder(handle_unknown="ignore", sparse_output=False), categorical),
+    ])
+    return Pipeline([("preprocessing", preprocessing), ("classifier", classifier)])
+
+
+def candidates(numeric:List[str], categorical:List[str]) -> Dict[str, tuple]:
+    """Estimators to compare with their hyperparameter space, ``name -> (pipeline, space)``."""
+    return {
+        "hist_gradient_boosting": (build_pipeline(numeric, categorical), {
+            "classifier__learning_rate": [.03, .1, .3],
+            "classifier__max_depth": [None, 3, 6],
+            "classifier__l2_regularization": [0., 1.],
+        }),
+        "random_forest": (_imputed_pipeline(RandomForestClassifier(class_weight="balanced", n_jobs=1, random_state=0), numeric, categorical), {
+            "classifier__n_estimators": [100, 300],
+            "classifier__max_depth": [None, 8],
+            "classifier__min_samples_leaf": [1, 5],
+        }),
+        "logistic_regression": (_imputed_pipeline(LogisticRegression(class_weight="balanced", max_iter=2000), numeric, categorical), {
+            "classifier__C": [.01, .1, 1., 10.],
+        }),
+    }
+
+
+def data_hash(features:pd.DataFrame, target:pd.Series) -> str:
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(features, index=False).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(target, index=False).to_numpy().tobytes())
+    digest.update(json.dumps(list(features.columns)).encode())
+    return digest.hexdigest()[:16]
+
+
+def pipeline_fingerprint(pipeline:Pipeline) -> str:
+    """Hash of every parameter of ``pipeline``, nested estimators and column lists included.
+
+    ``repr(pipeline)`` is shortened by scikit-learn for long pipelines, so the
+    deep parameters are hashed instead; estimators are described by their class,
+    their own parameters being listed too.
+    """
+    params = {name: type(value).__qualname__ if isinstance(value, BaseEstimator) else repr(value)
+              for name, value in pipeline.get_params(deep=True).items()}
+    payload = json.dumps({"class": type(pipeline).__qualname__, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def _cache_path(cache_dir:str, key:Dict) -> str:
+    payload = json.dumps(key, sort_keys=True, default=str)
+    return os.path.join(cache_dir, hashlib.sha256(payload.encode()).hexdigest())
+
+
+def _fit_fold(pipeline:Pipeline, params:Dict, features:pd.DataFrame, target:pd.Series,
+              train:np.ndarray, test:np.ndarray, path:str) -> Dict:
+    """Fit one fold, or read it from the cache, and return its scores."""
+    if os.path.exists(path + ".json"):
+        with open(path + ".json") as f:
+            return dict(json.load(f), cached=True)
+    model = clone(pipeline).set_params(**params)
+    start = time.perf_counter()
+    model.fit(features.iloc[train], target.iloc[train])
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    probability = model.predict_proba(features.iloc[test])[:, 1]
+    predict_time = time.perf_counter() - start
+    y_test = target.iloc[test]
+    scores = {
+        "recall": float(recall_score(y_test, probability >= .5)),
+        "f1": float(f1_score(y_test, probability >= .5)),
+        "roc_auc": float(roc_auc_score(y_test, probability)),
+        "fit_time": fit_time,
+        "fit_rows_per_s": len(train) / fit_time,
+        "predict_rows_per_s": len(test) / max(predict_time, 1e-9),
+    }
+    joblib.dump(model, path + ".joblib")
+    # the scores are written last: they mark the fold as done
+    with open(path + ".json.tmp", "w") as f:
+        json.dump(scores, f)
+    os.replace(path + ".json.tmp", path + ".json")
+    return dict(scores, cached=False)
+
+
+def run_search(search:str = "grid", n_iter:int = 10, n_splits:int = 5, n_jobs:int = -1, names:List[str] = None,
+               random_state:int = 0, cache_dir:str = None) -> pd.DataFrame:
+    """Cross-validate every candidate and return one row per (estimator, parameters), best ROC AUC first."""
+    cache_dir = cache_dir or os.path.join(config.CACHE_DIR, "model_selection")
+    os.makedirs(cache_dir, exist_ok=True)
+    df = load_dataset()
+    numeric, categorical = feature_columns(load_profile())
+    features = as_features(df, numeric, categorical)
+    target = (df[config.TARGET] == POSITIVE).astype(int)
+    dataset = data_hash(features, target)
+    folds = list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(features, target))
+
+    tasks = []
+    for name, (pipeline, space) in candidates(numeric, categorical).items():
+        if names and name not in names:
+            continue
+        if search == "grid":
+            grid = list(ParameterGrid(space))
+        else:
+            grid = list(ParameterSampler(space, n_iter=min(n_iter, len(ParameterGrid(space))), random_state=random_state))
+        fingerprint = pipeline_fingerprint(pipeline)
+        for params in grid:
+            for fold, (train, test) in enumerate(folds):
+                key = {"data": dataset, "estimator": name, "pipeline": fingerprint, "sklearn": sklearn.__version__,
+                       "params": params, "fold": fold, "n_splits": n_splits, "random_state": random_state}
+                tasks.append((name, params, fold, pipeline, train, test, _cache_path(cache_dir, key)))
+
+    start = time.perf_counter()
+    scores = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(_fit_fold)(pipeline, params, features, target, train, test, path)
+        for _, params, _, pipeline, train, test, path in tasks)
+    wall_clock = time.perf_counter() - start
+
+    rows = pd.DataFrame([dict(score, estimator=name, params=json.dumps(params, sort_keys=True), fold=fold)
+                         for (name, params, fold, *_), score in zip(tasks, scores)])
+    report = rows.groupby(["estimator", "params"]).agg(
+        roc_auc=("roc_auc", "mean"), roc_auc_std=("roc_auc", "std"), recall=("recall", "mean"), f1=("f1", "mean"),
+        fit_time=("fit_time", "sum"), fit_rows_per_s=("fit_rows_per_s", "mean"),
+        predict_rows_per_s=("predict_rows_per_s", "mean"), cached_folds=("cached", "sum"))
+    report.attrs["wall_clock"] = wall_clock
+    return report.sort_values("roc_auc", ascending=False).reset_index()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cross-validated hyperparameter search for the diagnosis model.")
+    parser.add_argument("--search", choices=("grid", "random"), default="grid")
+    parser.add_argument("--n-iter", type=int, default=10, help="candidates per estimator for the random search")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=-1, help="parallel fits (-1: all cores)")
+    parser.add_argument("--estimators", nargs="*", help="restrict the search to these estimators")
+    parser.add_argument("--output", help="CSV report")
+    args = parser.parse_args()
+    report = run_search(args.search, args.n_iter, args.folds, args.jobs, args.estimators)
+    with pd.option_context("display.max_colwidth", 80, "display.width", 200):
+        print(report.to_string(index=False))
+    print(f"\n{len(report)} candidates in {report.attrs['wall_clock']:.1f}s")
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
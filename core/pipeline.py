@@ -0,0 +1,151 @@
+"""Dependency-tracked derived artifacts.
+
+A :class:`Pipeline` is a graph of named nodes; each node is a function of the
+values of its dependencies and of explicit parameters (the NaN rate
+thresholds...). A node is memoized by the hash of its inputs: its parameters
+and the fingerprints of its dependencies. The fingerprint of a small value
+(column lists, NaN rates...) is the hash of its content, so when a threshold
+changes only the nodes whose inputs actually differ are recomputed; the
+fingerprint of a large value (frames of the dataset) is the key it was
+computed from. Source nodes are fingerprinted by a version function, e.g. the
+content hash of the dataset.
+
+    pipeline = Pipeline({"cutoff": .9})
+
+    @pipeline.source(version=dataset_version)
+    def dataset():
+        return load_dataset()
+
+    @pipeline.node(deps=("dataset",), params=("cutoff",))
+    def cleaned_columns(dataset, cutoff):
+        ...
+
+    pipeline.get("cleaned_columns", cutoff=.8)
+"""
+import collections
+import hashlib
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+import pandas as pd
+
+# pandas objects up to this size are fingerprinted by their content
+FINGERPRINT_MAX_CELLS:int = 100_000
+# memoized values kept per node, least recently used first out: sessions on
+# different thresholds share the cache without evicting each other's values
+MAX_ENTRIES_PER_NODE:int = 8
+
+
+class Node(NamedTuple):
+    name:str
+    function:Callable
+    deps:Tuple[str, ...]
+    params:Tuple[str, ...]
+    version:Callable[[], str]
+
+
+def _hash(value) -> str:
+    return hashlib.sha256(repr(value).encode()).hexdigest()
+
+
+def fingerprint(value:Any, key:str) -> str:
+    """Hash of the content of small values, ``key`` for the others."""
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return _hash(value)
+    if isinstance(value, (list, tuple)) and all(isinstance(item, (str, int, float, bool, type(None), tuple)) for item in value):
+        return _hash(list(value))
+    if isinstance(value, (pd.Series, pd.DataFrame)) and value.size <= FINGERPRINT_MAX_CELLS:
+        digest = hashlib.sha256(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        # the hash of the rows ignores the names and the dtypes of the columns
+        digest.update(repr(value.dtypes if isinstance(value, pd.DataFrame) else (value.name, value.dtype)).encode())
+        return digest.hexdigest()
+    return key
+
+
+class Pipeline:
+    """Graph of memoized nodes, shared by every session of the process."""
+
+    def __init__(self, params:Dict[str, Any]):
+        self.params = dict(params)
+        self.nodes:Dict[str, Node] = {}
+        self.computed = collections.Counter()
+        self._memo:Dict[str, Tuple[Any, str]] = {}
+        # keys of the memoized values of each node, least recently used first
+        self._keys:Dict[str, collections.OrderedDict] = collections.defaultdict(collections.OrderedDict)
+        # one lock per key being computed: a value is computed once, concurrent sessions wait for it
+        self._key_locks:Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------ DECLARATION ----------------------------------
+    def _add(self, function:Callable, deps, params, version) -> Callable:
+        unknown = [param for param in params if param not in self.params]
+        if unknown:
+            raise ValueError(f"{function.__name__}: unknown parameters {unknown}")
+        missing = [dep for dep in deps if dep not in self.nodes]
+        if missing:
+            raise ValueError(f"{function.__name__}: unknown dependencies {missing}, declare them first")
+        self.nodes[function.__name__] = Node(function.__name__, function, tuple(deps), tuple(params), version)
+        return function
+
+    def source(self, version:Callable[[], str]):
+        """Node without dependencies, recomputed when ``version()`` changes."""
+        return lambda function: self._add(function, (), (), version)
+
+    def node(self, deps=(), params=()):
+        return lambda function: self._add(function, deps, params, None)
+
+    # ------------------------ RESOLUTION ----------------------------------
+    def _resolve(self, name:str, params:Dict[str, Any], resolved:Dict[str, Tuple[Any, str]]) -> Tuple[Any, str]:
+        if name in resolved:
+            return resolved[name]
+        node = self.nodes[name]
+        inputs = {dep: self._resolve(dep, params, resolved) for dep in node.deps}
+        key = _hash((name, node.version() if node.version else None,
+                     [(param, params[param]) for param in node.params],
+                     [(dep, inputs[dep][1]) for dep in node.deps]))
+        entry = self._lookup(name, key)
+        if entry is None:
+            with self._lock:
+                key_lock = self._key_locks.setdefault(key, threading.Lock())
+            try:
+                with key_lock:
+                    entry = self._lookup(name, key)
+                    if entry is None:
+                        value = node.function(**{dep: value for dep, (value, _) in inputs.items()},
+                                              **{param: params[param] for param in node.params})
+                        entry = (value, fingerprint(value, key))
+                        self._store(name, key, entry)
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+        resolved[name] = entry
+        return entry
+
+    def _lookup(self, name:str, key:str) -> Tuple[Any, str]:
+        with self._lock:
+            entry = self._memo.get(key)
+            if entry is not None:
+                self._keys[name].move_to_end(key)
+            return entry
+
+    def _store(self, name:str, key:str, entry:Tuple[Any, str]) -> None:
+        with self._lock:
+            self.computed[name] += 1
+            self._memo[key] = entry
+            keys = self._keys[name]
+            keys[key] = None
+            keys.move_to_end(key)
+            while len(keys) > MAX_ENTRIES_PER_NODE:
+                self._memo.pop(keys.popitem(last=False)[0], None)
+
+    def resolve(self, names:List[str], **params) -> Tuple:
+        """Values of ``names``, parameters overriding the defaults of the pipeline."""
+        unknown = [param for param in params if param not in self.params]
+        if unknown:
+            raise ValueError(f"unknown parameters {unknown}")
+        params = {**self.params, **params}
+        resolved = {}
+        return tuple(self._resolve(name, params, resolved)[0] for name in names)
+
+    def get(self, name:str, **params) -> Any:
+        return self.resolve([name], **params)[0]
@@ -0,0 +1,168 @@
+"""Column profile of the dataset.
+
+Every page used to rescan the whole frame with ``isna().sum()/shape[0]`` to
+derive ``cleaned_df``, ``viral_rate_columns``, ``blood_tests_columns``... The
+profile computes the NaN rate, dtype, cardinality, summary statistics and group
+of every column in one pass, once per dataset version, and the pages read
+their column lists from it (through the nodes of :mod:`core.artifacts`). The
+profile is read from the statistics store, so it follows the batches of
+patients ingested incrementally.
+"""
+import functools
+import warnings
+from typing import List
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+from core import config
+from core.data import dataset_version
+from core.stats_store import ALL, StatsStore, _load_stats_store
+
+# ------------------------ COLUMN GROUPS ----------------------------------
+GROUP_TARGET:str = "target"
+GROUP_VIRAL:str = "viral panel"
+GROUP_BLOOD:str = "blood test"
+GROUP_ADMISSION:str = "admission flag"
+GROUP_OTHER:str = "other"
+
+
+def nan_rate_filter(nan_rates:pd.Series, cutoff:float = None) -> List[str]:
+    """Columns of ``cleaned_df``: less than ``cutoff`` (``NAN_RATE_CUTOFF``) of NaN."""
+    cutoff = config.NAN_RATE_CUTOFF if cutoff is None else cutoff
+    return list(nan_rates.index[nan_rates < cutoff])
+
+
+def _between(rates:pd.Series, bounds) -> pd.Series:
+    low, high = bounds
+    return (rates > low) & (rates < high)
+
+
+def numeric_dtypes(dtypes:pd.Series) -> pd.Series:
+    """Mask of the float columns, ``dtypes`` being the names of the dtypes."""
+    return dtypes.str.startswith("float")
+
+
+def categorical_dtypes(dtypes:pd.Series) -> pd.Series:
+    return ~dtypes.str.lower().str.startswith(("float", "int", "uint", "bool"))
+
+
+def cleaned_subset(cleaned_columns:List[str], mask:pd.Series) -> List[str]:
+    """Columns of ``cleaned_columns`` selected by ``mask``, ``Patient ID`` excluded."""
+    return [column for column in cleaned_columns if mask[column] and column != config.PATIENT_ID]
+
+
+def column_groups(nan_rates:pd.Series, viral_range=None, blood_range=None) -> pd.Series:
+    """Group of every column, the NaN rate ranges default to ``VIRAL_NAN_RANGE`` and ``BLOOD_NAN_RANGE``.
+
+    The ranges overlap: a column in both is a blood test.
+    """
+    return pd.Series(np.select(
+        [nan_rates.index == config.TARGET,
+         nan_rates.index.isin(config.ADMISSION_COLUMNS),
+         _between(nan_rates, blood_range or config.BLOOD_NAN_RANGE),
+         _between(nan_rates, viral_range or config.VIRAL_NAN_RANGE)],
+        [GROUP_TARGET, GROUP_ADMISSION, GROUP_BLOOD, GROUP_VIRAL],
+        GROUP_OTHER), index=nan_rates.index, name="group")
+
+
+class DatasetProfile:
+    """Per column profile, ``table`` is indexed by the columns of the dataset.
+
+    Its columns are ``NaN_rate``, ``dtype``, ``cardinality``, ``min``, ``max``,
+    ``mean``, ``std`` (NaN for the non numeric columns) and ``group``.
+    """
+
+    def __init__(self, table:pd.DataFrame):
+        self.table = table
+
+    @classmethod
+    def from_frame(cls, df:pd.DataFrame) -> "DatasetProfile":
+        numeric = [column for column in df.columns if is_numeric_dtype(df[column]) and df[column].dtype != bool]
+        values = df[numeric].to_numpy(dtype="float64")
+        table = pd.DataFrame({
+            "NaN_rate": df.isna().to_numpy().sum(axis=0) / max(df.shape[0], 1),
+            "dtype": df.dtypes.astype(str).to_numpy(),
+            "cardinality": df.nunique().to_numpy(),
+        }, index=df.columns)
+        with warnings.catch_warnings():
+            # all-NaN columns ("Mycoplasma pneumoniae"...) have no statistics
+            warnings.simplefilter("ignore", RuntimeWarning)
+            stats = pd.DataFrame({
+                "min": np.nanmin(values, axis=0),
+                "max": np.nanmax(values, axis=0),
+                "mean": np.nanmean(values, axis=0),
+                "std": np.nanstd(values, axis=0, ddof=1),
+            }, index=numeric)
+        return cls._grouped(table.join(stats))
+
+    @classmethod
+    def from_stats(cls, store:StatsStore) -> "DatasetProfile":
+        """Profile read from the running aggregates of a :class:`~core.stats_store.StatsStore`.
+
+        Nothing is rescanned, so the profile follows the batches folded into the
+        store. The cardinality is only known for the columns whose categories
+        are counted (not the floats), NaN otherwise.
+        """
+        columns = store.groups[ALL]
+        rows = {}
+        for column in store.columns:
+            stats = columns[column]
+            numeric = stats.sketch is not None and stats.count > 0
+            rows[column] = {
+                "NaN_rate": 1 - stats.count / max(store.n_rows, 1),
+                "dtype": store.dtypes[column],
+                "cardinality": len(stats.categories) if stats.categories is not None else np.nan,
+                "min": stats.min if numeric else np.nan,
+                "max": stats.max if numeric else np.nan,
+                "mean": stats.mean if numeric else np.nan,
+                "std": stats.std if numeric else np.nan,
+            }
+        return cls._grouped(pd.DataFrame.from_dict(rows, orient="index"))
+
+    @classmethod
+    def _grouped(cls, table:pd.DataFrame) -> "DatasetProfile":
+        table["group"] = column_groups(table["NaN_rate"])
+        return cls(table)
+
+    # ------------------------ COLUMN LISTS ----------------------------------
+    @property
+    def nan_rates(self) -> pd.Series:
+        return self.table["NaN_rate"]
+
+    @property
+    def cleaned_columns(self) -> List[str]:
+        """Columns of ``cleaned_df``, see :func:`nan_rate_filter`."""
+        return nan_rate_filter(self.nan_rates)
+
+    def group_columns(self, group:str) -> List[str]:
+        return cleaned_subset(self.cleaned_columns, self.table["group"] == group)
+
+    @property
+    def viral_rate_columns(self) -> List[str]:
+        return self.group_columns(GROUP_VIRAL)
+
+    @property
+    def blood_tests_columns(self) -> List[str]:
+        return self.group_columns(GROUP_BLOOD)
+
+    @property
+    def numeric_columns(self) -> List[str]:
+        """Float columns of ``cleaned_df`` (the standardized lab values)."""
+        return cleaned_subset(self.cleaned_columns, numeric_dtypes(self.table["dtype"]))
+
+    @property
+    def categorical_columns(self) -> List[str]:
+        """Non numeric columns of ``cleaned_df``, the target included."""
+        return cleaned_subset(self.cleaned_columns, categorical_dtypes(self.table["dtype"]))
+
+
+@functools.lru_cache(maxsize=1)
+def _load_profile(version:str) -> DatasetProfile:
+    return DatasetProfile.from_stats(_load_stats_store(version))
+
+
+def load_profile() -> DatasetProfile:
+    """Profile of the current dataset, computed once per dataset version."""
+    return _load_profile(dataset_version())
@@ -0,0 +1,88 @@
+"""WebGL scatter plots with server-side decimation.
+
+SVG scatter plots ship and draw every patient. Here the points are drawn with
+WebGL traces and, above ``SCATTER_MAX_POINTS``, thinned out on the server:
+each class keeps one point per cell of a grid over the plotted dimensions,
+plus every outlier, so the shape of each class and its extreme values stay
+visible whatever the number of patients.
+"""
+from typing import List
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from core import config
+
+# a point is an outlier when one of its coordinates is this many std away from the mean
+OUTLIER_Z:float = 3.
+
+
+def _one_per_cell(scaled:np.ndarray, classes:np.ndarray, cells_per_axis:int) -> np.ndarray:
+    """Mask keeping the first point of each class in each cell of a regular grid."""
+    cells = np.minimum((scaled * cells_per_axis).astype(np.int64), cells_per_axis - 1)
+    key = classes.astype(np.int64)
+    for axis in range(scaled.shape[1]):
+        key = key * cells_per_axis + cells[:, axis]
+    kept = np.zeros(scaled.shape[0], dtype=bool)
+    kept[np.unique(key, return_index=True)[1]] = True
+    return kept
+
+
+def decimate(df:pd.DataFrame, dimensions:List[str], color:str = None, max_points:int = None) -> pd.DataFrame:
+    """Rows of ``df`` to plot, at most about ``max_points`` plus the outliers.
+
+    Rows with a NaN coordinate can't be plotted and are dropped.
+    """
+    max_points = config.SCATTER_MAX_POINTS if max_points is None else max_points
+    dimensions = list(dict.fromkeys(dimensions))
+    df = df.dropna(subset=dimensions)
+    if df.shape[0] <= max_points:
+        return df
+    values = df[dimensions].to_numpy(dtype="float64")
+    low, high = values.min(axis=0), values.max(axis=0)
+    scaled = (values - low) / np.where(high > low, high - low, 1.)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.abs((values - values.mean(axis=0)) / values.std(axis=0))
+    outliers = (z > OUTLIER_Z).any(axis=1)
+    classes = pd.factorize(df[color], use_na_sentinel=False)[0] if color else np.zeros(df.shape[0], dtype=np.int64)
+    # one point per (class, cell), the grid gets coarser until the budget is met
+    cells_per_axis = max(2, int(round(max_points ** (1 / len(dimensions)))))
+    while True:
+        kept = _one_per_cell(scaled, classes, cells_per_axis)
+        if kept.sum() <= max_points or cells_per_axis <= 2:
+            break
+        cells_per_axis //= 2
+    # outliers are sparse: a finer grid keeps most of them
+    outliers[outliers] = _one_per_cell(scaled[outliers], classes[outliers], cells_per_axis * 4)
+    return df[kept | outliers]
+
+
+def _annotate(fig:go.Figure, shown:int, total:int) -> go.Figure:
+    """Tell below the figure how many points were kept."""
+    if shown < total:
+        fig.add_annotation(text=f"{shown} points affichés sur {total}", showarrow=False,
+                           xref="paper", yref="paper", x=1, y=-.12, xanchor="right")
+    return fig
+
+
+def scatter_figure(df:pd.DataFrame, x:str, y:str, color:str = None, max_points:int = None, **kwargs) -> go.Figure:
+    """``px.scatter`` drawn with WebGL on the decimated rows."""
+    data = decimate(df, [x, y], color, max_points)
+    fig = px.scatter(data, x=x, y=y, color=color, render_mode="webgl", **kwargs)
+    return _annotate(fig, data.shape[0], df.dropna(subset=[x, y]).shape[0])
+
+
+def scatter_matrix_figure(df:pd.DataFrame, dimensions:List[str], color:str = None, max_points:int = None, **kwargs) -> go.Figure:
+    """``px.scatter_matrix`` (a WebGL splom) on the decimated rows."""
+    data = decimate(df, dimensions, color, max_points)
+    fig = px.scatter_matrix(data, dimensions=dimensions, color=color, **kwargs)
+    return _annotate(fig, data.shape[0], df.dropna(subset=dimensions).shape[0])
+
+
+def scatter_3d_figure(df:pd.DataFrame, x:str, y:str, z:str, color:str = None, max_points:int = None, **kwargs) -> go.Figure:
+    """``px.scatter_3d`` (WebGL) on the decimated rows."""
+    data = decimate(df, [x, y, z], color, max_points)
+    fig = px.scatter_3d(data, x=x, y=y, z=z, color=color, **kwargs)
+    return _annotate(fig, data.shape[0], df.dropna(subset=[x, y, z]).shape[0])
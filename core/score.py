@@ -0,0 +1,143 @@
+"""Batch scoring of large patient files with the diagnosis model.
+
+The input (CSV or Parquet) is streamed in chunks, only the feature columns of
+the model are read, chunks are scored on a pool of worker processes and the
+predictions are written as soon as they are ready, in input order. At most
+two chunks per worker are in flight, so memory stays flat whatever the size
+of the file. An input without patients gives an output without rows: the
+header of the CSV, or a Parquet file with the schema of the predictions.
+
+    python -m core.score patients.parquet predictions.parquet [--chunksize 50000] [--jobs 4]
+
+The features are the ones the model was trained on, i.e. the columns kept by
+the NaN rate filter of ``cleaned_df`` (see :func:`core.model.feature_columns`).
+"""
+import argparse
+import collections
+import concurrent.futures
+import os
+import time
+from typing import Iterator, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from core import config
+from core.model import load_model, predict_batch
+
+_model_path = {}
+
+
+def _init_worker(model_path:str) -> None:
+    _model_path["path"] = model_path
+    load_model(model_path)
+
+
+def _score(chunk:pd.DataFrame, id_column:str) -> pd.DataFrame:
+    predictions = predict_batch(chunk, _model_path["path"])
+    if id_column in chunk.columns:
+        predictions.insert(0, id_column, chunk[id_column].to_numpy())
+    return predictions
+
+
+def _is_parquet(path:str) -> bool:
+    return path.endswith((".parquet", ".pq"))
+
+
+def read_chunks(path:str, columns:List[str], chunksize:int) -> Iterator[pd.DataFrame]:
+    """Chunks of ``path`` restricted to the ``columns`` it has."""
+    wanted = set(columns)
+    if _is_parquet(path):
+        parquet = pq.ParquetFile(path)
+        present = [name for name in parquet.schema_arrow.names if name in wanted]
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=present):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=lambda name: name in wanted, chunksize=chunksize, low_memory=False)
+
+
+def output_schema(input_path:str, id_column:str) -> pa.Schema:
+    """Columns of the predictions of ``input_path``: its ``id_column`` if it has one, the probability and the prediction."""
+    if _is_parquet(input_path):
+        schema = pq.ParquetFile(input_path).schema_arrow
+        fields = [schema.field(id_column)] if id_column in schema.names else []
+    else:
+        fields = [pa.field(id_column, pa.string())] if id_column in pd.read_csv(input_path, nrows=0).columns else []
+    return pa.schema(fields + [pa.field("probability", pa.float64()), pa.field("prediction", pa.string())])
+
+
+class _Writer:
+    """Writes the scored chunks one after the other, CSV or Parquet depending on the extension."""
+
+    def __init__(self, path:str):
+        self.path = path
+        self.parquet = None
+        self.rows = 0
+
+    def write(self, chunk:pd.DataFrame) -> None:
+        if _is_parquet(self.path):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self.parquet is None:
+                self.parquet = pq.ParquetWriter(self.path, table.schema)
+            self.parquet.write_table(table)
+        else:
+            chunk.to_csv(self.path, mode="w" if self.rows == 0 else "a", header=self.rows == 0, index=False)
+        self.rows += chunk.shape[0]
+
+    def write_empty(self, schema:pa.Schema) -> None:
+        """Output without any row: the header of the CSV or the schema of the Parquet file."""
+        if _is_parquet(self.path):
+            pq.write_table(schema.empty_table(), self.path)
+        else:
+            schema.empty_table().to_pandas().to_csv(self.path, index=False)
+
+    def close(self) -> None:
+        if self.parquet is not None:
+            self.parquet.close()
+
+
+def score_file(input_path:str, output_path:str, chunksize:int = 50000, n_jobs:int = None,
+               model_path:str = None, id_column:str = config.PATIENT_ID) -> int:
+    """Score every patient of ``input_path`` into ``output_path``, return the number of patients."""
+    model_path = model_path or config.MODEL_PATH
+    metadata = load_model(model_path)["metadata"]
+    columns = [id_column] + metadata["numeric_features"] + metadata["categorical_features"]
+    n_jobs = n_jobs or os.cpu_count()
+    writer = _Writer(output_path)
+    pending = collections.deque()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                                    initargs=(model_path,)) as pool:
+            for chunk in read_chunks(input_path, columns, chunksize):
+                if chunk.empty:
+                    continue
+                pending.append(pool.submit(_score, chunk, id_column))
+                if len(pending) >= 2 * n_jobs:
+                    writer.write(pending.popleft().result())
+            while pending:
+                writer.write(pending.popleft().result())
+        if writer.rows == 0:
+            writer.write_empty(output_schema(input_path, id_column))
+    finally:
+        writer.close()
+    return writer.rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Score a CSV or Parquet file of patients with the diagnosis model.")
+    parser.add_argument("input", help="CSV or Parquet file of lab results")
+    parser.add_argument("output", help="CSV or Parquet file of predictions")
+    parser.add_argument("--chunksize", type=int, default=50000, help="patients per chunk")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (all cores by default)")
+    parser.add_argument("--model", default=config.MODEL_PATH, help="model artifact")
+    parser.add_argument("--id-column", default=config.PATIENT_ID, help="column copied to the output to identify patients")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    rows = score_file(args.input, args.output, args.chunksize, args.jobs, args.model, args.id_column)
+    elapsed = time.perf_counter() - start
+    print(f"{rows} patients scored in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} patients/s) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
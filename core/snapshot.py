@@ -0,0 +1,434 @@
+"""Columnar snapshot of the dataset.
+
+Parsing ``dataset.xlsx`` with openpyxl takes seconds. The snapshot is an
+uncompressed Arrow IPC file built once from the xlsx: it is opened through a
+memory map, so loading it costs almost nothing and the numeric columns of the
+frame point directly into the OS page cache, shared by every server worker.
+
+The columns are stored in compact types (see :func:`compact`) and the rows are
+grouped by target, so that the pages slice each class without copying it. The
+position of each row in the source is kept in ``ROW_COLUMN``, which becomes
+the index of the frames read back: the source order is restored for display
+(see :func:`core.data.source_order`).
+
+The file carries a schema version and the sha256 of the source it was built
+from; it is rebuilt only when one of them changes.
+
+Build it ahead of time with::
+
+    python -m core.snapshot [path/or/url/of/dataset.xlsx]
+
+The source can also be a synthetic dataset written by :mod:`core.synthetic`.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from core import config
+
+# bump when the way the snapshot is built changes, it forces a rebuild
+SCHEMA_VERSION:int = 3
+SNAPSHOT_NAME:str = "dataset.arrow"
+# sources with this extension are Arrow IPC files already in the snapshot's types
+ARROW_EXTENSION:str = ".arrow"
+# batches of patients appended after the snapshot, see core.ingest
+BATCHES_DIR:str = "batches"
+MANIFEST_NAME:str = "manifest.json"
+# copies of the sources given as URLs
+DOWNLOADS_DIR:str = "downloads"
+# text columns with at most this many distinct values become categories (int8 codes)
+MAX_CATEGORY_LEVELS:int = 127
+# position of the row in the source (then in the order of appending), index of the frames
+ROW_COLUMN:str = "__row__"
+
+
+def _is_url(source:str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def fetch(source:str) -> str:
+    """Local path of the source, downloaded in the cache dir if it is a URL.
+
+    Each URL has its own file, named after the hash of the URL. Once the copy is
+    older than ``config.SOURCE_TTL_SECONDS`` the server is asked again with the
+    ``ETag`` and ``Last-Modified`` it sent, and the file is only downloaded
+    again when it changed. When the server can't be reached the copy is kept.
+    """
+    if not _is_url(source):
+        return source
+    directory = os.path.join(config.CACHE_DIR, DOWNLOADS_DIR)
+    extension = os.path.splitext(urllib.parse.urlparse(source).path)[1] or ".xlsx"
+    path = os.path.join(directory, hashlib.sha256(source.encode()).hexdigest()[:16] + extension)
+    validators = {}
+    if os.path.exists(path):
+        try:
+            with open(f"{path}.json", encoding="utf-8") as f:
+                validators = json.load(f)
+        except (OSError, ValueError):
+            validators = {}
+        if time.time() - validators.get("checked_at", 0) < config.SOURCE_TTL_SECONDS:
+            return path
+    request = urllib.request.Request(source)
+    if validators.get("etag"):
+        request.add_header("If-None-Match", validators["etag"])
+    if validators.get("last_modified"):
+        request.add_header("If-Modified-Since", validators["last_modified"])
+    os.makedirs(directory, exist_ok=True)
+    try:
+        with urllib.request.urlopen(request) as response, tempfile.NamedTemporaryFile(dir=directory, delete=False) as tmp:
+            shutil.copyfileobj(response, tmp)
+            validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+        os.replace(tmp.name, path)
+    except urllib.error.HTTPError as error:
+        if error.code != 304:
+            raise
+    except urllib.error.URLError:
+        if not os.path.exists(path):
+            raise
+    validators["checked_at"] = time.time()
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(validators, f)
+    os.replace(tmp, f"{path}.json")
+    return path
+
+
+def file_sha256(path:str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _to_array(column:pd.Series) -> pa.Array:
+    if column.dtype.kind == "f":
+        # NaN are kept as values instead of becoming arrow nulls: without a
+        # validity bitmap, to_pandas() can hand out views on the memory map
+        return pa.array(column.to_numpy(), from_pandas=False)
+    try:
+        return pa.array(column, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # a few sparse urine columns mix numbers and strings: stored as strings
+        return pa.array(column.map(lambda value: value if pd.isna(value) else str(value)), from_pandas=True)
+
+
+def compact(df:pd.DataFrame) -> pd.DataFrame:
+    """Smallest types holding the values of ``df``, rows grouped by target.
+
+    Text columns with few values (the viral panel: "detected", "not_detected"...)
+    become categories, the standardized lab values float32 and the integer
+    columns (admission flags, age quantile) the smallest integer type. The stable
+    sort by target keeps the order of the patients within each class, and the
+    index their position in ``df``.
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if values.dtype.kind == "f":
+            values = values.astype(np.float32)
+        elif values.dtype.kind in "iu":
+            values = pd.to_numeric(values, downcast="integer")
+        elif values.dtype == object:
+            # numbers mixed with strings are stored as strings, as in _to_array
+            values = values.map(lambda value: value if pd.isna(value) or isinstance(value, str) else str(value))
+            if values.nunique() <= MAX_CATEGORY_LEVELS:
+                values = values.astype("category")
+        columns[column] = values
+    return group_by_target(pd.DataFrame(columns, index=df.index))
+
+
+def group_by_target(df:pd.DataFrame) -> pd.DataFrame:
+    """Rows of ``df`` sorted (stable) by target, categories in lexical order, index kept."""
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) and not df[column].cat.categories.is_monotonic_increasing:
+            df[column] = df[column].cat.reorder_categories(df[column].cat.categories.sort_values())
+    if config.TARGET not in df.columns:
+        return df
+    return df.sort_values(config.TARGET, kind="stable")
+
+
+def _to_arrow(df:pd.DataFrame) -> pa.Table:
+    """Columns of ``df`` followed by its index, as ``ROW_COLUMN``."""
+    arrays = [_to_array(df[column]) for column in df.columns]
+    arrays.append(pa.array(df.index.to_numpy(dtype=np.int64)))
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in df.columns] + [ROW_COLUMN])
+
+
+def to_frame(table:pa.Table) -> pd.DataFrame:
+    """Frame of a table of the store (zero-copy where possible), ``ROW_COLUMN`` as index."""
+    df = table.to_pandas(split_blocks=True)
+    if ROW_COLUMN in df.columns:
+        df.index = pd.Index(df.pop(ROW_COLUMN).to_numpy())
+    return df
+
+
+def read_schema(path:str) -> pa.Schema:
+    """Schema of the columns of the dataset in a snapshot, without ``ROW_COLUMN`` nor metadata."""
+    schema = pa.ipc.open_file(pa.memory_map(path)).schema.remove_metadata()
+    return schema.remove(schema.get_field_index(ROW_COLUMN)) if ROW_COLUMN in schema.names else schema
+
+
+def _numbered(batches:Iterator[pa.RecordBatch]) -> Iterator[pa.RecordBatch]:
+    """Batches with a ``ROW_COLUMN`` numbering their rows, if they don't have one."""
+    start = 0
+    for batch in batches:
+        if ROW_COLUMN not in batch.schema.names:
+            batch = batch.append_column(ROW_COLUMN, pa.array(np.arange(start, start + batch.num_rows, dtype=np.int64)))
+        start += batch.num_rows
+        yield batch
+
+
+def read_metadata(path:str) -> Dict[str, str]:
+    """Metadata stored in the schema of a snapshot, empty if it can't be read."""
+    try:
+        with pa.memory_map(path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return {}
+    return {key.decode(): value.decode() for key, value in metadata.items()}
+
+
+def build_snapshot(source:str, target:str) -> Dict[str, str]:
+    """Convert the xlsx ``source`` into the Arrow snapshot ``target``.
+
+    ``source`` can also be an Arrow IPC file written by :mod:`core.synthetic`.
+    """
+    path = fetch(source)
+    stat = os.stat(path)
+    metadata = {
+        "schema_version": str(SCHEMA_VERSION),
+        "source_sha256": file_sha256(path),
+        "source_size": str(stat.st_size),
+        "source_mtime_ns": str(stat.st_mtime_ns),
+    }
+    if path.endswith(ARROW_EXTENSION):
+        # already in the types and the order of a snapshot (see core.synthetic): copied batch by batch
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        batches = _numbered(reader.get_batch(i) for i in range(reader.num_record_batches))
+        schema = reader.schema
+        if ROW_COLUMN not in schema.names:
+            schema = schema.append(pa.field(ROW_COLUMN, pa.int64()))
+        schema = schema.with_metadata(metadata)
+    else:
+        table = _to_arrow(compact(pd.read_excel(path)))
+        schema, batches = table.schema.with_metadata(metadata), table.to_batches()
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    # written aside then renamed: readers never see a half written file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target) or ".", suffix=".tmp")
+    os.close(fd)
+    os.chmod(tmp, 0o644)
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+    os.replace(tmp, target)
+    return metadata
+
+
+def _is_fresh(metadata:Dict[str, str], source:str) -> bool:
+    if metadata.get("schema_version") != str(SCHEMA_VERSION):
+        return False
+    path = fetch(source)
+    stat = os.stat(path)
+    if (metadata.get("source_size"), metadata.get("source_mtime_ns")) == (str(stat.st_size), str(stat.st_mtime_ns)):
+        return True
+    # touched but maybe not modified: the content hash decides
+    return metadata.get("source_sha256") == file_sha256(path)
+
+
+def ensure_snapshot(source:str = None, target:str = None) -> Tuple[str, str]:
+    """Return the path and the version of an up to date snapshot of ``source``.
+
+    The version is the content hash of the source combined with the schema
+    version; it changes whenever the snapshot is rebuilt.
+    """
+    source = source or config.DATASET_PATH
+    target = target or os.path.join(config.CACHE_DIR, SNAPSHOT_NAME)
+    metadata = read_metadata(target) if os.path.exists(target) else {}
+    if not _is_fresh(metadata, source):
+        metadata = build_snapshot(source, target)
+    return target, f"{metadata['schema_version']}-{metadata['source_sha256'][:16]}"
+
+
+def open_snapshot(path:str) -> pd.DataFrame:
+    """Memory map a snapshot and return it as a frame (zero-copy where possible)."""
+    # the map stays open as long as the buffers of the frame reference it
+    return to_frame(pa.ipc.open_file(pa.memory_map(path)).read_all())
+
+
+# ------------------------ APPENDED BATCHES ----------------------------------
+# New patients are appended as extra Arrow files listed, in order, by a
+# manifest. Each entry chains the hash of the previous one so that the
+# manifest identifies the whole history. The manifest also records the version
+# of the snapshot the batches were appended to (their rows are numbered after
+# its rows): once the source is replaced, they no longer apply and are
+# rejected until they are archived.
+
+def _batches_dir() -> str:
+    return os.path.join(config.CACHE_DIR, BATCHES_DIR)
+
+
+def read_manifest() -> Dict:
+    """``{"base": version, "batches": [{"file", "sha256", "rows", "chain"}, ...]}``, no batches when nothing was appended."""
+    try:
+        with open(os.path.join(_batches_dir(), MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"batches": []}
+
+
+def manifest_mtime_ns() -> int:
+    try:
+        return os.stat(os.path.join(_batches_dir(), MANIFEST_NAME)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def check_manifest(manifest:Dict, version:str) -> None:
+    """``ValueError`` if the batches of ``manifest`` weren't appended to the snapshot of version ``version``."""
+    if manifest["batches"] and manifest.get("base") != version:
+        raise ValueError(
+            f"{len(manifest['batches'])} batches of patients were appended to the snapshot "
+            f"{manifest.get('base', 'of an unknown version')} but the source is now {version}: they can't be "
+            f"applied to another dataset. Archive them with `python -m core.snapshot --archive-batches`, "
+            f"then ingest them again if they still apply")
+
+
+def archive_batches() -> str:
+    """Move the appended batches and their manifest aside, return the directory they were moved to (empty if none)."""
+    directory = _batches_dir()
+    if not os.path.isdir(directory):
+        return ""
+    base = read_manifest().get("base", "unknown")
+    archive = os.path.join(config.CACHE_DIR, f"{BATCHES_DIR}-{base}-{time.strftime('%Y%m%d%H%M%S')}")
+    os.replace(directory, archive)
+    return archive
+
+
+def to_schema(df:pd.DataFrame, schema:pa.Schema) -> pa.Table:
+    """Arrow table of ``df`` with the types of the snapshot, ``ValueError`` if a column doesn't fit.
+
+    ``schema`` is the one of :func:`read_schema`; the index of ``df``, the
+    positions of its rows in the dataset, is stored as ``ROW_COLUMN``.
+    """
+    table = _to_arrow(df)
+    schema = schema.remove_metadata()
+    if ROW_COLUMN not in schema.names:
+        schema = schema.append(pa.field(ROW_COLUMN, pa.int64()))
+    try:
+        return table.select(schema.names).cast(schema)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as error:
+        raise ValueError(f"batch doesn't match the schema of the dataset: {error}") from error
+
+
+def append_batch(table:pa.Table, base:str) -> Dict:
+    """Write ``table`` as a new batch of the snapshot of version ``base`` and register it in the manifest.
+
+    Returns the manifest, ``ValueError`` if the batches already appended belong
+    to another snapshot. There must be a single writer at a time (the
+    ingestion CLI); readers only ever see the previous or the new manifest.
+    """
+    directory = _batches_dir()
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest()
+    check_manifest(manifest, base)
+    manifest["base"] = base
+    previous = manifest["batches"][-1]["chain"] if manifest["batches"] else ""
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    os.chmod(tmp, 0o644)
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    digest = file_sha256(tmp)
+    name = f"{len(manifest['batches']):06d}-{digest[:16]}.arrow"
+    os.replace(tmp, os.path.join(directory, name))
+    manifest["batches"].append({"file": name, "sha256": digest, "rows": table.num_rows,
+                                "chain": hashlib.sha256((previous + digest).encode()).hexdigest()})
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, os.path.join(directory, MANIFEST_NAME))
+    return manifest
+
+
+def batch_paths(manifest:Dict) -> List[str]:
+    return [os.path.join(_batches_dir(), batch["file"]) for batch in manifest["batches"]]
+
+
+def open_dataset(snapshot:str, batches:List[str]) -> pd.DataFrame:
+    """Snapshot followed by the appended batches, as one frame.
+
+    Without batches the frame points into the memory map; with batches the
+    columns are copied once when the tables are concatenated, and the rows
+    grouped by target again. The index is the position of the rows in the
+    source, then in the order they were appended.
+    """
+    if not batches:
+        return open_snapshot(snapshot)
+    tables = [pa.ipc.open_file(pa.memory_map(path)).read_all() for path in [snapshot] + batches]
+    schema = tables[0].schema.remove_metadata()
+    return group_by_target(to_frame(pa.concat_tables([table.cast(schema) for table in tables])))
+
+
+def iter_chunks(snapshot:str, batches:List[str], columns:List[str] = None, chunk_rows:int = None) -> Iterator[pa.Table]:
+    """Rows of the snapshot then of the batches, ``chunk_rows`` at a time (the last chunk may be shorter).
+
+    Only ``columns`` (and ``ROW_COLUMN``) are read, and a single chunk is in
+    memory at once: the record batches of the memory mapped files are sliced
+    and regrouped so that the chunks are ``df.iloc[k * chunk_rows:(k + 1) * chunk_rows]``
+    of the frame of :func:`open_dataset` when nothing was appended. At least one
+    chunk, maybe empty, is yielded.
+    """
+    chunk_rows = chunk_rows or config.CHUNK_ROWS
+    schema = None
+    pending, n_pending, yielded = [], 0, False
+    for path in [snapshot] + list(batches):
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        if schema is None:
+            schema = reader.schema.remove_metadata()
+            if columns is not None:
+                schema = pa.schema([schema.field(column) for column in list(columns) + [ROW_COLUMN]])
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i).select(schema.names)
+            start = 0
+            while start < batch.num_rows:
+                piece = batch.slice(start, chunk_rows - n_pending)
+                pending.append(pa.Table.from_batches([piece]).cast(schema))
+                n_pending += piece.num_rows
+                start += piece.num_rows
+                if n_pending == chunk_rows:
+                    yield pa.concat_tables(pending)
+                    pending, n_pending, yielded = [], 0, True
+    if pending or not yielded:
+        yield pa.concat_tables(pending) if pending else schema.empty_table()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the columnar snapshot of the dataset.")
+    parser.add_argument("source", nargs="?", default=config.DATASET_PATH, help="xlsx path or URL, or synthetic Arrow file")
+    parser.add_argument("--output", default=os.path.join(config.CACHE_DIR, SNAPSHOT_NAME))
+    parser.add_argument("--archive-batches", action="store_true",
+                        help="move the batches appended to a previous source aside")
+    args = parser.parse_args()
+    if args.archive_batches:
+        archive = archive_batches()
+        print(f"batches archived to {archive}" if archive else "no batches to archive")
+    path, version = ensure_snapshot(args.source, args.output)
+    print(f"{path} (version {version})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Descriptive statistics store.
+
+``df.describe()``, the KPI counts and the value counts of the pages were
+recomputed from the whole frame on every run. The store keeps mergeable
+running aggregates per column, for all the patients and for each class of
+the target: count, mean, M2 (sum of squared deviations), min/max, a quantile
+sketch for the numeric columns and the counts of each category. A new batch
+of patients is folded in with :meth:`StatsStore.update` without rescanning
+the history; the whole dataset is folded in the same way, chunk by chunk (see
+:func:`core.data.dataset_chunks`).
+"""
+import collections
+import functools
+import os
+import pickle
+import tempfile
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_float_dtype, is_numeric_dtype
+
+from core import config
+from core.data import dataset_chunks, dataset_version, frame_chunks
+
+ALL:str = "all"
+# bumped when the pickled layout of the store changes
+STORE_FORMAT:int = 2
+# beyond this number of distinct values, the category counts of a column are dropped
+MAX_CATEGORIES:int = 1000
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch: centroids (mean, weight) sorted by mean.
+
+    Up to ``capacity`` values, every value is its own centroid and quantiles
+    are exact (same linear interpolation as pandas). Beyond, neighbouring
+    centroids are merged into ``capacity`` groups of equal weight, bounding the
+    rank error by about ``1 / capacity``.
+    """
+
+    def __init__(self, capacity:int = 2048):
+        self.capacity = capacity
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+
+    def _add(self, means:np.ndarray, weights:np.ndarray) -> None:
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        if means.size > self.capacity:
+            cumulative = np.cumsum(weights)
+            groups = np.minimum(((cumulative - weights / 2) / cumulative[-1] * self.capacity).astype(np.int64), self.capacity - 1)
+            group_weights = np.bincount(groups, weights=weights, minlength=self.capacity)
+            group_sums = np.bincount(groups, weights=means * weights, minlength=self.capacity)
+            kept = group_weights > 0
+            means, weights = group_sums[kept] / group_weights[kept], group_weights[kept]
+        self.means, self.weights = means, weights
+
+    def update(self, values:np.ndarray) -> None:
+        self._add(np.asarray(values, dtype=np.float64), np.ones(len(values)))
+
+    def merge(self, other:"QuantileSketch") -> None:
+        self._add(other.means, other.weights)
+
+    def quantile(self, q:float) -> float:
+        if self.means.size == 0:
+            return np.nan
+        # position of the quantile among the centroids, each centered on its weight
+        centers = np.cumsum(self.weights) - (self.weights + 1) / 2
+        return float(np.interp(q * (self.weights.sum() - 1), centers, self.means))
+
+
+class ColumnStats:
+    """Running aggregates of one column."""
+
+    def __init__(self, numeric:bool, categorical:bool):
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.min = np.nan
+        self.max = np.nan
+        self.sketch = QuantileSketch() if numeric else None
+        self.categories = collections.Counter() if categorical else None
+
+    def _merge_moments(self, count:int, mean:float, m2:float, low:float, high:float) -> None:
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min = low if np.isnan(self.min) else min(self.min, low)
+        self.max = high if np.isnan(self.max) else max(self.max, high)
+
+    def _merge_categories(self, counts) -> None:
+        if self.categories is None:
+            return
+        self.categories.update(counts)
+        if len(self.categories) > MAX_CATEGORIES:
+            self.categories = None
+
+    def update(self, values:pd.Series) -> None:
+        values = values.dropna()
+        if self.sketch is not None and values.size:
+            array = values.to_numpy(dtype=np.float64)
+            mean = array.mean()
+            self._merge_moments(array.size, mean, float(((array - mean) ** 2).sum()), array.min(), array.max())
+            self.sketch.update(array)
+        elif self.sketch is None:
+            self.count += int(values.size)
+        if self.categories is None:
+            # float columns, patient IDs and columns past MAX_CATEGORIES aren't counted
+            return
+        counts = values.value_counts()
+        # categorical columns also count the categories absent from the batch
+        self._merge_categories(counts[counts > 0].to_dict())
+
+    def merge(self, other:"ColumnStats") -> None:
+        if self.sketch is not None:
+            self._merge_moments(other.count, other.mean, other.m2, other.min, other.max)
+            self.sketch.merge(other.sketch)
+        else:
+            self.count += other.count
+        self._merge_categories(other.categories if other.categories is not None else {})
+
+    @property
+    def std(self) -> float:
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+
+class StatsStore:
+    """Running aggregates per group (``ALL`` and each class of the target) and per column."""
+
+    def __init__(self):
+        self.groups:Dict[str, Dict[str, ColumnStats]] = {}
+        self.numeric_columns:List[str] = []
+        self.columns:List[str] = []
+        self.dtypes:Dict[str, str] = {}
+        self.n_rows = 0
+
+    @classmethod
+    def from_chunks(cls, chunks:Iterable[pd.DataFrame]) -> "StatsStore":
+        """Store of the patients of all the chunks, folded one at a time."""
+        store = cls()
+        for chunk in chunks:
+            store.update(chunk)
+        return store
+
+    @classmethod
+    def from_frame(cls, df:pd.DataFrame) -> "StatsStore":
+        # same chunks as the out-of-core mode: same results
+        return cls.from_chunks(frame_chunks(df))
+
+    def _group(self, name:str, df:pd.DataFrame) -> Dict[str, ColumnStats]:
+        if name not in self.groups:
+            self.groups[name] = {
+                column: ColumnStats(numeric=column in self.numeric_columns,
+                                    categorical=not is_float_dtype(df[column]) and column != config.PATIENT_ID)
+                for column in self.columns}
+        return self.groups[name]
+
+    def update(self, df:pd.DataFrame) -> None:
+        """Fold a batch of patients into the aggregates."""
+        if not self.columns:
+            self.columns = list(df.columns)
+            self.numeric_columns = [column for column in df.columns if is_numeric_dtype(df[column]) and not is_bool_dtype(df[column])]
+            self.dtypes = df.dtypes.astype(str).to_dict()
+        self.n_rows += df.shape[0]
+        batches = [(ALL, df)] + [(str(name), part) for name, part in df.groupby(config.TARGET, observed=True)]
+        for name, batch in batches:
+            for column, stats in self._group(name, df).items():
+                stats.update(batch[column])
+
+    def merge(self, other:"StatsStore") -> None:
+        """Merge the aggregates of another store, e.g. computed on another chunk of patients."""
+        if not self.columns:
+            self.columns, self.numeric_columns = list(other.columns), list(other.numeric_columns)
+            self.dtypes = dict(other.dtypes)
+        self.n_rows += other.n_rows
+        for name, columns in other.groups.items():
+            if name not in self.groups:
+                self.groups[name] = {column: ColumnStats(stats.sketch is not None, stats.categories is not None)
+                                     for column, stats in columns.items()}
+            for column, stats in columns.items():
+                self.groups[name][column].merge(stats)
+
+    # ------------------------ QUERIES ----------------------------------
+    def class_counts(self) -> Dict[str, int]:
+        return dict(self.groups[ALL][config.TARGET].categories)
+
+    def describe(self, group:str = ALL, columns:List[str] = None) -> pd.DataFrame:
+        """Same table as ``df.describe()`` (quantiles from the sketches)."""
+        columns = [column for column in (columns or self.columns) if column in self.numeric_columns]
+        rows = {}
+        for column in columns:
+            stats = self.groups[group][column]
+            rows[column] = [stats.count, stats.mean if stats.count else np.nan, stats.std, stats.min,
+                            stats.sketch.quantile(.25), stats.sketch.quantile(.5), stats.sketch.quantile(.75), stats.max]
+        return pd.DataFrame(rows, index=["count", "mean", "std", "min", "25%", "50%", "75%", "max"], dtype="float64")
+
+    def value_counts(self, column:str, group:str = ALL) -> pd.Series:
+        """Same as ``df[column].value_counts()``."""
+        counts = self.groups[group][column].categories
+        if counts is None:
+            raise ValueError(f"{column!r} has too many distinct values to be counted")
+        return pd.Series(counts, name="count", dtype="int64").sort_values(ascending=False, kind="stable")
+
+    def save(self, path:str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(self, f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path:str) -> "StatsStore":
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def store_path(version:str) -> str:
+    return os.path.join(config.CACHE_DIR, "stats", f"{version}-{STORE_FORMAT}.pkl")
+
+
+def drop_other_stores(version:str) -> None:
+    """Remove the stores of every dataset version (and store format) but ``version``."""
+    root = os.path.dirname(store_path(version))
+    keep = os.path.basename(store_path(version))
+    for entry in os.listdir(root) if os.path.isdir(root) else []:
+        if entry != keep:
+            try:
+                os.remove(os.path.join(root, entry))
+            except FileNotFoundError:  # removed by another worker
+                pass
+
+
+@functools.lru_cache(maxsize=1)
+def _load_stats_store(version:str) -> StatsStore:
+    path = store_path(version)
+    if os.path.exists(path):
+        return StatsStore.load(path)
+    store = StatsStore.from_chunks(dataset_chunks())
+    store.save(path)
+    drop_other_stores(version)
+    return store
+
+
+def load_stats_store() -> StatsStore:
+    """Statistics of the current dataset, computed once and shared by the workers through the cache dir."""
+    return _load_stats_store(dataset_version())
@@ -0,0 +1,195 @@
+"""Synthetic datasets with the schema of the real one, for scale and load testing.
+
+The real dataset has 5644 rows; to see how the pages behave at 100x or 1000x
+that volume, this module learns a model of the dataset and streams synthetic
+rows of any count into an Arrow IPC file with the types and the row order of
+the snapshot (see :mod:`core.snapshot`), chunk by chunk.
+
+Each synthetic row of a class is built from a real row of the same class, its
+template:
+
+- the missingness pattern of the template is kept, so the per column NaN rates
+  that select ``cleaned_df``, ``viral_rate_columns`` and ``blood_tests_columns``
+  and the blocks of missing values (a panel is done or not) are preserved;
+- the discrete values (viral panel, urine tests, age quantile, admission
+  flags...) are copied, so the category frequencies are preserved;
+- the lab values are drawn from a Gaussian with the mean and the pairwise
+  complete covariance of the class, which keeps the rough correlations between
+  the blood tests.
+
+The templates are drawn in cycles of random permutations of the rows of the
+class: the rates above are exact at every multiple of the class size. The
+class sizes follow the imbalance of ``SARS-Cov-2 exam result``, and patient IDs
+are new.
+
+    python -m core.synthetic synthetic_100x.arrow --scale 100
+    COVID_DATASET_PATH=synthetic_100x.arrow streamlit run home.py
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from core import config
+from core.data import dataset_version, load_dataset
+from core.snapshot import ROW_COLUMN, ensure_snapshot, read_schema, to_schema
+
+# rows generated and written at once
+CHUNK_ROWS:int = 1 << 16
+
+
+class _Templates:
+    """Real rows of a class in random order, every row once per cycle."""
+
+    def __init__(self, rng:np.random.Generator, rows:np.ndarray):
+        self.rng, self.rows, self.buffer = rng, rows, np.empty(0, dtype=rows.dtype)
+
+    def take(self, n:int) -> np.ndarray:
+        while len(self.buffer) < n:
+            self.buffer = np.concatenate([self.buffer, self.rng.permutation(self.rows)])
+        taken, self.buffer = self.buffer[:n], self.buffer[n:]
+        return taken
+
+
+class SyntheticModel:
+    """What the generator learns from the real dataset.
+
+    ``table`` holds the real rows in the types of the snapshot, ``rows`` the
+    positions of the rows of each class and ``gaussians`` the mean and a factor
+    of the covariance of the float columns of each class.
+    """
+
+    def __init__(self, table:pa.Table, missing:np.ndarray, rows:Dict[str, np.ndarray],
+                 gaussians:Dict[str, tuple], source_version:str):
+        self.table = table
+        self.missing = missing
+        self.rows = rows
+        self.gaussians = gaussians
+        self.source_version = source_version
+        self.floats:List[str] = [field.name for field in table.schema if pa.types.is_floating(field.type)]
+
+    @classmethod
+    def from_frame(cls, df:pd.DataFrame, schema:pa.Schema, source_version:str = "") -> "SyntheticModel":
+        table = to_schema(df, schema).combine_chunks()
+        floats = [field.name for field in schema if pa.types.is_floating(field.type)]
+        values = df[floats].to_numpy(dtype=np.float64)
+        target = df[config.TARGET].astype(object)
+        rows, gaussians = {}, {}
+        for label in sorted(target.dropna().unique()):
+            rows[label] = np.flatnonzero((target == label).to_numpy())
+            gaussians[label] = _gaussian(pd.DataFrame(values[rows[label]], columns=floats))
+        return cls(table, np.isnan(values), rows, gaussians, source_version)
+
+    def class_sizes(self, n_rows:int) -> Dict[str, int]:
+        """Rows per class for a dataset of ``n_rows``, with the class imbalance of the real one."""
+        total = sum(len(rows) for rows in self.rows.values())
+        sizes = {label: int(round(n_rows * len(rows) / total)) for label, rows in self.rows.items()}
+        largest = max(sizes, key=sizes.get)
+        sizes[largest] += n_rows - sum(sizes.values())
+        return sizes
+
+    def sample(self, label:str, templates:np.ndarray, first_id:int, rng:np.random.Generator) -> pa.Table:
+        """Synthetic rows of class ``label`` built from the real rows ``templates``."""
+        mean, factor = self.gaussians[label]
+        floats = mean + rng.standard_normal((len(templates), len(mean))) @ factor.T
+        floats[self.missing[templates]] = np.nan
+        floats = floats.astype(np.float32)
+        copied = self.table.take(pa.array(templates))
+        positions = {column: i for i, column in enumerate(self.floats)}
+        ids = np.char.mod("%015x", np.arange(first_id, first_id + len(templates)))
+        arrays = []
+        for field in self.table.schema:
+            if field.name == config.PATIENT_ID:
+                arrays.append(pa.array(ids).cast(field.type))
+            elif field.name == ROW_COLUMN:
+                arrays.append(pa.array(np.arange(first_id, first_id + len(templates), dtype=np.int64)))
+            elif field.name in positions:
+                # NaN kept as values, as in the snapshot
+                arrays.append(pa.array(floats[:, positions[field.name]], from_pandas=False).cast(field.type))
+            else:
+                arrays.append(copied.column(field.name))
+        return pa.Table.from_arrays(arrays, schema=self.table.schema)
+
+
+def _gaussian(values:pd.DataFrame) -> tuple:
+    """Mean and factor ``L`` (``L @ L.T`` = covariance) of the columns of ``values``.
+
+    The covariance is pairwise complete; what can't be estimated (columns
+    observed less than twice, pairs never observed together) is 0, and the
+    matrix is made positive semi-definite by clipping its eigenvalues, then
+    rescaled to the variances of the columns.
+    """
+    mean = values.mean().fillna(0).to_numpy()
+    covariance = values.cov(min_periods=2).fillna(0).to_numpy()
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    factor = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+    clipped = (factor ** 2).sum(axis=1)
+    scale = np.sqrt(np.divide(np.diag(covariance), clipped, out=np.zeros_like(clipped), where=clipped > 0))
+    return mean, factor * scale[:, None]
+
+
+def learn_model(source:str = None) -> SyntheticModel:
+    """Model of the dataset ``source`` (the configured one by default)."""
+    snapshot, _ = ensure_snapshot(source or config.DATASET_PATH)
+    schema = read_schema(snapshot)
+    return SyntheticModel.from_frame(load_dataset(source), schema, dataset_version(source))
+
+
+def synthetic_chunks(model:SyntheticModel, n_rows:int, seed:int = 0, chunk_rows:int = CHUNK_ROWS) -> Iterator[pa.Table]:
+    """Chunks of a synthetic dataset of ``n_rows``, grouped by class in lexical order like the snapshot."""
+    rng = np.random.default_rng(seed)
+    first_id = 0
+    for label, size in model.class_sizes(n_rows).items():
+        templates = _Templates(rng, model.rows[label])
+        for start in range(0, size, chunk_rows):
+            n = min(chunk_rows, size - start)
+            yield model.sample(label, templates.take(n), first_id, rng)
+            first_id += n
+
+
+def write_synthetic(path:str, model:SyntheticModel, n_rows:int, seed:int = 0, chunk_rows:int = CHUNK_ROWS) -> Dict[str, str]:
+    """Stream a synthetic dataset of ``n_rows`` into the Arrow IPC file ``path``, return its metadata."""
+    metadata = {"synthetic_rows": str(n_rows), "synthetic_seed": str(seed),
+                "synthetic_source_version": model.source_version}
+    schema = model.table.schema.with_metadata(metadata)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # written aside then renamed: readers never see a half written file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    os.close(fd)
+    os.chmod(tmp, 0o644)
+    try:
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            for chunk in synthetic_chunks(model, n_rows, seed, chunk_rows):
+                writer.write_table(chunk.replace_schema_metadata(metadata))
+    except BaseException:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    return metadata
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write a synthetic dataset with the schema of the real one.")
+    parser.add_argument("output", help="Arrow IPC file, usable as COVID_DATASET_PATH")
+    size = parser.add_mutually_exclusive_group(required=True)
+    size.add_argument("--rows", type=int, help="number of patients")
+    size.add_argument("--scale", type=float, help="number of patients, as a multiple of the real dataset")
+    parser.add_argument("--source", default=config.DATASET_PATH, help="dataset the model is learnt from")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    model = learn_model(args.source)
+    n_rows = args.rows if args.rows is not None else int(round(args.scale * len(model.table)))
+    write_synthetic(args.output, model, n_rows, args.seed, args.chunk_rows)
+    print(f"{n_rows} patients written to {args.output} in {time.perf_counter() - start:.1f}s "
+          f"({os.path.getsize(args.output) / 2 ** 20:.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,16 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import plotly.figure_factory as ff
-from scipy.stats import ttest_ind
-from scipy.stats import chi2_contingency
+from core import config
+from core.artifacts import ARTIFACTS
+from core.contingency import independence_tests
+from core.correlation import METHODS, SPEARMAN_MAX_ROWS, TOP_PAIRS_MIN_PERIODS, load_correlation
+from core.distributions import distplot, load_distributions
+from core.figure_cache import figure_cache
+from core.gallery import lazy_gallery
+from core.hypothesis import BALANCED, PERMUTATION, balanced_ttest, cached_resampled_ttest
+from core.instrument import debug_panel, section, start_page
+from core.scatter import scatter_3d_figure, scatter_matrix_figure
 
 # ------------------------ PAGE CONFIG ----------------------------------
 
@@ -12,39 +19,28 @@ st.set_page_config(
     page_icon='🇧🇷',
     layout="wide"
 )
+start_page("analyse_de_fond")
 st.title("Analyse de fond")
 
 
 # ------------------------ DATA ----------------------------------
-df = pd.read_excel("https://github.com/frimpong-adotri-01/datasets/blob/main/dataset.xlsx?raw=true")
-cleaned_df = df[df.columns[(df.isna().sum()/df.shape[0]) < .9]]
-cleaned_df.drop("Patient ID", axis=1, inplace=True)
-categories = pd.DataFrame((((df.isna().sum()/df.shape[0]))).sort_values(ascending=True), columns=["NaN_rate"])
-viral_rate:pd.DataFrame = categories[(categories["NaN_rate"]>.7) & (categories["NaN_rate"]<.86)]
-blood_tests:pd.DataFrame = categories[(categories["NaN_rate"]>.87) & (categories["NaN_rate"]<.9)]
-positive:pd.DataFrame = cleaned_df[cleaned_df["SARS-Cov-2 exam result"] == "positive"]
-negative:pd.DataFrame = cleaned_df[cleaned_df["SARS-Cov-2 exam result"] == "negative"]
-viral_rate_columns = cleaned_df.columns[(cleaned_df.isna().sum()/cleaned_df.shape[0]>.75) & (cleaned_df.isna().sum()/cleaned_df.shape[0]<.88)]
-blood_tests_columns = cleaned_df.columns[(cleaned_df.isna().sum()/cleaned_df.shape[0]>.87) & (cleaned_df.isna().sum()/cleaned_df.shape[0]<.9)]
-
-def test_statistique(variable:str, alpha:float) -> str:
-  statistic, p_value = ttest_ind(negative.sample(positive.shape[0], random_state=0)[variable].dropna(), positive[variable].dropna())
-  if p_value < alpha:
-    return "reject H0"
-  else:
-    return "fail to reject H0"
-
-def test_statistique_dependance(variable:str, alpha:float) -> str:
-  cross_table = pd.crosstab(cleaned_df["SARS-Cov-2 exam result"], cleaned_df[variable])
-  result = chi2_contingency(cross_table)
-  p_value = result[1]
-  if p_value < alpha:
-    return "reject H0"
-  else:
-    return "fail to reject H0"
+with section("data"):
+    df = ARTIFACTS.get("dataset")
+    cleaned_df = ARTIFACTS.get("cleaned_df")
+    categories:pd.DataFrame = ARTIFACTS.get("categories")
+    viral_rate:pd.DataFrame = ARTIFACTS.get("viral_rate")
+    blood_tests:pd.DataFrame = ARTIFACTS.get("blood_tests")
+    positive:pd.DataFrame = ARTIFACTS.get("positive")
+    negative:pd.DataFrame = ARTIFACTS.get("negative")
+    viral_rate_columns = ARTIFACTS.get("viral_rate_columns")
+    blood_tests_columns = ARTIFACTS.get("blood_tests_columns")
+    numeric_columns = ARTIFACTS.get("numeric_columns")
+    categorical_columns = ARTIFACTS.get("categorical_columns")
+
+    target_tables = ARTIFACTS.get("target_tables")
 
 # ------------------------ CONTENT ----------------------------------
-with st.container():
+with st.container(), section("presentation"):
     st.markdown("---")
     st.markdown("### **Présentation**")
     st.markdown("Il s'agit ici d'une analyse plus approfondie du dataset. De l'analyse des relations entre les"
@@ -68,7 +64,7 @@ with st.container():
     st.markdown("Dans ce cas de **classes deséquilibrées**, les métriques les plus optimales pour développer le modèle peuvent être le"
             " **score F1** ou encore le **recall**.")
 
-with st.container():
+with st.container(), section("variables"):
     st.markdown("---")
     st.markdown("### **Informations cachées dans les variables**")
     st.write("")
@@ -76,44 +72,46 @@ with st.container():
     st.markdown("Elles possèdent globalement une moyenne avoisinant zéro et "
                 "un écart-type avoisinant un (1) (Voir **Analyse de forme**). Par conséquent, ces variables sont déjà standardisées. "
                 "Notons également que ces variables suivent presque toutes une distribution normale.")
-    with st.expander("Voir les graphiques de distribution des variables"):
-        for column in cleaned_df.select_dtypes("float64"):
-            dist_fig = ff.create_distplot([cleaned_df[column].dropna().values], [column], bin_size=.2, show_rug=False)
-            dist_fig.update_layout(title_text=f'{column} distribution', #center figure title
-                     title_x=.5,
-                     font_family="Courier New",
-                     xaxis_title=f"{column}",
-                     yaxis_title="density",
-                     font_color="black",
-                     title_font_family="Arial",
-                     title_font_color="red",  #title color
-                     legend_title_font_color="green"   #legend color
-                     )
-            st.write(dist_fig)
+    @figure_cache("fond_distplot")
+    def distribution_figure(column:str):
+        dist_fig = distplot(load_distributions(), column, names=[column])
+        dist_fig.update_layout(title_text=f'{column} distribution', #center figure title
+                 title_x=.5,
+                 font_family="Courier New",
+                 xaxis_title=f"{column}",
+                 yaxis_title="density",
+                 font_color="black",
+                 title_font_family="Arial",
+                 title_font_color="red",  #title color
+                 legend_title_font_color="green"   #legend color
+                 )
+        return dist_fig
+    lazy_gallery("Voir les graphiques de distribution des variables", numeric_columns, distribution_figure, key="distributions")
     st.write("")
 
     st.markdown("##### **Les variables catégorielles «object»**")
     st.markdown("Ces variables n'étant pas numériques, il est préférable d'observer les différentes classes "
                 "composant ces variables:")
-    for column in cleaned_df.select_dtypes("object"):
-        st.markdown(f"<span style=\"color:blue\">**{column:-<70}**  **{cleaned_df[column].dropna().unique()}**</span>", unsafe_allow_html=True)
+    for column in categorical_columns:
+        st.markdown(f"<span style=\"color:blue\">**{column:-<70}**  **{cleaned_df[column].dropna().astype(object).unique()}**</span>", unsafe_allow_html=True)
     st.markdown("On recense un important nombre de classe binaires par variable, en faisant abstraction des **NaN values**. "
                 "En général, les classes **«negative»** et **«not_detected»** sont majoritairement écrasantes en défaveur la classe opposée. "
                 "Ainsi, par analogie à la **variable Target** qui est elle-même catégorielle, ces variables possèdent des classes "
                 "deséquilibrées. Cependant, la variable **«Rhinovirus/Enterovirus»** est assez intéressante dans la mesure où "
                 "on peut considérer que ce n'est relativement pas une classe deséquilibrée.")
-    with st.expander("Voir les camemberts de répartition des classes des variables"):
-        for column in cleaned_df.select_dtypes("object"):
-            classes_fig = px.pie(df, df[column].dropna(), color_discrete_sequence=px.colors.qualitative.G10)
-            classes_fig.update_layout(title_text=f'{column}  positive/negative cases',  # center figure title
-                              title_x=.5,
-                              font_family="Courier New",
-                              font_color="black",
-                              title_font_family="Arial",
-                              title_font_color="red",  # title color
-                              legend_title_font_color="green"  # legend color
-                              )
-            st.write(classes_fig)
+    @figure_cache("fond_classes_pie")
+    def classes_figure(column:str):
+        classes_fig = px.pie(df, df[column].dropna(), color_discrete_sequence=px.colors.qualitative.G10)
+        classes_fig.update_layout(title_text=f'{column}  positive/negative cases',  # center figure title
+                          title_x=.5,
+                          font_family="Courier New",
+                          font_color="black",
+                          title_font_family="Arial",
+                          title_font_color="red",  # title color
+                          legend_title_font_color="green"  # legend color
+                          )
+        return classes_fig
+    lazy_gallery("Voir les camemberts de répartition des classes des variables", categorical_columns, classes_figure, key="classes")
     st.write("")
 
     st.markdown("##### **Les variables de type «int64»**")
@@ -123,7 +121,8 @@ with st.container():
             "variable dans le forum **kaggle** dédié. Cette variable peut alors être interprétée comme une "
             "**«variable catégorielle encodée ordinalement»** (d'où ses valeurs numériques) et ses valeurs peuvent être associées"
             " à des tranches d'âge de 5 (0 -> [1 à 5 ans], 1 -> [6 à 10 ans], ...). Mais encore une fois, **il ne s'agit que d'hypothèses**.")
-    quantile_fig = px.bar(cleaned_df, x=cleaned_df["Patient age quantile"].dropna().value_counts().index, y=cleaned_df["Patient age quantile"].dropna().value_counts().values)
+    age_counts = ARTIFACTS.get("stats_store").value_counts("Patient age quantile")
+    quantile_fig = px.bar(x=age_counts.index, y=age_counts.values)
     quantile_fig.update_layout(title_text=f'Patient age quantile repartition',  # center figure title
                                title_x=.5,
                                font_family="Courier New",
@@ -152,14 +151,15 @@ with st.container():
                               )
             st.write(fig)
 
-with st.container():
+with st.container(), section("relations"):
     st.markdown("---")
     st.markdown("### **Relations inter-variables et data visualization**")
     st.markdown(
         "Dans un premier temps, nous allons découper nos variables en 2 grands groupes. Sur base de résultats de recherches"
         " internet croisées avec les informations récoltées sur **kaggle**, ce découpage se base par coïncidence sur la "
-        "proportion de **NaN values**. En effet, on dégage 2 grandes catégories : **Les tests viraux** (0.75 < NaN < 0.86),"
-        " **les taux sanguins** (0.87 < NaN < 0.9). Les variables de type **«float64»** sont des variables associées aux "
+        "proportion de **NaN values**. En effet, on dégage 2 grandes catégories : **Les tests viraux** "
+        f"({config.VIRAL_NAN_RANGE[0]} < NaN < {config.VIRAL_NAN_RANGE[1]}), **les taux sanguins** "
+        f"({config.BLOOD_NAN_RANGE[0]} < NaN < {config.BLOOD_NAN_RANGE[1]}). Les variables de type **«float64»** sont des variables associées aux "
         "**taux sanguins** et les variables de type **«object»** aux **tests viraux**. La data vizualisation nous permettra "
         "d'observer visuellement nos variables afin de tirer nos conclusions.")
     st.write("")
@@ -176,20 +176,21 @@ with st.container():
                 "même distribution indépendamment des cas postifs ou négatifs. Cependant, les variables **«Platelets»**, **«Leukocytes»** et **«Monocytes»** "
                 "sont intéressantes dans la mesure où la distribution présente un comportement spécifique selon les cas positifs ou négatifs. On peut "
                 "alors émettre une hypothèse à tester plus tard. \n<span style=\"color:blue\">**<u>Hypothèse N°1</u>:** \"Les variables **«Platelets»**, **«Leukocytes»** et **«Monocytes»** ont une une incidence sur le résultat d'un individu au test COVID\".</span>", unsafe_allow_html=True)
-    with st.expander("Voir les graphiques de relation Target/Taux sanguins"):
-        for column in blood_tests_columns:
-            rel1_fig = ff.create_distplot([positive[column].dropna().values, negative[column].dropna().values], ["positive case", "negative case"], bin_size=.2, show_rug=False)
-            rel1_fig.update_layout(title_text=f'{column}  positive/negative cases', #center figure title
-                     title_x=.5,
-                     font_family="Courier New",
-                     xaxis_title=f"{column}",
-                     yaxis_title="density",
-                     font_color="black",
-                     title_font_family="Arial",
-                     title_font_color="red",  #title color
-                     legend_title_font_color="green"   #legend color
-                     )
-            st.write(rel1_fig)
+    @figure_cache("fond_blood_target_distplot")
+    def blood_target_figure(column:str):
+        rel1_fig = distplot(load_distributions(), column, ["positive", "negative"], ["positive case", "negative case"])
+        rel1_fig.update_layout(title_text=f'{column}  positive/negative cases', #center figure title
+                 title_x=.5,
+                 font_family="Courier New",
+                 xaxis_title=f"{column}",
+                 yaxis_title="density",
+                 font_color="black",
+                 title_font_family="Arial",
+                 title_font_color="red",  #title color
+                 legend_title_font_color="green"   #legend color
+                 )
+        return rel1_fig
+    lazy_gallery("Voir les graphiques de relation Target/Taux sanguins", blood_tests_columns, blood_target_figure, key="blood_target")
     st.write("")
     st.markdown("* **Relations Target/Tests viraux:** Ces deux types de variables étant des variables catégorielles, on ne peut comparer "
                 "leurs distributions. Pour comparer des variables catégorielles entre elles, nous aurons recours à une **«crosstab»** qui résulte"
@@ -199,21 +200,22 @@ with st.container():
                 "est assez prépondérante parmis les individus négatifs au COVID-19. Peut-on en déduire que les individus atteints du **«Rhinovirus/Enterovirus»**"
                 " sont moins prédisposés à contracter le COVID-19 ? C'est une hypothèse à tester."
                 "\n<span style=\"color:blue\">**<u>Hypothèse N°2</u>:** \"La variable **«Rhinovirus/Enterovirus»** préserve-t-il de la contraction du COVID ?\"</span>", unsafe_allow_html=True)
-    with st.expander("Voir les graphiques de relation Target/Tests viraux"):
-        for column in viral_rate_columns:
-            rel2_fig = px.imshow(pd.crosstab(cleaned_df["SARS-Cov-2 exam result"], cleaned_df[column]), text_auto=True)
-            rel2_fig.layout.coloraxis.showscale = False  #remove the imshow colorbar
-            rel2_fig.update_layout(title_text=f'{column}  positive/negative cases', #center figure title
-                     title_x=.5,
-                     font_family="Courier New",
-                     xaxis_title=f"{column}",
-                     yaxis_title="SARS-Cov-2 exam result",
-                     font_color="black",
-                     title_font_family="Arial",
-                     title_font_color="red",  #title color
-                     legend_title_font_color="green"   #legend color
-                     )
-            st.write(rel2_fig)
+    @figure_cache("fond_viral_target_crosstab")
+    def viral_target_figure(column:str):
+        rel2_fig = px.imshow(target_tables[column], text_auto=True)
+        rel2_fig.layout.coloraxis.showscale = False  #remove the imshow colorbar
+        rel2_fig.update_layout(title_text=f'{column}  positive/negative cases', #center figure title
+                 title_x=.5,
+                 font_family="Courier New",
+                 xaxis_title=f"{column}",
+                 yaxis_title="SARS-Cov-2 exam result",
+                 font_color="black",
+                 title_font_family="Arial",
+                 title_font_color="red",  #title color
+                 legend_title_font_color="green"   #legend color
+                 )
+        return rel2_fig
+    lazy_gallery("Voir les graphiques de relation Target/Tests viraux", viral_rate_columns, viral_target_figure, key="viral_target")
     st.markdown("* **Relations Target/Patient age quantile:** Toujours en supposant que la variable **«Patient age quantile»** correspond "
                 "aux tranches d'âges, on visualise via un **countplot** les répartitions d'individus négatifs et positifs par tranche d'âge."
                 " Sous l'hypothèse de catégortisation des âges, on remarque que plus on est âgé, plus on a de cas postifs dans la catégorie."
@@ -231,15 +233,20 @@ with st.container():
                                )
     st.write(quantile_fig)
 
-with st.container():
+with st.container(), section("detailed analysis"):
     st.markdown("---")
     st.markdown("### Analyse détaillée")
     st.markdown("Après avoir réalisé une analyse de fond précédemment, il convient d'approfondir les résultats trouvés et tester et approuver "
                 "ou rejeter certaines hypothèses.")
     st.write("")
     st.markdown("##### **Relations entre les variables de tests sanguins**")
-    st.markdown("Pour ce faire, visualisons la matrice de corrélation de ces variables. On note que les variables les plus corrélées sont : ")
-    blood_corr_fig = px.imshow(cleaned_df[blood_tests_columns].corr(), width=850, height=850)
+    st.markdown("Pour ce faire, visualisons la matrice de corrélation de ces variables, ordonnée par classification hiérarchique "
+                "afin de regrouper les variables corrélées. On note que les variables les plus corrélées sont : ")
+    method = st.radio("Corrélation", METHODS, format_func=str.capitalize, horizontal=True, key="blood_corr_method")
+    blood_correlation = load_correlation(blood_tests_columns, method)
+    top_pairs = blood_correlation.top_pairs(5)
+    correlated_columns = blood_correlation.top_columns(3)
+    blood_corr_fig = px.imshow(blood_correlation.r, width=850, height=850)
     blood_corr_fig.update_layout(title_text=f'Correlation entre les variables de tests sanguins',  # center figure title
                                title_x=.5,
                                font_family="Courier New",
@@ -249,37 +256,49 @@ with st.container():
                                legend_title_font_color="green"  # legend color
                                )
     st.write(blood_corr_fig)
+    if blood_correlation.sampled:
+        st.caption(f"Corrélations de Spearman calculées sur un échantillon aléatoire de {SPEARMAN_MAX_ROWS} patients.")
+    st.dataframe(top_pairs.rename(columns={"x": "variable 1", "y": "variable 2", "r": "corrélation", "n": "patients"}),
+                 hide_index=True)
     st.write("")
     st.markdown(
         "En réalisant une matrice de **scatter plots**, on remarque que les graphes de ces différentes variables, les unes par rapport "
         "aux autres, suivent toujours une tendance linéaire. De plus un graphe 3D en prenant en compte les 3 variables sur les axes confirme "
         "cette tendance linéaire.")
-    st.markdown("**Nota:** Les variables **Hemoglobin** et **Hematocrit** sont très fortement correlées (97% environ de correlation).")
-    with st.expander("Voir les tendances inter-variables."):
-        blood_corr_scatter_fig = px.scatter_matrix(cleaned_df[['Hemoglobin', 'Hematocrit', 'Red blood Cells']], width=850, height=850)
-        blood_corr_scatter_fig.update_layout(title_text=f'Corralated variables tendance',  # center figure title
-                                            title_x=.5,
-                                            font_family="Courier New",
-                                            font_color="black",
-                                            title_font_family="Arial",
-                                            title_font_color="red",  # title color
-                                            legend_title_font_color="green"  # legend color
-                                            )
-        st.write(blood_corr_scatter_fig)
-    scatter3d_blood_corr = px.scatter_3d(cleaned_df, 'Hemoglobin', 'Hematocrit', 'Red blood Cells', color="SARS-Cov-2 exam result", width=850, height=850, color_discrete_sequence=px.colors.qualitative.G10)
-    scatter3d_blood_corr.update_layout(title_text=f'Corralated variables tendance (3D view)',  # center figure title
-                                            title_x=.5,
-                                            font_family="Courier New",
-                                            font_color="black",
-                                            title_font_family="Arial",
-                                            title_font_color="red",  # title color
-                                            legend_title_font_color="green"  # legend color
-                                            )
-    scatter3d_blood_corr.update_traces(marker=dict(size=7,
-                                        line=dict(width=1)),
-                                        selector=dict(mode='markers'))
-
-    st.write(scatter3d_blood_corr)
+    if len(top_pairs):
+        st.markdown(f"**Nota:** Les variables **{top_pairs['x'][0]}** et **{top_pairs['y'][0]}** sont les plus fortement "
+                    f"correlées ({top_pairs['r'][0]:.0%} environ de correlation, sur {top_pairs['n'][0]} patients).")
+    # the strongest pairs may involve fewer columns on a small or sparse dataset
+    if len(correlated_columns) >= 2:
+        with st.expander("Voir les tendances inter-variables."):
+            blood_corr_scatter_fig = scatter_matrix_figure(cleaned_df, correlated_columns, width=850, height=850)
+            blood_corr_scatter_fig.update_layout(title_text=f'Corralated variables tendance',  # center figure title
+                                                title_x=.5,
+                                                font_family="Courier New",
+                                                font_color="black",
+                                                title_font_family="Arial",
+                                                title_font_color="red",  # title color
+                                                legend_title_font_color="green"  # legend color
+                                                )
+            st.write(blood_corr_scatter_fig)
+    if len(correlated_columns) == 3:
+        scatter3d_blood_corr = scatter_3d_figure(cleaned_df, *correlated_columns, color="SARS-Cov-2 exam result", width=850, height=850, color_discrete_sequence=px.colors.qualitative.G10)
+        scatter3d_blood_corr.update_layout(title_text=f'Corralated variables tendance (3D view)',  # center figure title
+                                                title_x=.5,
+                                                font_family="Courier New",
+                                                font_color="black",
+                                                title_font_family="Arial",
+                                                title_font_color="red",  # title color
+                                                legend_title_font_color="green"  # legend color
+                                                )
+        scatter3d_blood_corr.update_traces(marker=dict(size=7,
+                                            line=dict(width=1)),
+                                            selector=dict(mode='markers'))
+
+        st.write(scatter3d_blood_corr)
+    else:
+        st.info(f"Moins de 3 variables fortement corrélées sur au moins {TOP_PAIRS_MIN_PERIODS} patients : "
+                "les tendances inter-variables ne sont pas toutes affichées.")
 
     st.markdown("##### **Relations entre les variables de taux viraux**")
     st.markdown(
@@ -288,7 +307,7 @@ with st.container():
         " effet : ")
     influenza_a = px.imshow(pd.crosstab(cleaned_df["Influenza A, rapid test"], cleaned_df["Influenza A"]), text_auto=True)
     influenza_a.layout.coloraxis.showscale = False  # remove the imshow colorbar
-    influenza_a.update_layout(title_text=f'{column}  Crosstab Influenza A, rapid test/Influenza A',  # center figure title
+    influenza_a.update_layout(title_text=f'Crosstab Influenza A, rapid test/Influenza A',  # center figure title
                            title_x=.5,
                            font_family="Courier New",
                            #xaxis_title="Influenza A, rapid test",
@@ -303,7 +322,7 @@ with st.container():
     influenza_b = px.imshow(pd.crosstab(cleaned_df["Influenza B, rapid test"], cleaned_df["Influenza B"]),
                             text_auto=True)
     influenza_b.layout.coloraxis.showscale = False  # remove the imshow colorbar
-    influenza_b.update_layout(title_text=f'{column}  Crosstab Influenza B, rapid test/Influenza B',
+    influenza_b.update_layout(title_text=f'Crosstab Influenza B, rapid test/Influenza B',
                               # center figure title
                               title_x=.5,
                               font_family="Courier New",
@@ -322,7 +341,7 @@ with st.container():
                 "[article](https://www.cdc.gov/flu/professionals/diagnosis/overview-testing-methods.htm#:~:text=Most%20of%20the%20rapid%20influenza,improved%20accuracy%2C%20including%20higher%20sensitivity.)")
 
 
-with st.container():
+with st.container(), section("hypothesis tests"):
     st.markdown("---")
     st.markdown("### Tests d'hypothèses")
     st.markdown("<span style=\"color:blue\">**<u>Hypothèse N°1</u>:** \"Les variables **«Platelets»**, **«Leukocytes»** et **«Monocytes»** ont une une incidence sur le résultat d'un individu au test COVID\".</span>", unsafe_allow_html=True)
@@ -343,7 +362,7 @@ cleaned_df = df[df.columns[(df.isna().sum()/df.shape[0]) < .9]]
 cleaned_df.drop("Patient ID", axis=1, inplace=True)
 positive:pd.DataFrame = cleaned_df[cleaned_df["SARS-Cov-2 exam result"] == "positive"]
 negative:pd.DataFrame = cleaned_df[cleaned_df["SARS-Cov-2 exam result"] == "negative"]
-blood_tests_columns = cleaned_df.columns[(cleaned_df.isna().sum()/cleaned_df.shape[0]>.88) & (cleaned_df.isna().sum()/cleaned_df.shape[0]<.9)]
+blood_tests_columns = cleaned_df.columns[(cleaned_df.isna().sum()/cleaned_df.shape[0]>.87) & (cleaned_df.isna().sum()/cleaned_df.shape[0]<.9)]
 
 def test_statistique(variable:str, alpha:float) -> str:
     statistic, p_value = ttest_ind(negative.sample(positive.shape[0], random_state=0)[variable].dropna(), positive[variable].dropna())
@@ -359,11 +378,46 @@ for column in blood_tests_columns:
     ainsi de prouver, au niveau de significativité $ \alpha=0.01 $, que les quantités de moyenne de **«Platelets»**, **«Leukocytes»** 
     et **«Monocytes»** fluctuent en fonction des  patients négatifs et postitifs.''')
     st.markdown("**Nota**: La variable **Eosinophils** à l'issue du test possède les même propriétés que les variables **Leukocytes**,... Le graphe de la distribution de sa relation avec la target peut appuyer ce résultat du test statistique.")
-    for column in blood_tests_columns:
+    ttest_results = balanced_ttest(positive, negative, blood_tests_columns, alpha=.01)
+    for column, decision in ttest_results["decision"].items():
         if not(column in ("Monocytes", "Leukocytes", "Platelets")):
-            st.markdown(f"<span style=\"color:green\">**{column:-<70} {test_statistique(column, .01)}**</span>", unsafe_allow_html=True)
+            st.markdown(f"<span style=\"color:green\">**{column:-<70} {decision}**</span>", unsafe_allow_html=True)
         else:
-            st.markdown(f"<span style=\"color:red\">**{column:-<70} {test_statistique(column, .01)}**</span>",unsafe_allow_html=True)
+            st.markdown(f"<span style=\"color:red\">**{column:-<70} {decision}**</span>",unsafe_allow_html=True)
+    with st.expander("Voir le détail des tests (statistique, p-value, taille d'effet, intervalle de confiance à 95%)"):
+        st.dataframe(ttest_results)
+        st.download_button("Exporter les résultats", data=ttest_results.to_csv().encode('utf-8'),
+                           file_name="tests_de_student.csv")
+    with st.expander("Tester la stabilité des conclusions par rééchantillonnage"):
+        st.markdown("Les conclusions ci-dessus reposent sur un seul tirage aléatoire des individus négatifs. On peut répéter "
+                    "le test sur des milliers de tirages équilibrés (distribution des p-values et part des tirages qui rejettent "
+                    "$H_{0}$) ou calculer une p-value par permutation des classes.")
+        resampling_mode = st.radio("Mode", ("Tirages équilibrés", "Permutations"), horizontal=True)
+        n_resamples = st.select_slider("Nombre de rééchantillonnages", (500, 1000, 2000, 5000, 10000), value=2000)
+        if st.button("Lancer les rééchantillonnages"):
+            resampling_bar = st.progress(0., text="Rééchantillonnage en cours...")
+            resampling_results, resampled_values = cached_resampled_ttest(
+                ARTIFACTS.get("version"), positive, negative, blood_tests_columns, alpha=.01, n_resamples=n_resamples,
+                max_seconds=60,
+                mode=BALANCED if resampling_mode == "Tirages équilibrés" else PERMUTATION,
+                progress=lambda done, total: resampling_bar.progress(done / total, text=f"{done}/{total} rééchantillonnages"))
+            st.dataframe(resampling_results)
+            if resampling_mode == "Tirages équilibrés":
+                pvalues_fig = px.box(resampled_values, log_y=True)
+                pvalues_fig.add_hline(y=.01, line_dash="dash", line_color="red")
+                pvalues_fig.update_layout(title_text='Distribution des p-values par variable',  # center figure title
+                                          title_x=.5,
+                                          font_family="Courier New",
+                                          xaxis_title="",
+                                          yaxis_title="p-value",
+                                          font_color="black",
+                                          title_font_family="Arial",
+                                          title_font_color="red",  # title color
+                                          legend_title_font_color="green"  # legend color
+                                          )
+                st.write(pvalues_fig)
+            st.download_button("Exporter les résultats", data=resampling_results.to_csv().encode('utf-8'),
+                               file_name="tests_de_student_reechantillonnes.csv")
     st.write("")
     st.markdown("<span style=\"color:blue\">**<u>Hypothèse N°2</u>:** \"La variable **«Rhinovirus/Enterovirus»** préserve-t-il de la contraction du COVID ?\".</span>",
         unsafe_allow_html=True)
@@ -399,13 +453,20 @@ for column in viral_rate_columns:
     """, language='Python')
     st.markdown(r'''Les résultats du test statistique prouvent bien qu'on rejette $ H_{0} $ au profit de $ H_{1} $ pour les variables qui nous intéressent. On vient
         ainsi de prouver, au niveau de significativité $ \alpha=0.01 $, que la variable **«Rhinovirus/Enterovirus»** ne préserve pas de la contraction du COVID.''')
-    for column in viral_rate_columns:
+    independence_results = independence_tests(target_tables, alpha=.01)
+    for column, decision in independence_results["decision"].items():
         if not(column == "Rhinovirus/Enterovirus"):
-            st.markdown(f"<span style=\"color:green\">**{column:-<70} {test_statistique_dependance(column, .01)}**</span>", unsafe_allow_html=True)
+            st.markdown(f"<span style=\"color:green\">**{column:-<70} {decision}**</span>", unsafe_allow_html=True)
         else:
-            st.markdown(f"<span style=\"color:red\">**{column:-<70} {test_statistique_dependance(column, .01)}**</span>",unsafe_allow_html=True)
-
-with st.container():
+            st.markdown(f"<span style=\"color:red\">**{column:-<70} {decision}**</span>",unsafe_allow_html=True)
+    with st.expander("Voir le détail des tests (test utilisé, statistique, p-value)"):
+        st.markdown("Lorsqu'un effectif théorique d'une table 2x2 est inférieur à 5, le test du khi-deux n'est pas fiable : "
+                    "le test exact de **Fisher** est utilisé à la place.")
+        st.dataframe(independence_results)
+        st.download_button("Exporter les résultats", data=independence_results.to_csv().encode('utf-8'),
+                           file_name="tests_du_khi_deux.csv")
+
+with st.container(), section("code"):
     st.markdown('---')
     st.markdown("### Mon code Python")
     code:str = """
@@ -423,12 +484,12 @@ cleaned_df.drop("Patient ID", axis=1, inplace=True)
 
 # CATÉGORISATION DES VARIABLES
 categories = pd.DataFrame((((df.isna().sum()/df.shape[0]))).sort_values(ascending=True), columns=["NaN_rate"])
-viral_rate:pd.DataFrame = categories[(categories["NaN_rate"]>.7) & (categories["NaN_rate"]<.77)]
-blood_tests:pd.DataFrame = categories[(categories["NaN_rate"]>.8) & (categories["NaN_rate"]<.9)]
+viral_rate:pd.DataFrame = categories[(categories["NaN_rate"]>.75) & (categories["NaN_rate"]<.88)]
+blood_tests:pd.DataFrame = categories[(categories["NaN_rate"]>.87) & (categories["NaN_rate"]<.9)]
 positive:pd.DataFrame = cleaned_df[cleaned_df["SARS-Cov-2 exam result"] == "positive"]
 negative:pd.DataFrame = cleaned_df[cleaned_df["SARS-Cov-2 exam result"] == "negative"]
 viral_rate_columns = cleaned_df.columns[(cleaned_df.isna().sum()/cleaned_df.shape[0]>.75) & (cleaned_df.isna().sum()/cleaned_df.shape[0]<.88)]
-blood_tests_columns = cleaned_df.columns[(cleaned_df.isna().sum()/cleaned_df.shape[0]>.88) & (cleaned_df.isna().sum()/cleaned_df.shape[0]<.9)]
+blood_tests_columns = cleaned_df.columns[(cleaned_df.isna().sum()/cleaned_df.shape[0]>.87) & (cleaned_df.isna().sum()/cleaned_df.shape[0]<.9)]
 
 # REPRÉSENTATION DES CLASSES DE LA TARGET VARIABLE
 sars_cov_fig = px.pie(df, "SARS-Cov-2 exam result", width=500, height=500, color_discrete_sequence=px.colors.qualitative.G10, title='Rate of Positive/Negative COVID cases')
@@ -614,5 +675,4 @@ for column in viral_rate_columns:
     """
     st.code(code, language='Python')
 
-
-
+debug_panel()
@@ -3,6 +3,9 @@ import pandas as pd
 import plotly.express as px
 from typing import List
 import seaborn as sns
+from core.artifacts import ARTIFACTS
+from core.instrument import debug_panel, section, start_page
+from core.missingness import missingness_figure
 
 # ------------------------ PAGE CONFIG ----------------------------------
 st.set_page_config(
@@ -10,12 +13,15 @@ st.set_page_config(
     page_icon='🇧🇷',
     layout="wide"
 )
+start_page("analyse_de_forme")
 st.title("Analyse de forme")
 
 # ------------------------ DATA ----------------------------------
-df = pd.read_excel("https://github.com/frimpong-adotri-01/datasets/blob/main/dataset.xlsx?raw=true")
-cleaned_df = df[df.columns[(df.isna().sum()/df.shape[0]) < .9]]
-boxplot_variables:List[str] = list(cleaned_df.select_dtypes(["float64"]).columns)
+with section("data"):
+    df = ARTIFACTS.get("dataset")
+    cleaned_columns:List[str] = ARTIFACTS.get("cleaned_columns")
+    cleaned_df = df[cleaned_columns]
+    boxplot_variables:List[str] = ARTIFACTS.get("numeric_columns")
 # ------------------------ CONTENT ----------------------------------
 st.markdown("---")
 st.markdown("### **Présentation**")
@@ -29,12 +35,11 @@ st.markdown("* **La variable à expliquer** : <span style=\"color:blue\">\"**_SA
 st.markdown("---")
 st.markdown("### Focus sur les valeurs manquantes...")
 
-with st.container():
+with st.container(), section("missing values"):
     st.markdown("La **_heatmap_** suivante permet de visualiser la proportion de valeurs manquantes par colonne" 
             "dans le dataset. En effet, on remarque que les valeurs manquantes sont de couleur **blanche** tandis"
             " que les valeurs existantes sont en <span style=\"color:blue\">**bleu**</span>.\n", unsafe_allow_html=True)
-    na_fig = px.imshow(df, width=1100, height=850, color_continuous_scale='bluered')
-    na_fig.layout.coloraxis.showscale = False  #remove the imshow colorbar
+    na_fig = missingness_figure(width=1100, height=850, colors=("blue", "white"))
     na_fig.update_layout(title_text='NaN values repartition per features', #center figure title
                      title_x=.5,
                      font_family="Courier New",
@@ -45,7 +50,7 @@ with st.container():
                      )
     st.write(na_fig)
 
-with st.container():
+with st.container(), section("cleaned missing values"):
     st.markdown("Étant donné  le grand nombre de variables (111) à notre disposition, il est primordial de nous"
                 " débarasser des variables avec plus de 90% de valeurs manquantes. Après épuration de ces variables, on passe "
                 "de 111 variables à 39 variables. La **heatmap** de notre nouveau dataset ressemble à ceci. Pour une meilleure"
@@ -54,8 +59,7 @@ with st.container():
                 " ne représentent que 2 valeurs opposées. Ainsi **0 = tous les"
                 " à tous les chiffres de l'octet sont nuls** et **255=tous les chiffres de l'octet sont égaux à 1.** "
                 "Donc toutes les couleurs égales à 0 représentent des valeurs existantes et les couleurs égales à 255, les NaN values.", unsafe_allow_html=True)
-    na_fig = px.imshow(cleaned_df.isna(), width=900, height=900, )
-    na_fig.layout.coloraxis.showscale = True  #remove the imshow colorbar
+    na_fig = missingness_figure(cleaned_columns, width=900, height=900, colors=("#0d0887", "#f0f921"))
     na_fig.update_layout(title_text='Dataset after cleaning features with a high rate of NaN values', #center figure title
                      title_x=.5,
                      font_family="Courier New",
@@ -66,7 +70,7 @@ with st.container():
                      )
     st.write(na_fig)
 
-with st.container():
+with st.container(), section("descriptive statistics"):
     st.markdown("---")
     st.markdown("### **Statistiques descriptives**")
     st.markdown(r'''Les premières statistiques de nos variables sont révélatrices. On peut remarquer de prime abord
@@ -79,7 +83,7 @@ with st.container():
     st.write("La variable **«Patient age quantile»** ")
     st.write("")
     st.markdown("<span style=\"color:red\">**Statistiques descriptives du dataset**</span>", unsafe_allow_html=True)
-    st.dataframe(df.describe())
+    st.dataframe(ARTIFACTS.get("stats_store").describe())
     st.write("")
     st.write(r'''Les **«boxplots»** nous permettent de visualiser la granularité de chacune de nos variables. 
     Globalement, les variables suivent une distribution relativement symétrique. En effet, la ligne médiane est
@@ -102,7 +106,7 @@ with st.container():
                      )
     st.write(box_fig)
 
-with st.container():
+with st.container(), section("code"):
     st.markdown("---")
     st.markdown("### **Mon code Python**")
     code:str = '''
@@ -131,5 +135,4 @@ print(df.describe())
     '''
     st.code(code, language='Python')
 
-
-
+debug_panel()
@@ -0,0 +1,88 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from core import config
+from core.data import dataset_version, load_dataset
+from core.instrument import debug_panel, section, start_page
+from core.model import load_model, predict_batch
+
+# ------------------------ PAGE CONFIG ----------------------------------
+st.set_page_config(
+    page_title="Diagnostic",
+    page_icon='🇧🇷',
+    layout="wide"
+)
+start_page("diagnostic")
+st.title("Diagnostic")
+
+# ------------------------ DATA ----------------------------------
+with section("data"):
+    df = load_dataset()
+    try:
+        metadata = load_model()["metadata"]
+    except (FileNotFoundError, ValueError) as error:
+        st.error(f"Le modèle n'est pas disponible. {error}")
+        debug_panel()
+        st.stop()
+
+# ------------------------ CONTENT ----------------------------------
+with st.container(), section("model"):
+    st.markdown("---")
+    st.markdown("### **Le modèle**")
+    st.markdown("Le modèle prédit le résultat du test <span style=\"color:blue\">\"**_SARS-Cov-2 exam result_**\"</span> à partir "
+                "des variables conservées après épuration des valeurs manquantes (tests sanguins et tests viraux). Les variables "
+                "d'admission à l'hôpital sont écartées car elles ne sont pas connues au moment du test. Il s'agit d'un "
+                "**gradient boosting** qui gère nativement les valeurs manquantes, entraîné avec des poids qui compensent les "
+                "**classes deséquilibrées**.", unsafe_allow_html=True)
+    kpi1, kpi2, kpi3, kpi4 = st.columns(4)
+    kpi1.metric("Version", metadata["version"])
+    kpi2.metric("Recall", f"{metadata['metrics']['recall']:.2f}")
+    kpi3.metric("Score F1", f"{metadata['metrics']['f1']:.2f}")
+    kpi4.metric("ROC AUC", f"{metadata['metrics']['roc_auc']:.2f}")
+    st.caption(f"Entraîné le {metadata['trained_at']} sur {metadata['n_train']} des {metadata['n_patients']} individus, "
+               f"métriques mesurées sur les 20% restants, mis de côté.")
+
+with st.container(), section("upload"):
+    st.markdown("---")
+    st.markdown("### **Diagnostiquer des patients**")
+    st.markdown("Chargez un fichier **CSV** ou **xlsx** de résultats d'analyses ayant les mêmes colonnes que le dataset. Les "
+                "colonnes absentes sont considérées comme des valeurs manquantes.")
+    uploaded = st.file_uploader("Résultats d'analyses", type=["csv", "xlsx"])
+    if uploaded is not None:
+        patients = pd.read_csv(uploaded) if uploaded.name.endswith(".csv") else pd.read_excel(uploaded)
+        predictions = pd.concat([predict_batch(patients), patients], axis=1)
+        st.dataframe(predictions)
+        st.download_button("Télécharger les diagnostics", data=predictions.to_csv(index=False).encode('utf-8'),
+                           file_name="diagnostics.csv")
+
+with st.container(), section("sample"):
+    st.markdown("---")
+    st.markdown("### **Exemple sur le dataset**")
+    st.markdown("Les individus sont tirés parmi ceux mis de côté à l'entraînement : le modèle ne les a jamais vus.")
+    # rows are positions in the source: only meaningful for the source the model was trained on
+    same_source = dataset_version().split("+")[0] == metadata["dataset_version"].split("+")[0]
+    holdout = df[df.index.isin(metadata["holdout_rows"])] if same_source else df.iloc[:0]
+    if len(holdout) < 2:
+        st.info("Les individus mis de côté à l'entraînement ne sont pas dans ce dataset : réentraînez le modèle avec "
+                "`python -m core.model`.")
+    else:
+        n_patients = st.slider("Nombre d'individus tirés au hasard", 1, min(500, len(holdout)), min(100, len(holdout)))
+        sample = holdout.sample(n_patients, random_state=0)
+        predictions = predict_batch(sample)
+        predictions.insert(0, config.TARGET, sample[config.TARGET])
+        prediction_fig = px.histogram(predictions, x="probability", color=config.TARGET, nbins=20, barmode="overlay",
+                                      color_discrete_sequence=px.colors.qualitative.G10)
+        prediction_fig.update_layout(title_text='Probabilité prédite selon le résultat réel',  # center figure title
+                                     title_x=.5,
+                                     font_family="Courier New",
+                                     xaxis_title="probabilité d'un test positif",
+                                     yaxis_title="count",
+                                     font_color="black",
+                                     title_font_family="Arial",
+                                     title_font_color="red",  # title color
+                                     legend_title_font_color="green"  # legend color
+                                     )
+        st.write(prediction_fig)
+        st.dataframe(predictions)
+
+debug_panel()
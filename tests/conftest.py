@@ -0,0 +1,80 @@
+"""Fixtures of the tests: a small dataset with the layout of the real one.
+
+The ``dataset`` fixture writes it as an xlsx, points ``COVID_DATASET_PATH``
+and ``COVID_CACHE_DIR`` (through :mod:`core.config`) at a temporary directory
+and empties the per-version caches of the core modules, so that every test
+starts from a fresh snapshot.
+"""
+import functools
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import config
+
+N_PATIENTS:int = 240
+FLOAT_COLUMNS = ["Hematocrit", "Hemoglobin", "Platelets", "Leukocytes"]
+VIRAL_COLUMNS = ["Influenza A", "Rhinovirus/Enterovirus", "Coronavirus HKU1"]
+# columns of the contingency tables
+CATEGORICAL_COLUMNS = VIRAL_COLUMNS + list(config.ADMISSION_COLUMNS) + ["Patient age quantile"]
+
+
+def make_frame(n_rows:int = N_PATIENTS, seed:int = 0) -> pd.DataFrame:
+    """Patients in the layout of the dataset: an id, an age quantile, the target, admission flags, a viral
+    panel and blood tests, the panels done (or not) as a block."""
+    rng = np.random.default_rng(seed)
+    target = np.where(rng.random(n_rows) < .2, "positive", "negative")
+    blood = rng.random(n_rows) < .5
+    viral = rng.random(n_rows) < .6
+    df = pd.DataFrame({
+        config.PATIENT_ID: [f"{i:015x}" for i in range(n_rows)],
+        "Patient age quantile": rng.integers(0, 20, n_rows),
+        config.TARGET: target,
+    })
+    for j, column in enumerate(config.ADMISSION_COLUMNS):
+        df[column] = (rng.random(n_rows) < .1 / (j + 1)).astype(int)
+    for column in VIRAL_COLUMNS:
+        detected = rng.random(n_rows) < np.where(target == "positive", .1, .3)
+        df[column] = np.where(viral, np.where(detected, "detected", "not_detected"), None)
+    shift = np.where(target == "positive", -.4, 0.)
+    for column in FLOAT_COLUMNS:
+        values = rng.normal(shift, 1., n_rows)
+        # a few values missing inside the panel too
+        df[column] = np.where(blood & (rng.random(n_rows) < .95), values, np.nan)
+    return df
+
+
+def assert_same_table(table:pd.DataFrame, expected:pd.DataFrame) -> None:
+    """Same counts and levels, whatever the types of the levels (categorical columns of the snapshot)."""
+    assert list(table.index) == list(expected.index)
+    assert list(table.columns) == list(expected.columns)
+    assert (table.to_numpy() == expected.to_numpy()).all()
+
+
+def clear_caches() -> None:
+    """Empty the ``lru_cache`` of every function of the imported core modules."""
+    for name, module in list(sys.modules.items()):
+        if name.startswith("core.") and module is not None:
+            for value in vars(module).values():
+                if isinstance(value, functools._lru_cache_wrapper):
+                    value.cache_clear()
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+    return make_frame()
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch, frame) -> pd.DataFrame:
+    """Write ``frame`` as the configured dataset, with a fresh cache dir; return it as written."""
+    path = tmp_path / "dataset.xlsx"
+    frame.to_excel(path, index=False)
+    monkeypatch.setattr(config, "DATASET_PATH", str(path))
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(config, "OUT_OF_CORE", False)
+    clear_caches()
+    yield pd.read_excel(path)
+    clear_caches()
@@ -0,0 +1,108 @@
+import os
+
+import pandas as pd
+import pytest
+from scipy import stats
+
+from core import config
+from core.contingency import (FISHER_MIN_EXPECTED, CrosstabCube, EncodedCategoricals, artifact_dir, independence_tests,
+                              load_crosstab_cube, load_target_tables, merge_tables, target_tables)
+from core.data import dataset_version, load_dataset
+from tests.conftest import CATEGORICAL_COLUMNS as COLUMNS, assert_same_table, clear_caches, make_frame
+
+
+def test_target_tables_match_crosstab(frame):
+    tables = target_tables(frame, COLUMNS)
+    for column in COLUMNS:
+        assert_same_table(tables[column], pd.crosstab(frame[config.TARGET], frame[column]))
+
+
+def test_independence_tests_match_scipy(frame):
+    tables = target_tables(frame, COLUMNS)
+    results = independence_tests(tables, alpha=.01)
+    tests = set()
+    for column in COLUMNS:
+        observed = pd.crosstab(frame[config.TARGET], frame[column]).to_numpy()
+        chi2 = stats.chi2_contingency(observed)
+        row = results.loc[column]
+        if observed.shape == (2, 2) and chi2.expected_freq.min() < FISHER_MIN_EXPECTED:
+            expected = stats.fisher_exact(observed)
+            assert row["test"] == "fisher"
+        else:
+            expected = chi2
+            assert row["test"] == "chi2"
+            assert row["dof"] == chi2.dof
+            assert row["min_expected"] == pytest.approx(chi2.expected_freq.min())
+        assert row["statistic"] == pytest.approx(expected.statistic)
+        assert row["p_value"] == pytest.approx(expected.pvalue)
+        assert row["decision"] == ("reject H0" if expected.pvalue < .01 else "fail to reject H0")
+        tests.add(row["test"])
+    # both kinds of tests are covered
+    assert tests == {"chi2", "fisher"}
+
+
+def test_merged_tables_are_the_tables_of_all_the_rows(frame):
+    # the halves don't have the same levels
+    first, second = frame.iloc[:20], frame.iloc[20:]
+    merged = merge_tables(target_tables(first, COLUMNS), target_tables(second, COLUMNS))
+    for column, table in target_tables(frame, COLUMNS).items():
+        assert_same_table(merged[column], table)
+
+
+def test_persisted_tables(dataset):
+    tables = load_target_tables(COLUMNS)
+    df = load_dataset()
+    for column in COLUMNS:
+        assert_same_table(tables[column], pd.crosstab(df[config.TARGET], df[column]))
+    # read back from the cache dir by another process
+    clear_caches()
+    for column, table in load_target_tables(COLUMNS).items():
+        assert_same_table(table, tables[column])
+
+
+def test_tables_of_previous_versions_are_dropped(dataset):
+    load_target_tables(COLUMNS)
+    previous = artifact_dir(dataset_version())
+    make_frame(seed=1).to_excel(config.DATASET_PATH, index=False)
+    load_target_tables(COLUMNS)
+    assert not os.path.exists(previous)
+    assert os.listdir(os.path.dirname(previous)) == [os.path.basename(artifact_dir(dataset_version()))]
+
+
+def test_cube_tables_match_crosstab(frame):
+    cube = CrosstabCube.from_encoded(EncodedCategoricals.from_frame(frame, COLUMNS))
+    for x in COLUMNS:
+        for y in COLUMNS:
+            assert_same_table(cube.table(x, y), pd.crosstab(frame[x], frame[y]))
+
+
+def test_cramers_v(frame):
+    pairs = CrosstabCube.from_encoded(EncodedCategoricals.from_frame(frame, COLUMNS)).cramers_v()
+    assert len(pairs) == len(COLUMNS) * (len(COLUMNS) - 1) // 2
+    assert pairs["cramers_v"].is_monotonic_decreasing
+    for pair in pairs.itertuples():
+        observed = pd.crosstab(frame[pair.x], frame[pair.y]).to_numpy()
+        chi2 = stats.chi2_contingency(observed, correction=False).statistic
+        assert pair.cramers_v == pytest.approx((chi2 / (observed.sum() * (min(observed.shape) - 1))) ** .5)
+        assert pair.n == observed.sum()
+
+
+def test_merged_cube_is_the_cube_of_all_the_rows(frame):
+    first, second = (CrosstabCube.from_encoded(EncodedCategoricals.from_frame(part, COLUMNS))
+                     for part in (frame.iloc[:20], frame.iloc[20:]))
+    merged = first.merge(second)
+    for x in COLUMNS:
+        for y in COLUMNS:
+            assert_same_table(merged.table(x, y), pd.crosstab(frame[x], frame[y]))
+
+
+def test_persisted_cube(dataset, monkeypatch):
+    # several chunks, merged
+    monkeypatch.setattr(config, "CHUNK_ROWS", 50)
+    cube = load_crosstab_cube(COLUMNS)
+    df = load_dataset()
+    clear_caches()
+    for x in COLUMNS:
+        for y in COLUMNS:
+            assert_same_table(cube.table(x, y), pd.crosstab(df[x], df[y]))
+            assert_same_table(load_crosstab_cube(COLUMNS).table(x, y), cube.table(x, y))
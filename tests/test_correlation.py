@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import config
+from core.correlation import PEARSON, SPEARMAN, CoMoments, correlation, sampled_values, spearman
+from core.data import load_dataset
+from tests.conftest import FLOAT_COLUMNS
+
+
+@pytest.fixture
+def values(frame) -> pd.DataFrame:
+    # a column observed on the rows of another panel, and a constant one
+    return frame[FLOAT_COLUMNS].assign(
+        Urea=np.where(frame["Influenza A"].notna(), frame["Hematocrit"].fillna(0) ** 2, np.nan),
+        Constant=np.where(frame["Hematocrit"].notna(), 1., np.nan))
+
+
+@pytest.mark.parametrize("chunk_rows", [7, 1000])
+def test_pearson_matches_pandas(values, monkeypatch, chunk_rows):
+    monkeypatch.setattr(config, "CHUNK_ROWS", chunk_rows)
+    moments = CoMoments.from_frame(values)
+    pd.testing.assert_frame_equal(moments.pearson(), values.corr(), atol=1e-12)
+    pd.testing.assert_frame_equal(moments.pearson(min_periods=60), values.corr(min_periods=60), atol=1e-12)
+    present = values.notna().astype(int)
+    np.testing.assert_array_equal(moments.n, present.T @ present)
+
+
+def test_merged_comoments(values):
+    moments = CoMoments.from_frame(values.iloc[:10])
+    moments.merge(CoMoments.from_frame(values.iloc[10:]))
+    pd.testing.assert_frame_equal(moments.pearson(), values.corr(), atol=1e-12)
+
+
+def test_spearman_matches_pandas(values):
+    r = pd.DataFrame(spearman(values.to_numpy()), index=values.columns, columns=values.columns)
+    expected = values.corr(method="spearman").to_numpy(copy=True)
+    # pandas gives 1 on the diagonal of a constant column, where the correlation isn't defined
+    np.fill_diagonal(expected, np.where(values.nunique() > 1, 1., np.nan))
+    pd.testing.assert_frame_equal(r, pd.DataFrame(expected, index=values.columns, columns=values.columns), atol=1e-12)
+
+
+@pytest.mark.parametrize("out_of_core", [False, True])
+@pytest.mark.parametrize("method", [PEARSON, SPEARMAN])
+def test_correlation_of_the_dataset(dataset, monkeypatch, method, out_of_core):
+    monkeypatch.setattr(config, "OUT_OF_CORE", out_of_core)
+    monkeypatch.setattr(config, "CHUNK_ROWS", 50)
+    result = correlation(FLOAT_COLUMNS, method)
+    df = load_dataset()[FLOAT_COLUMNS].astype(np.float64)
+    assert not result.sampled
+    pd.testing.assert_frame_equal(result.r, df.corr(method).loc[result.r.index, result.r.columns], atol=1e-9)
+    present = df.notna().astype(int)
+    pd.testing.assert_frame_equal(result.n, (present.T @ present).loc[result.n.index, result.n.columns], check_dtype=False)
+    pairs = result.top_pairs(3, min_periods=1)
+    assert pairs["r"].abs().is_monotonic_decreasing
+    assert pairs["r"].abs().iloc[0] == pytest.approx(np.abs(np.triu(df.corr(method).to_numpy(), k=1)).max())
+
+
+def test_sampled_values(dataset, monkeypatch):
+    monkeypatch.setattr(config, "OUT_OF_CORE", True)
+    monkeypatch.setattr(config, "CHUNK_ROWS", 50)
+    sample, n_rows = sampled_values(FLOAT_COLUMNS, max_rows=100)
+    df = load_dataset()[FLOAT_COLUMNS].astype(np.float64)
+    assert n_rows == len(df) and sample.shape == (100, len(FLOAT_COLUMNS))
+    # rows of the dataset
+    rows = pd.DataFrame(sample, columns=FLOAT_COLUMNS).fillna(np.inf).apply(tuple, axis=1)
+    assert rows.isin(set(df.fillna(np.inf).apply(tuple, axis=1))).all()
+    assert len(sampled_values(FLOAT_COLUMNS, max_rows=1000)[0]) == len(df)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from core import config
+from core.data import load_dataset
+from core.distributions import HIST_BIN_SIZE, compute_distributions, load_distributions
+from core.stats_store import ALL, load_stats_store
+from tests.conftest import FLOAT_COLUMNS
+
+
+def groups_of(df):
+    """Values of each group of the distributions, as float64 like the engine."""
+    yield ALL, df
+    for label, part in df.groupby(config.TARGET, observed=True):
+        yield str(label), part
+
+
+def test_histograms_match_numpy(dataset):
+    distributions = load_distributions()
+    df = load_dataset()
+    assert distributions.columns == FLOAT_COLUMNS
+    for group, part in groups_of(df):
+        for column in FLOAT_COLUMNS:
+            values = part[column].dropna().to_numpy(dtype=np.float64)
+            low = distributions.lows[column]
+            n_bins = distributions.counts[column].shape[1]
+            counts, _ = np.histogram(values, low + np.arange(n_bins + 1) * HIST_BIN_SIZE)
+            np.testing.assert_array_equal(distributions.counts[column][distributions.groups.index(group)], counts)
+            assert distributions.count(column, group) == len(values)
+            centers, density = distributions.histogram(column, group)
+            assert (density * HIST_BIN_SIZE).sum() == pytest.approx(1.)
+            np.testing.assert_allclose(np.diff(centers), HIST_BIN_SIZE)
+
+
+def test_kde_matches_scipy(dataset):
+    distributions = load_distributions()
+    df = load_dataset()
+    for group, part in groups_of(df):
+        for column in FLOAT_COLUMNS:
+            x, y = distributions.kde(column, group)
+            expected = stats.gaussian_kde(part[column].dropna().to_numpy(dtype=np.float64))(x)
+            # binned on the grid: close to the exact estimate, relative to its peak
+            np.testing.assert_allclose(y, expected, atol=.005 * expected.max())
+
+
+def test_out_of_core_distributions_are_the_same(dataset, monkeypatch):
+    monkeypatch.setattr(config, "CHUNK_ROWS", 50)
+    in_memory = compute_distributions(FLOAT_COLUMNS, load_stats_store())
+    monkeypatch.setattr(config, "OUT_OF_CORE", True)
+    out_of_core = compute_distributions(FLOAT_COLUMNS, load_stats_store())
+    for column in FLOAT_COLUMNS:
+        np.testing.assert_array_equal(out_of_core.counts[column], in_memory.counts[column])
+    np.testing.assert_allclose(out_of_core.density, in_memory.density, rtol=1e-12)
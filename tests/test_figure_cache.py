@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+
+import plotly.graph_objects as go
+
+from core import config
+from core.figure_cache import builder_fingerprint, figure_cache
+
+
+def count_files(directory:str) -> int:
+    return sum(len(files) for _, _, files in os.walk(directory))
+
+
+def test_unchanged_builder_hits_the_cache(dataset):
+    builds = []
+
+    @figure_cache("test_bar")
+    def bar(column:str, color:str = "red") -> go.Figure:
+        builds.append(column)
+        return go.Figure(go.Bar(x=[1, 2], y=[3, 4], marker_color=color), layout=dict(title=column))
+
+    assert bar("Hematocrit").layout.title.text == "Hematocrit"
+    assert bar("Hematocrit").layout.title.text == "Hematocrit"
+    assert builds == ["Hematocrit"]
+    bar("Hematocrit", color="blue")
+    bar("Hemoglobin")
+    assert builds == ["Hematocrit", "Hematocrit", "Hemoglobin"]
+
+
+def test_changed_builder_misses_the_cache(dataset):
+    @figure_cache("test_bar")
+    def bar(column:str) -> go.Figure:
+        return go.Figure(go.Bar(x=[1, 2], y=[3, 4]), layout=dict(title="before"))
+
+    bar("Hematocrit")
+
+    # same kind, same arguments, another layout
+    @figure_cache("test_bar")
+    def bar(column:str) -> go.Figure:  # noqa: F811
+        return go.Figure(go.Bar(x=[1, 2], y=[3, 4]), layout=dict(title="after"))
+
+    assert bar("Hematocrit").layout.title.text == "after"
+
+    # same code, new version: the helpers it calls changed
+    builds = []
+
+    def build(column:str) -> go.Figure:
+        builds.append(column)
+        return go.Figure(layout=dict(title="after"))
+
+    figure_cache("test_bar")(build)("Hematocrit")
+    figure_cache("test_bar")(build)("Hematocrit")
+    figure_cache("test_bar", version=2)(build)("Hematocrit")
+    assert builds == ["Hematocrit", "Hematocrit"]
+    assert count_files(os.path.join(config.CACHE_DIR, "figures")) == 4
+
+
+def test_fingerprint_is_the_same_in_every_process():
+    # constants such as frozensets iterate in an order that depends on the hash seed
+    code = ("from core.figure_cache import builder_fingerprint\n"
+            "def build(column):\n"
+            "    return column in {'a', 'b', 'c', 'd'}\n"
+            "print(builder_fingerprint(build))")
+    fingerprints = {subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                   env={**os.environ, "PYTHONHASHSEED": str(seed)}).stdout for seed in range(4)}
+    assert len(fingerprints) == 1
+
+
+def test_fingerprint_ignores_the_position_of_the_builder():
+    def first(column:str) -> go.Figure:
+        return go.Figure(layout=dict(title=column))
+
+    def second(column:str) -> go.Figure:
+        return go.Figure(layout=dict(title=column))
+
+    assert builder_fingerprint(first) == builder_fingerprint(second) != builder_fingerprint(second, version=2)
@@ -0,0 +1,107 @@
+import collections
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from core import config, hypothesis
+from core.hypothesis import (BALANCED, FAIL_TO_REJECT, PERMUTATION, REJECT, balanced_ttest, cached_resampled_ttest,
+                             resampled_ttest, ttest_table)
+from tests.conftest import FLOAT_COLUMNS
+
+
+@pytest.fixture
+def groups(frame):
+    positive = frame[frame[config.TARGET] == "positive"]
+    negative = frame[frame[config.TARGET] == "negative"]
+    return positive, negative
+
+
+def test_ttest_table_matches_scipy(groups):
+    positive, negative = groups
+    results = ttest_table(negative, positive, FLOAT_COLUMNS, alpha=.01)
+    for column in FLOAT_COLUMNS:
+        a, b = negative[column].dropna(), positive[column].dropna()
+        expected = stats.ttest_ind(a, b)
+        row = results.loc[column]
+        assert (row["n_a"], row["n_b"]) == (len(a), len(b))
+        assert row["statistic"] == pytest.approx(expected.statistic, rel=1e-9)
+        assert row["p_value"] == pytest.approx(expected.pvalue, rel=1e-9)
+        assert row["decision"] == (REJECT if expected.pvalue < .01 else FAIL_TO_REJECT)
+        interval = expected.confidence_interval(.95)
+        assert (row["ci_low"], row["ci_high"]) == pytest.approx((interval.low, interval.high), rel=1e-9)
+        pooled = ((len(a) - 1) * a.var() + (len(b) - 1) * b.var()) / (len(a) + len(b) - 2)
+        assert row["cohen_d"] == pytest.approx((a.mean() - b.mean()) / np.sqrt(pooled), rel=1e-9)
+
+
+def test_ttest_table_without_values(groups):
+    positive, negative = groups
+    empty = negative.assign(Hematocrit=np.nan)
+    row = ttest_table(empty, positive, ["Hematocrit"]).loc["Hematocrit"]
+    assert row["n_a"] == 0 and np.isnan(row["p_value"])
+    assert row["decision"] == FAIL_TO_REJECT
+
+
+def test_balanced_ttest_is_the_procedure_of_the_page(groups):
+    positive, negative = groups
+    results = balanced_ttest(positive, negative, FLOAT_COLUMNS, random_state=0)
+    sample = negative.sample(positive.shape[0], random_state=0)
+    for column in FLOAT_COLUMNS:
+        expected = stats.ttest_ind(sample[column].dropna(), positive[column].dropna())
+        assert results.loc[column, "p_value"] == pytest.approx(expected.pvalue, rel=1e-9)
+        assert results.loc[column, "n_positive"] == positive[column].notna().sum()
+
+
+def test_resampled_draws_without_a_test_are_left_out(groups):
+    positive, negative = groups
+    # no value at all for a column, and a column known for two negative patients only
+    positive = positive.assign(Hematocrit=np.nan)
+    negative = negative.assign(Hematocrit=np.nan, Hemoglobin=np.where(np.arange(len(negative)) < 2, 1., np.nan))
+    summary, values = resampled_ttest(positive, negative, FLOAT_COLUMNS, mode=PERMUTATION, n_resamples=400, n_jobs=2)
+    assert summary.loc["Hematocrit", "n_resamples"] == 0
+    assert np.isnan(summary.loc["Hematocrit", "p_value"])
+    assert summary.loc["Hematocrit", "decision"] == FAIL_TO_REJECT
+    assert (summary["n_resamples"] == values.notna().sum()).all()
+    assert (summary.loc[["Hemoglobin", "Platelets", "Leukocytes"], "n_resamples"] == 400).all()
+
+    summary, values = resampled_ttest(positive, negative, FLOAT_COLUMNS, mode=BALANCED, n_resamples=400, n_jobs=2)
+    assert summary.loc["Hematocrit", "decision"] == FAIL_TO_REJECT
+    hemoglobin = values["Hemoglobin"].dropna()
+    assert 0 < len(hemoglobin) < 400
+    assert summary.loc["Hemoglobin", "reject_rate"] == pytest.approx((hemoglobin < .01).mean())
+
+
+def test_permutation_p_value(groups):
+    positive, negative = groups
+    summary, values = resampled_ttest(positive, negative, FLOAT_COLUMNS, mode=PERMUTATION, n_resamples=400, n_jobs=2)
+    observed = balanced_ttest(positive, negative, FLOAT_COLUMNS)["statistic"]
+    for column in FLOAT_COLUMNS:
+        exceed = (values[column].abs() >= abs(observed[column])).sum()
+        assert summary.loc[column, "p_value"] == pytest.approx((exceed + 1) / 401)
+        assert summary.loc[column, "p_value_low"] <= summary.loc[column, "p_value"] <= summary.loc[column, "p_value_high"]
+
+
+def test_cached_resampling_runs_once_per_version(groups, monkeypatch):
+    positive, negative = groups
+    monkeypatch.setattr(hypothesis, "_resampled", collections.OrderedDict())
+    calls = []
+
+    def counted(*args, **kwargs):
+        calls.append(kwargs)
+        return resampled_ttest(*args, **kwargs)
+    monkeypatch.setattr(hypothesis, "resampled_ttest", counted)
+    summary, values = cached_resampled_ttest("v1", positive, negative, FLOAT_COLUMNS, n_resamples=400, n_jobs=2)
+    again = cached_resampled_ttest("v1", positive, negative, FLOAT_COLUMNS, n_resamples=400, n_jobs=2)
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(again[0], summary)
+    # another version or other parameters are computed
+    cached_resampled_ttest("v2", positive, negative, FLOAT_COLUMNS, n_resamples=400, n_jobs=2)
+    cached_resampled_ttest("v1", positive, negative, FLOAT_COLUMNS, mode=PERMUTATION, n_resamples=400, n_jobs=2)
+    assert len(calls) == 3
+    # results cut short aren't kept
+    for _ in range(2):
+        partial = cached_resampled_ttest("v1", positive, negative, FLOAT_COLUMNS, n_resamples=4000, n_jobs=2,
+                                         max_seconds=0)
+        assert len(partial[1]) < 4000
+    assert len(calls) == 5
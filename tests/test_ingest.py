@@ -0,0 +1,132 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import config
+from core.contingency import load_crosstab_cube, load_target_tables, target_tables
+from core.data import dataset_version, load_dataset
+from core.ingest import ingest_batch, validate_batch
+from core.snapshot import (MANIFEST_NAME, archive_batches, batch_paths, ensure_snapshot, file_sha256, read_manifest,
+                           read_schema)
+from core.stats_store import StatsStore, load_stats_store
+from tests.conftest import CATEGORICAL_COLUMNS, FLOAT_COLUMNS, VIRAL_COLUMNS, assert_same_table, make_frame
+
+N_SOURCE:int = 180
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+    # the source holds the first patients, the others are appended
+    return make_frame().iloc[:N_SOURCE]
+
+
+@pytest.fixture
+def new_patients() -> pd.DataFrame:
+    return make_frame().iloc[N_SOURCE:].reset_index(drop=True)
+
+
+def validate(batch:pd.DataFrame) -> pd.DataFrame:
+    snapshot, _ = ensure_snapshot()
+    return validate_batch(batch, read_schema(snapshot), load_stats_store(), load_dataset()[config.PATIENT_ID])
+
+
+def test_valid_batch(dataset, new_patients):
+    # columns in another order, some of them missing, lab values as text
+    batch = new_patients[new_patients.columns[::-1]].drop(columns=["Leukocytes"])
+    batch["Hematocrit"] = batch["Hematocrit"].map(lambda value: value if np.isnan(value) else repr(value))
+    validated = validate(batch)
+    assert list(validated.columns) == list(dataset.columns)
+    assert validated["Leukocytes"].isna().all()
+    np.testing.assert_allclose(validated["Hematocrit"], new_patients["Hematocrit"])
+    assert validated["Influenza A"].tolist() == new_patients["Influenza A"].tolist()
+
+
+@pytest.mark.parametrize("change, message", [
+    (lambda batch: batch.assign(Unknown=1), "unknown columns"),
+    (lambda batch: batch.drop(columns=[config.PATIENT_ID]), "is required"),
+    (lambda batch: batch.assign(**{config.TARGET: np.where(batch.index == 0, None, batch[config.TARGET])}), "is required"),
+    (lambda batch: batch.assign(**{config.TARGET: "unknown"}), "unknown classes"),
+    (lambda batch: batch.assign(Hematocrit="high"), "must be numeric"),
+    (lambda batch: batch.assign(**{config.PATIENT_ID: batch[config.PATIENT_ID].iloc[0]}), "duplicated"),
+    (lambda batch: batch.assign(**{config.PATIENT_ID: make_frame()[config.PATIENT_ID].iloc[:len(batch)]}),
+     "already in the dataset"),
+])
+def test_invalid_batches_are_rejected(dataset, new_patients, change, message):
+    with pytest.raises(ValueError, match=message):
+        validate(change(new_patients))
+
+
+def test_appended_batches_are_chained_in_the_manifest(dataset, new_patients):
+    versions = [dataset_version()]
+    for part in (new_patients.iloc[:20], new_patients.iloc[20:]):
+        result = ingest_batch(part.reset_index(drop=True))
+        assert result["previous_version"] == versions[-1]
+        versions.append(result["version"])
+    assert len(set(versions)) == 3
+    manifest = read_manifest()
+    chain = ""
+    for entry, path in zip(manifest["batches"], batch_paths(manifest)):
+        assert file_sha256(path) == entry["sha256"]
+        chain = hashlib.sha256((chain + entry["sha256"]).encode()).hexdigest()
+        assert entry["chain"] == chain
+    assert [entry["rows"] for entry in manifest["batches"]] == [20, len(new_patients) - 20]
+    assert dataset_version().endswith(chain[:8])
+
+
+def test_ingested_artifacts_match_a_rebuild(dataset, new_patients):
+    # built for the source, then carried over by the ingestion
+    load_target_tables(CATEGORICAL_COLUMNS)
+    load_crosstab_cube(CATEGORICAL_COLUMNS)
+    for part in (new_patients.iloc[:20], new_patients.iloc[20:]):
+        result = ingest_batch(part.reset_index(drop=True))
+        assert result["contingency_artifacts"] == 2
+    df = load_dataset()
+    # rows numbered after the source, in the order they were appended
+    assert sorted(df.index) == list(range(N_SOURCE + len(new_patients)))
+    everyone = make_frame()
+    assert df.sort_index()[config.PATIENT_ID].tolist() == everyone[config.PATIENT_ID].tolist()
+    np.testing.assert_allclose(df.sort_index()[FLOAT_COLUMNS].to_numpy(dtype=np.float64),
+                               everyone[FLOAT_COLUMNS].to_numpy(), rtol=1e-6)
+
+    store, rebuilt = load_stats_store(), StatsStore.from_frame(df)
+    assert store.n_rows == rebuilt.n_rows == len(df)
+    for group in rebuilt.groups:
+        pd.testing.assert_frame_equal(store.describe(group), rebuilt.describe(group), rtol=1e-9)
+    for column in CATEGORICAL_COLUMNS + [config.TARGET]:
+        assert store.value_counts(column).to_dict() == rebuilt.value_counts(column).to_dict()
+
+    tables, cube = load_target_tables(CATEGORICAL_COLUMNS), load_crosstab_cube(CATEGORICAL_COLUMNS)
+    for column, table in target_tables(df, CATEGORICAL_COLUMNS).items():
+        assert_same_table(tables[column], table)
+    for x in CATEGORICAL_COLUMNS:
+        for y in VIRAL_COLUMNS:
+            assert_same_table(cube.table(x, y), pd.crosstab(df[x], df[y]))
+    # only the artifacts of the current version are kept
+    assert len(os.listdir(os.path.join(config.CACHE_DIR, "contingency"))) == 1
+    assert len(os.listdir(os.path.join(config.CACHE_DIR, "stats"))) == 1
+
+
+def test_batches_of_a_replaced_source_are_rejected(dataset, new_patients):
+    _, base = ensure_snapshot()
+    ingest_batch(new_patients.iloc[:20].reset_index(drop=True))
+    assert read_manifest()["base"] == base
+    # a larger source: the rows of the batch were numbered after the previous one
+    replaced = make_frame(300, seed=1)
+    replaced.to_excel(config.DATASET_PATH, index=False)
+    with pytest.raises(ValueError, match="appended to the snapshot"):
+        load_dataset()
+    with pytest.raises(ValueError, match="appended to the snapshot"):
+        ingest_batch(new_patients.iloc[20:].reset_index(drop=True))
+    archive = archive_batches()
+    assert os.path.exists(os.path.join(archive, MANIFEST_NAME))
+    df = load_dataset()
+    assert sorted(df.index) == list(range(len(replaced)))
+    assert df.sort_index()[config.PATIENT_ID].tolist() == replaced[config.PATIENT_ID].tolist()
+    # new batches are appended to the new source
+    ingest_batch(new_patients.iloc[20:].assign(**{config.PATIENT_ID: lambda batch: "new-" + batch[config.PATIENT_ID]})
+                 .reset_index(drop=True))
+    assert len(load_dataset()) == len(replaced) + len(new_patients) - 20
+    assert read_manifest()["base"] == ensure_snapshot()[1] != base
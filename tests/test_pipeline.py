@@ -0,0 +1,118 @@
+import collections
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import config, pipeline
+from core.artifacts import ARTIFACTS
+from core.pipeline import MAX_ENTRIES_PER_NODE, Pipeline, fingerprint
+
+# descendants of cleaned_columns, cleaned_df and the column lists
+CLEANED_NODES = {"cleaned_columns", "cleaned_df", "classes", "positive", "negative", "viral_rate_columns",
+                 "blood_tests_columns", "numeric_columns", "categorical_columns"}
+
+
+@pytest.fixture
+def chain():
+    """``numbers`` (source, ``chain.data`` versioned by ``chain.version``) -> ``kept`` (threshold) -> ``total``."""
+    chain = Pipeline({"threshold": 2})
+    chain.data, chain.version = [1, 2, 3, 4], "v1"
+
+    @chain.source(version=lambda: chain.version)
+    def numbers():
+        return list(chain.data)
+
+    @chain.node(deps=("numbers",), params=("threshold",))
+    def kept(numbers, threshold):
+        return [number for number in numbers if number > threshold]
+
+    @chain.node(deps=("kept",))
+    def total(kept):
+        return sum(kept)
+
+    return chain
+
+
+def recomputed(artifacts:Pipeline, names, **params) -> set:
+    before = artifacts.computed.copy()
+    artifacts.resolve(names, **params)
+    return {name for name, count in artifacts.computed.items() if count > before[name]}
+
+
+def test_fingerprint():
+    frame = pd.DataFrame({"a": [1., 2.], "b": ["x", "y"]})
+    assert fingerprint(frame, "key") == fingerprint(frame.copy(), "other key")
+    assert fingerprint(frame.astype({"a": "float32"}), "key") != fingerprint(frame, "key")
+    assert fingerprint(frame["a"], "key") != fingerprint(frame["a"].rename("c"), "key")
+    assert fingerprint(["a", "b"], "key") == fingerprint(("a", "b"), "other key") != fingerprint(["b", "a"], "key")
+    # large values are identified by the key they were computed from
+    large = pd.DataFrame(np.zeros((pipeline.FINGERPRINT_MAX_CELLS + 1, 1)))
+    assert fingerprint(large, "key") == "key"
+    assert fingerprint({"a": 1}, "key") == "key"
+
+
+def test_unchanged_inputs_are_cache_hits(chain):
+    assert chain.resolve(["kept", "total"]) == ([3, 4], 7)
+    assert recomputed(chain, ["kept", "total"]) == set()
+    assert recomputed(chain, ["total"], threshold=2) == set()
+    assert dict(chain.computed) == {"numbers": 1, "kept": 1, "total": 1}
+
+
+def test_only_the_nodes_downstream_of_a_change_are_recomputed(chain):
+    chain.get("total")
+    assert recomputed(chain, ["total"], threshold=3) == {"kept", "total"}
+    assert chain.get("total", threshold=3) == 4
+    # same list kept: the dependents of kept are cache hits
+    assert recomputed(chain, ["total"], threshold=2.5) == {"kept"}
+    # a new version of the source recomputes the whole chain
+    chain.data, chain.version = [1, 2, 3, 5], "v2"
+    assert recomputed(chain, ["total"]) == {"numbers", "kept", "total"}
+    assert chain.get("total") == 8
+    # unless its content is the same
+    chain.version = "v3"
+    assert recomputed(chain, ["total"]) == {"numbers"}
+
+
+def test_least_recently_used_values_are_evicted(chain):
+    for threshold in range(MAX_ENTRIES_PER_NODE):
+        chain.get("kept", threshold=threshold)
+    assert chain.computed["kept"] == MAX_ENTRIES_PER_NODE
+    # threshold 0 is used again: 1 is now the least recently used
+    assert recomputed(chain, ["kept"], threshold=0) == set()
+    assert recomputed(chain, ["kept"], threshold=MAX_ENTRIES_PER_NODE) == {"kept"}
+    assert recomputed(chain, ["kept"], threshold=0) == set()
+    assert recomputed(chain, ["kept"], threshold=2) == set()
+    assert recomputed(chain, ["kept"], threshold=1) == {"kept"}
+    assert len(chain._keys["kept"]) == MAX_ENTRIES_PER_NODE
+
+
+def test_unknown_parameters_are_rejected(chain):
+    with pytest.raises(ValueError, match="unknown parameters"):
+        chain.get("total", cutoff=1)
+    with pytest.raises(ValueError, match="unknown dependencies"):
+        chain.node(deps=("missing",))(lambda missing: missing)
+
+
+@pytest.fixture
+def artifacts(dataset, monkeypatch) -> Pipeline:
+    """The artifacts of the pages, without the values memoized for another dataset."""
+    monkeypatch.setattr(ARTIFACTS, "_memo", {})
+    monkeypatch.setattr(ARTIFACTS, "_keys", collections.defaultdict(collections.OrderedDict))
+    return ARTIFACTS
+
+
+def test_nan_rate_cutoff_recomputes_the_cleaned_dataset_only(artifacts, dataset):
+    names = list(artifacts.nodes)
+    artifacts.resolve(names)
+    assert recomputed(artifacts, names) == set()
+    # the lab values (about half NaN) are dropped from the cleaned dataset
+    assert recomputed(artifacts, names, nan_rate_cutoff=.45) == CLEANED_NODES
+    assert "Hematocrit" not in artifacts.get("cleaned_df", nan_rate_cutoff=.45)
+    assert "Hematocrit" in artifacts.get("cleaned_df")
+    # the same columns for another cutoff: only the list is recomputed
+    assert recomputed(artifacts, names, nan_rate_cutoff=.95) == {"cleaned_columns"}
+    assert recomputed(artifacts, names, nan_rate_cutoff=config.NAN_RATE_CUTOFF) == set()
+    pd.testing.assert_frame_equal(artifacts.get("positive"),
+                                  dataset[dataset[config.TARGET] == "positive"].drop(columns=config.PATIENT_ID),
+                                  check_dtype=False, check_categorical=False)
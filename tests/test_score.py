@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from core import config
+from core.data import load_dataset
+from core.model import predict_batch, save_model, train
+from core.profile import DatasetProfile
+from core.score import output_schema, score_file
+
+
+@pytest.fixture
+def model_path(dataset, tmp_path):
+    df = load_dataset()
+    return save_model(train(df, DatasetProfile.from_frame(df)), str(tmp_path / "model.joblib"))
+
+
+@pytest.mark.parametrize("extension", [".csv", ".parquet"])
+def test_predictions_keep_the_order_of_the_input(dataset, model_path, tmp_path, extension):
+    # patients in an order of their own, scored in many chunks on several workers
+    patients = dataset.sample(frac=1, random_state=0).reset_index(drop=True)
+    source, output = str(tmp_path / f"patients{extension}"), str(tmp_path / f"predictions{extension}")
+    if extension == ".csv":
+        patients.to_csv(source, index=False)
+    else:
+        patients.to_parquet(source, index=False)
+    assert score_file(source, output, chunksize=17, n_jobs=3, model_path=model_path) == len(patients)
+    predictions = pd.read_csv(output) if extension == ".csv" else pd.read_parquet(output)
+    assert predictions[config.PATIENT_ID].tolist() == patients[config.PATIENT_ID].tolist()
+    expected = predict_batch(patients, model_path)
+    np.testing.assert_allclose(predictions["probability"].to_numpy(), expected["probability"].to_numpy(), rtol=1e-12)
+    assert predictions["prediction"].tolist() == expected["prediction"].tolist()
+
+
+@pytest.mark.parametrize("extension", [".csv", ".parquet"])
+def test_empty_input_gives_an_empty_output(dataset, model_path, tmp_path, extension):
+    source, output = str(tmp_path / f"patients{extension}"), str(tmp_path / f"predictions{extension}")
+    if extension == ".csv":
+        dataset.iloc[:0].to_csv(source, index=False)
+    else:
+        # typed as in a file of patients, not the null columns of an empty frame
+        pq.write_table(pa.Table.from_pandas(dataset, preserve_index=False).slice(0, 0), source)
+    assert score_file(source, output, n_jobs=2, model_path=model_path) == 0
+    predictions = pd.read_csv(output) if extension == ".csv" else pd.read_parquet(output)
+    assert list(predictions.columns) == [config.PATIENT_ID, "probability", "prediction"]
+    assert predictions.empty
+    if extension == ".parquet":
+        # the schema of the predictions of a non empty input
+        patients = str(tmp_path / "patients_1.parquet")
+        dataset.iloc[:5].to_parquet(patients, index=False)
+        score_file(patients, str(tmp_path / "predictions_1.parquet"), n_jobs=2, model_path=model_path)
+        expected = pq.read_schema(str(tmp_path / "predictions_1.parquet"))
+        assert pq.read_schema(output).remove_metadata() == expected.remove_metadata() == output_schema(source, config.PATIENT_ID)
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from core import config, snapshot
+from core.snapshot import ROW_COLUMN, ensure_snapshot, iter_chunks, open_dataset, open_snapshot, to_frame
+from tests.conftest import FLOAT_COLUMNS, make_frame
+
+
+def assert_same_values(df:pd.DataFrame, source:pd.DataFrame) -> None:
+    """Values of the snapshot frame ``df`` are those of ``source``, floats up to their float32 rounding."""
+    assert list(df.columns) == list(source.columns)
+    for column in source.columns:
+        if column in FLOAT_COLUMNS:
+            np.testing.assert_allclose(df[column].to_numpy(dtype=np.float64), source[column].to_numpy(), rtol=1e-6)
+        else:
+            expected = source[column].astype(object).where(source[column].notna(), None)
+            actual = df[column].astype(object).where(df[column].notna(), None)
+            assert actual.tolist() == expected.tolist(), column
+
+
+def test_snapshot_keeps_the_source_order(dataset):
+    path, _ = ensure_snapshot()
+    df = open_snapshot(path)
+    # grouped by target, the index restores the order of the source
+    assert df[config.TARGET].astype(str).is_monotonic_increasing
+    assert sorted(df.index) == list(range(len(dataset)))
+    assert_same_values(df.sort_index(), dataset)
+
+
+def test_snapshot_is_built_once(dataset):
+    path, version = ensure_snapshot()
+    built = os.stat(path).st_mtime_ns
+    # touched but not modified: the content hash decides
+    os.utime(config.DATASET_PATH)
+    assert ensure_snapshot() == (path, version)
+    assert os.stat(path).st_mtime_ns == built
+
+
+def test_snapshot_is_rebuilt_when_the_source_changes(dataset):
+    _, version = ensure_snapshot()
+    changed = make_frame(seed=1)
+    changed.to_excel(config.DATASET_PATH, index=False)
+    path, new_version = ensure_snapshot()
+    assert new_version != version
+    assert_same_values(open_snapshot(path).sort_index(), pd.read_excel(config.DATASET_PATH))
+
+
+def test_snapshot_is_rebuilt_when_the_schema_version_changes(dataset, monkeypatch):
+    path, version = ensure_snapshot()
+    monkeypatch.setattr(snapshot, "SCHEMA_VERSION", snapshot.SCHEMA_VERSION + 1)
+    _, new_version = ensure_snapshot()
+    assert new_version == f"{snapshot.SCHEMA_VERSION}-{version.split('-', 1)[1]}"
+    assert snapshot.read_metadata(path)["schema_version"] == str(snapshot.SCHEMA_VERSION)
+
+
+def test_chunks_are_slices_of_the_dataset(dataset):
+    path, _ = ensure_snapshot()
+    df = open_dataset(path, [])
+    chunks = list(iter_chunks(path, [], ["Hematocrit", config.TARGET], chunk_rows=37))
+    assert [chunk.num_rows for chunk in chunks] == [37] * (len(df) // 37) + [len(df) % 37]
+    assert all(chunk.schema.names == ["Hematocrit", config.TARGET, ROW_COLUMN] for chunk in chunks)
+    pd.testing.assert_frame_equal(to_frame(pa.concat_tables(chunks)), df[["Hematocrit", config.TARGET]])
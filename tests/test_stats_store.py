@@ -0,0 +1,66 @@
+import os
+
+import pandas as pd
+import pytest
+
+from core import config
+from core.data import dataset_version, load_dataset
+from core.stats_store import ALL, StatsStore, load_stats_store, store_path
+from tests.conftest import CATEGORICAL_COLUMNS, FLOAT_COLUMNS, make_frame
+
+COUNTED = CATEGORICAL_COLUMNS + [config.TARGET]
+
+
+def assert_describes(store:StatsStore, df:pd.DataFrame, rtol:float = 1e-9) -> None:
+    """``describe()`` of the store for all the patients and each class, against pandas."""
+    parts = [(ALL, df)] + list(df.groupby(config.TARGET, observed=True))
+    for group, part in parts:
+        expected = part.describe()
+        pd.testing.assert_frame_equal(store.describe(group, list(expected.columns)), expected, rtol=rtol)
+
+
+def test_describe_matches_pandas(frame):
+    store = StatsStore.from_frame(frame)
+    assert store.numeric_columns == list(frame.describe().columns)
+    assert_describes(store, frame)
+
+
+def test_value_counts_match_pandas(frame):
+    store = StatsStore.from_frame(frame)
+    for column in COUNTED:
+        pd.testing.assert_series_equal(store.value_counts(column).sort_index(), frame[column].value_counts().sort_index(),
+                                       check_names=False, check_index_type=False)
+    assert store.class_counts() == frame[config.TARGET].value_counts().to_dict()
+    # the values of the float columns and the patient IDs aren't counted
+    for column in FLOAT_COLUMNS + [config.PATIENT_ID]:
+        with pytest.raises(ValueError):
+            store.value_counts(column)
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 50, 1000])
+def test_chunks_fold_into_the_same_store(frame, monkeypatch, chunk_rows):
+    monkeypatch.setattr(config, "CHUNK_ROWS", chunk_rows)
+    store = StatsStore.from_frame(frame)
+    assert store.n_rows == len(frame)
+    assert_describes(store, frame)
+
+
+def test_merged_stores_are_the_store_of_all_the_rows(frame):
+    store = StatsStore.from_frame(frame.iloc[:100])
+    store.merge(StatsStore.from_frame(frame.iloc[100:]))
+    assert store.n_rows == len(frame)
+    assert_describes(store, frame)
+    for column in COUNTED:
+        assert store.value_counts(column).to_dict() == frame[column].value_counts().to_dict()
+
+
+def test_persisted_store(dataset):
+    store = load_stats_store()
+    df = load_dataset()
+    # pandas sums the float32 values of the snapshot in float32, the store in float64
+    assert_describes(store, df, rtol=1e-6)
+    assert os.path.exists(store_path(dataset_version()))
+    # stores of the previous versions are dropped
+    make_frame(seed=1).to_excel(config.DATASET_PATH, index=False)
+    load_stats_store()
+    assert os.listdir(os.path.dirname(store_path(dataset_version()))) == [os.path.basename(store_path(dataset_version()))]